@@ -0,0 +1,267 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import asyncpg
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.coalesce import clear_all as clear_micro_caches
+from app.config import (REAL_DATABASE_URL, CACHE_BACKEND, CACHE_MAXSIZE, CACHE_TTL, CACHE_REDIS_URL,
+                        FACETS_CACHE_TTL)
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'book_cache'
+# pg_notify принимает payload меньше 8000 байт, большие наборы id сбрасывают кеш целиком
+MAX_NOTIFY_IDS = 150
+ALL = '*'
+# payload-ы инвалидаций транзакции в session.info, их сбрасываем еще раз после commit
+PENDING_EVICTIONS = 'pending_evictions'
+
+
+class LRUCache:
+    """in-process LRU cache with TTL, every gunicorn worker has its own"""
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.stats['misses'] += 1
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def get_generation(self, name: str) -> int:
+        return self._generations.get(name, 0)
+
+    async def bump_generation(self, name: str):
+        # записи старого поколения больше не читаются и уходят по LRU
+        self._generations[name] = self._generations.get(name, 0) + 1
+
+    def info(self) -> Dict:
+        return {'backend': 'memory', 'size': len(self._data), 'maxsize': self.maxsize,
+                'ttl': self.ttl, **self.stats}
+
+
+class RedisCache:
+    """cache shared by all workers, needs redis package: pip install redis"""
+
+    def __init__(self, url: str = CACHE_REDIS_URL, ttl: float = CACHE_TTL, prefix: str = 'library:'):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis требует пакет redis: pip install redis')
+        self._redis = aioredis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._redis.get(self.prefix + key)
+        if value is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self._redis.set(self.prefix + key, json.dumps(value), px=int((ttl or self.ttl) * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*(self.prefix + key for key in keys))
+
+    async def get_generation(self, name: str) -> int:
+        return int(await self._redis.get(f'{self.prefix}gen:{name}') or 0)
+
+    async def bump_generation(self, name: str):
+        await self._redis.incr(f'{self.prefix}gen:{name}')
+
+    def info(self) -> Dict:
+        return {'backend': 'redis', 'ttl': self.ttl, **self.stats}
+
+
+class BookCache:
+    """
+    read-through cache of single books and of list queries.
+    writes send pg_notify in their transaction, so every worker drops stale entries
+    right after commit (see listen_invalidations)
+    """
+
+    def __init__(self, backend: LRUCache | RedisCache | None):
+        self.backend = backend
+        # растет на каждой инвалидации, значение прочитанное до нее в кеш не кладем
+        self._version = 0
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def _book_key(self, book_id) -> str:
+        return f"book:{await self.backend.get_generation('books')}:{book_id}"
+
+    async def _list_key(self, params: Dict) -> str:
+        signature = json.dumps(params, sort_keys=True, default=str)
+        return f"books:{await self.backend.get_generation('lists')}:{signature}"
+
+    async def _read_through(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await self.backend.get(key)
+        if value is not None:
+            return value
+        version = self._version
+        value = await loader()
+        if version == self._version:
+            await self.backend.set(key, value)
+        return value
+
+    async def book(self, book_id, loader: Callable[[], Awaitable[Dict]]) -> Dict:
+        if not self.enabled:
+            return await loader()
+        return await self._read_through(await self._book_key(book_id), loader)
+
+    async def books(self, params: Dict, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await loader()
+        return await self._read_through(await self._list_key(params), loader)
+
+    async def aggregates(self, name: str, filters: Dict, loader: Callable[[], Awaitable[Any]],
+                         ttl: float = FACETS_CACHE_TTL) -> Any:
+        """
+        count or facets of filters: key has no generation, so writes do not drop them
+        and they are stale at most for ttl seconds
+        """
+        if not self.enabled:
+            return await loader()
+        key = f"{name}:{json.dumps(filters, sort_keys=True, default=str)}"
+        value = await self.backend.get(key)
+        if value is None:
+            value = await loader()
+            await self.backend.set(key, value, ttl=ttl)
+        return value
+
+    async def evict(self, payload: str):
+        """drops books from payload of notification and all cached lists"""
+        if not self.enabled:
+            return
+        self._version += 1
+        self.backend.stats['invalidations'] += 1
+        if payload == ALL:
+            await self.backend.bump_generation('books')
+        elif payload:
+            await self.backend.delete(*[await self._book_key(book_id) for book_id in payload.split(',')])
+        await self.backend.bump_generation('lists')
+        clear_micro_caches()
+
+    async def invalidate(self, session: AsyncSession, book_ids: Iterable = ()):
+        """
+        call inside write transaction: postgres delivers notification only after commit
+        and drops it on rollback
+        """
+        if not self.enabled:
+            # без кеша остальные воркеры не узнают о записи, их micro cache живет до ttl,
+            # а свой сбрасываем после commit: до него запрос прочитал бы и закешировал старое
+            self._evict_after_commit(session, ALL)
+            return
+        book_ids = [str(book_id) for book_id in book_ids]
+        payload = ALL if len(book_ids) > MAX_NOTIFY_IDS else ','.join(book_ids)
+        await session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                              {'channel': INVALIDATION_CHANNEL, 'payload': payload})
+        await self.evict(payload)
+        self._evict_after_commit(session, payload)
+
+    def _evict_after_commit(self, session: AsyncSession, payload: str):
+        """
+        until commit other requests read old rows and can put them back to cache, so payload
+        is evicted once more right after commit of session. NOTIFY comes later and does not
+        come at all while LISTEN connection is reconnecting
+        """
+        if not event.contains(session.sync_session, 'after_commit', self._on_commit):
+            event.listen(session.sync_session, 'after_commit', self._on_commit)
+        session.info.setdefault(PENDING_EVICTIONS, []).append(payload)
+
+    def _on_commit(self, sync_session):
+        payloads = sync_session.info.pop(PENDING_EVICTIONS, [])
+        if not self.enabled:
+            clear_micro_caches()
+            return
+        # событие синхронное, но приходит в потоке event loop
+        for payload in dict.fromkeys(payloads):
+            task = asyncio.get_running_loop().create_task(self.evict(payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def info(self) -> Dict:
+        return self.backend.info() if self.enabled else {'backend': 'none'}
+
+
+def _make_backend():
+    if CACHE_BACKEND == 'memory':
+        return LRUCache()
+    if CACHE_BACKEND == 'redis':
+        return RedisCache()
+    return None
+
+
+book_cache = BookCache(_make_backend())
+
+
+async def listen_invalidations(reconnect_delay: float = 1.0):
+    """
+    keeps LISTEN connection of this worker. while it is down notifications are lost,
+    so cache is dropped entirely after every reconnect
+    """
+    dsn = REAL_DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+
+    tasks = set()
+
+    def on_notify(connection, pid, channel, payload):
+        task = asyncio.create_task(book_cache.evict(payload))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(INVALIDATION_CHANNEL, on_notify)
+            await book_cache.evict(ALL)
+            try:
+                await closed.wait()
+            finally:
+                await connection.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warning('cache invalidation listener failed: %s', ex)
+        await asyncio.sleep(reconnect_delay)
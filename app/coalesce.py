@@ -0,0 +1,117 @@
+"""
+single flight and micro cache of hot read routes, in every worker: concurrent identical requests
+share one call of loader, and with ttl its result is served for ttl seconds and then, while
+it is refreshed in background, for `stale` more seconds. writes drop micro cache together
+with cache of books (see BookCache.evict)
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.metrics import COALESCE_REQUESTS
+from app.config import COALESCE_MAXSIZE
+
+
+class Coalescer:
+    """one per route, route is label of metrics"""
+
+    def __init__(self, route: str, enabled: bool = True, ttl: float = 0.0, stale: float = 0.0,
+                 maxsize: int = COALESCE_MAXSIZE):
+        self.route = route
+        self.enabled = enabled
+        self.ttl = ttl
+        self.stale = stale
+        self.maxsize = maxsize
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # key -> [fresh_until, stale_until, value, hits]
+        self._entries: OrderedDict[str, list] = OrderedDict()
+        # растет на каждом сбросе, результат запроса начатого до него не кладем
+        self._generation = 0
+        self.stats = {'hit': 0, 'stale': 0, 'coalesced': 0, 'miss': 0}
+        COALESCERS.append(self)
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        COALESCE_REQUESTS.labels(self.route, outcome).inc()
+
+    async def get(self, params: Dict, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await loader()
+        key = json.dumps(params, sort_keys=True, default=str)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.monotonic()
+            if now < entry[1]:
+                entry[3] += 1
+                self._entries.move_to_end(key)
+                if now < entry[0]:
+                    self._count('hit')
+                else:
+                    # устаревшее отдаем сразу, а обновляет его один фоновый запрос
+                    self._count('stale')
+                    if key not in self._inflight:
+                        self._load(key, loader)
+                return entry[2]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count('coalesced')
+        else:
+            self._count('miss')
+            task = self._load(key, loader)
+        # отключившийся клиент не отменяет запрос, которого ждут остальные
+        return await asyncio.shield(task)
+
+    def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        generation = self._generation
+        inflight = self._inflight
+
+        async def run():
+            try:
+                value = await loader()
+            finally:
+                inflight.pop(key, None)
+            if self.ttl > 0 and generation == self._generation:
+                self._store(key, value)
+            return value
+
+        task = self._inflight[key] = asyncio.create_task(run())
+        # ошибку фонового обновления никто не ждет
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    def _store(self, key: str, value: Any):
+        now = time.monotonic()
+        hits = self._entries[key][3] if key in self._entries else 0
+        self._entries[key] = [now + self.ttl, now + self.ttl + self.stale, value, hits]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        # начатые до сброса запросы дорабатывают для своих клиентов, новые к ним не присоединяются
+        self._inflight = {}
+        self._generation += 1
+
+    def info(self, top: int = 10) -> Dict:
+        hot = sorted(self._entries.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        return {'route': self.route, 'enabled': self.enabled, 'ttl': self.ttl, 'stale_ttl': self.stale,
+                'size': len(self._entries), 'inflight': len(self._inflight), **self.stats,
+                'hot_keys': [{'key': key, 'hits': entry[3]} for key, entry in hot]}
+
+
+COALESCERS: List[Coalescer] = []
+
+
+def clear_all():
+    for coalescer in COALESCERS:
+        coalescer.clear()
+
+
+def coalesce_info() -> List[Dict]:
+    return [coalescer.info() for coalescer in COALESCERS]
@@ -19,10 +19,49 @@ REAL_DATABASE_URL = env.str(
     default=f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
 )
 
+# pool of every worker process: gunicorn workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) plus
+# LISTEN connection of cache per worker must fit into max_connections of postgres (100 by default).
+# DB_POOL_TIMEOUT is wait for free connection before error, DB_POOL_RECYCLE reopens old connections,
+# DB_STATEMENT_CACHE_SIZE is asyncpg prepared statements per connection.
+# pgbouncer in transaction mode gives server connection to other clients after every transaction,
+# cache size 0 alone is not enough there: asyncpg still prepares every query under names __asyncpg_stmt_N__,
+# which repeat across clients ("prepared statement already exists"). DB_PGBOUNCER=true turns off both caches
+# and gives statements unique names, set server_reset_query_always=1 in pgbouncer then, otherwise these
+# statements pile up on server connections. pgbouncer >= 1.21 with max_prepared_statements > 0 tracks
+# prepared statements itself, there DB_PGBOUNCER stays false and the cache works.
+# LISTEN of cache invalidation (CACHE_BACKEND) needs session mode or direct connection to postgres
+DB_POOL_SIZE = env.int('DB_POOL_SIZE', default=10)
+DB_MAX_OVERFLOW = env.int('DB_MAX_OVERFLOW', default=5)
+DB_POOL_TIMEOUT = env.float('DB_POOL_TIMEOUT', default=10.0)
+DB_POOL_RECYCLE = env.int('DB_POOL_RECYCLE', default=1800)
+DB_POOL_PRE_PING = env.bool('DB_POOL_PRE_PING', default=True)
+DB_STATEMENT_CACHE_SIZE = env.int('DB_STATEMENT_CACHE_SIZE', default=500)
+DB_PGBOUNCER = env.bool('DB_PGBOUNCER', default=False)
+
+# logging: json (one object per line, extra fields included) | text, statements slower than
+# SLOW_QUERY_MS are logged with warning
+LOG_LEVEL = env.str('LOG_LEVEL', default='INFO')
+LOG_FORMAT = env.str('LOG_FORMAT', default='json')
+SLOW_QUERY_MS = env.float('SLOW_QUERY_MS', default=500.0)
+
 # here limit years_publication
 MAX_DATA = date.today().year
 MIN_DATA = 300
 
+# text search configuration of queries to books.search_vector. migration 3f7d8e2a9c51 pins 'simple' for
+# the column itself, so other value needs new migration which recreates search_vector with it
+SEARCH_CONFIG = 'simple'
+
+# GET /books/?include=count,facets: planner estimate of matches at least COUNT_ESTIMATE_THRESHOLD is returned
+# as is instead of exact count, FACETS_TOP_K most frequent genres and authors, histograms of price and
+# publication_year by FACET_PRICE_STEP and FACET_YEAR_STEP. both are cached for FACETS_CACHE_TTL seconds
+# by filters and are not dropped by writes
+COUNT_ESTIMATE_THRESHOLD = env.int('COUNT_ESTIMATE_THRESHOLD', default=10_000)
+FACETS_TOP_K = env.int('FACETS_TOP_K', default=10)
+FACET_PRICE_STEP = env.int('FACET_PRICE_STEP', default=500)
+FACET_YEAR_STEP = env.int('FACET_YEAR_STEP', default=10)
+FACETS_CACHE_TTL = env.float('FACETS_CACHE_TTL', default=10.0)
+
 # url for loading books from other api
 LOAD_BOOKS_URL = os.environ.get("LOAD_BOOKS_URL")
 
@@ -35,4 +74,100 @@ COLUMNS = {
     'author': str | None,
     'description': str | None,
     'cover_image': str | None
-}
\ No newline at end of file
+}
+
+# streaming upload of books: rows in one chunk which is validated and flushed to db,
+# and how many invalid/duplicate rows are returned in report
+UPLOAD_CHUNK_SIZE = env.int('UPLOAD_CHUNK_SIZE', default=1000)
+UPLOAD_REPORT_LIMIT = env.int('UPLOAD_REPORT_LIMIT', default=100)
+
+# columnar validation of uploaded file (engine=pandas). off until benchmarks.columnar shows
+# the expected 10x of row by row path, it gives about 4x on csv of 1M rows now
+UPLOAD_COLUMNAR_ENABLED = env.bool('UPLOAD_COLUMNAR_ENABLED', default=False)
+
+# rows in one multi-row INSERT of load_data, asyncpg allows at most 32767 parameters in query
+LOAD_CHUNK_SIZE = env.int('LOAD_CHUNK_SIZE', default=2000)
+
+# fingerprint of book for duplicates of upload: sha256 of title normalized by unicode form ('' - none),
+# collapsed whitespace and lower case. migration 8c3f1a6d2e59 fills it for default settings,
+# after changing them fingerprints of existing books have to be recomputed
+FINGERPRINT_UNICODE_FORM = env.str('FINGERPRINT_UNICODE_FORM', default='NFKC')
+FINGERPRINT_COLLAPSE_SPACES = env.bool('FINGERPRINT_COLLAPSE_SPACES', default=True)
+FINGERPRINT_LOWERCASE = env.bool('FINGERPRINT_LOWERCASE', default=True)
+
+# cache of books: memory (LRU in every worker) | redis | none
+CACHE_BACKEND = env.str('CACHE_BACKEND', default='memory')
+CACHE_MAXSIZE = env.int('CACHE_MAXSIZE', default=10000)
+CACHE_TTL = env.float('CACHE_TTL', default=60.0)
+CACHE_REDIS_URL = env.str('CACHE_REDIS_URL', default='redis://localhost:6379/0')
+
+# request coalescing of hot read routes in every worker: concurrent identical requests share one query
+# (*_COALESCE=false - off). list of books is also kept in memory for BOOKS_LIST_MICROCACHE_TTL seconds
+# (0 - off) and BOOKS_LIST_MICROCACHE_STALE more seconds while it is refreshed in background.
+# single book is only coalesced: its ETag has to follow writes at once
+BOOKS_LIST_COALESCE = env.bool('BOOKS_LIST_COALESCE', default=True)
+BOOKS_LIST_MICROCACHE_TTL = env.float('BOOKS_LIST_MICROCACHE_TTL', default=0.5)
+BOOKS_LIST_MICROCACHE_STALE = env.float('BOOKS_LIST_MICROCACHE_STALE', default=2.0)
+BOOK_COALESCE = env.bool('BOOK_COALESCE', default=True)
+COALESCE_MAXSIZE = env.int('COALESCE_MAXSIZE', default=1000)
+
+# bulk repricing: max items in one request and rows in one UPDATE ... FROM (VALUES ...)
+BULK_PRICE_MAX_ITEMS = env.int('BULK_PRICE_MAX_ITEMS', default=100_000)
+PRICE_CHUNK_SIZE = env.int('PRICE_CHUNK_SIZE', default=10_000)
+
+# GET /books/batch: max ids in one request, they are read by one WHERE id = ANY(:ids) query
+BATCH_GET_MAX_IDS = env.int('BATCH_GET_MAX_IDS', default=100)
+
+# import from LOAD_BOOKS_URL. IMPORT_PAGE_SIZE = 0 means source returns all books in one response,
+# otherwise pages are requested as ?IMPORT_PAGE_PARAM=n&IMPORT_LIMIT_PARAM=size until a short page
+IMPORT_PAGE_SIZE = env.int('IMPORT_PAGE_SIZE', default=0)
+IMPORT_PAGE_PARAM = env.str('IMPORT_PAGE_PARAM', default='page')
+IMPORT_LIMIT_PARAM = env.str('IMPORT_LIMIT_PARAM', default='limit')
+IMPORT_CONCURRENCY = env.int('IMPORT_CONCURRENCY', default=4)
+IMPORT_RETRIES = env.int('IMPORT_RETRIES', default=3)
+IMPORT_BACKOFF = env.float('IMPORT_BACKOFF', default=0.5)
+IMPORT_TIMEOUT = env.float('IMPORT_TIMEOUT', default=30.0)
+HTTP_MAX_CONNECTIONS = env.int('HTTP_MAX_CONNECTIONS', default=20)
+
+# background jobs: JOB_WORKERS jobs at once in every web worker (0 - jobs run only in python -m app.worker),
+# running job without heartbeat for JOB_STALE_AFTER seconds is taken again by another worker.
+# file of upload job is stored in database by JOB_PAYLOAD_CHUNK_SIZE bytes, so any worker can run the job
+JOB_WORKERS = env.int('JOB_WORKERS', default=1)
+JOB_POLL_INTERVAL = env.float('JOB_POLL_INTERVAL', default=1.0)
+JOB_HEARTBEAT_INTERVAL = env.float('JOB_HEARTBEAT_INTERVAL', default=10.0)
+JOB_STALE_AFTER = env.float('JOB_STALE_AFTER', default=60.0)
+JOB_MAX_ATTEMPTS = env.int('JOB_MAX_ATTEMPTS', default=3)
+JOB_PAYLOAD_CHUNK_SIZE = env.int('JOB_PAYLOAD_CHUNK_SIZE', default=1024 * 1024)
+
+# export: rows fetched from server side cursor and written to response at once
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=5000)
+# updated_at/created_at is time of start of writing transaction, row becomes visible on commit, so it can
+# appear with time older than since of the previous export. export with since goes back by
+# EXPORT_SINCE_OVERLAP seconds, it has to be longer than the longest writing transaction (upload of big file)
+EXPORT_SINCE_OVERLAP = env.float('EXPORT_SINCE_OVERLAP', default=300.0)
+
+# validation of uploaded rows in process pool of every worker: VALIDATION_WORKERS processes (0 - in event loop),
+# lists shorter than VALIDATION_PARALLEL_MIN are validated in place, longer ones by VALIDATION_BATCH_SIZE batches
+VALIDATION_WORKERS = env.int('VALIDATION_WORKERS', default=2)
+VALIDATION_PARALLEL_MIN = env.int('VALIDATION_PARALLEL_MIN', default=500)
+VALIDATION_BATCH_SIZE = env.int('VALIDATION_BATCH_SIZE', default=5000)
+
+# archived books: bulk archive/unarchive changes ARCHIVE_BATCH_SIZE books per transaction.
+# purge job deletes books archived more than PURGE_AFTER_DAYS ago with their price history,
+# PURGE_BATCH_SIZE books per transaction and PURGE_PAUSE seconds between batches, so locks are short.
+# every PURGE_EVERY hours purge job is queued, unless there was one during this time (0 - only by POST /jobs/purge)
+ARCHIVE_BATCH_SIZE = env.int('ARCHIVE_BATCH_SIZE', default=1000)
+PURGE_AFTER_DAYS = env.int('PURGE_AFTER_DAYS', default=30)
+PURGE_BATCH_SIZE = env.int('PURGE_BATCH_SIZE', default=500)
+PURGE_PAUSE = env.float('PURGE_PAUSE', default=0.1)
+PURGE_EVERY = env.float('PURGE_EVERY', default=24.0)
+
+# price_history is partitioned by month: history maintenance job keeps PRICE_HISTORY_PARTITIONS_AHEAD months
+# of partitions ahead and compacts partitions older than PRICE_HISTORY_RETENTION_MONTHS into daily OHLC
+# of price_history_daily (0 - raw rows are kept forever). it is queued every PRICE_HISTORY_MAINTENANCE_EVERY hours
+# (0 - only by POST /jobs/history-maintenance). detaching of old partition locks whole price_history, so it waits
+# for lock at most PRICE_HISTORY_LOCK_TIMEOUT seconds, otherwise the partition is left to the next run
+PRICE_HISTORY_PARTITIONS_AHEAD = env.int('PRICE_HISTORY_PARTITIONS_AHEAD', default=3)
+PRICE_HISTORY_RETENTION_MONTHS = env.int('PRICE_HISTORY_RETENTION_MONTHS', default=12)
+PRICE_HISTORY_MAINTENANCE_EVERY = env.float('PRICE_HISTORY_MAINTENANCE_EVERY', default=24.0)
+PRICE_HISTORY_LOCK_TIMEOUT = env.float('PRICE_HISTORY_LOCK_TIMEOUT', default=2.0)
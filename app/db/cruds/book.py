@@ -1,18 +1,37 @@
-from typing import List, Text, Dict
+import logging
+from datetime import timedelta
+from typing import List, Text, Dict, Tuple
 from uuid import UUID
 
 from fastapi.responses import Response, JSONResponse
 from fastapi import HTTPException
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import (delete, select, update, func, literal_column, values, column, Integer, String, any_,
+                        bindparam, literal, null, true, union_all, or_)
+from sqlalchemy.dialects.postgresql import insert, UUID as UUID_TYPE, ARRAY
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.exc import IntegrityError, DataError, DBAPIError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import book_cache
 from app.db.models import Book, PriceHistory
-from app.dto.book import UpdateBook, InvalidBook, ShowBook
-from app.db.database import async_session_maker
-from app.config import MIN_DATA, MAX_DATA
+from app.db.ids import uuid7_many
+from app.db.fingerprint import book_fingerprint
+from app.dto.book import UpdateBook, InvalidBook, ConflictMode, BookOrder, ArchivedScope
+from app.db.database import async_session_maker, session_scope
+from app.metrics import instrument, stage
+from app.db.pagination import decode_cursor, keyset_page, split_page
+from app.db.cruds import price_history as history_crud
+from app.config import (MIN_DATA, MAX_DATA, LOAD_CHUNK_SIZE, SEARCH_CONFIG, PRICE_CHUNK_SIZE, ARCHIVE_BATCH_SIZE,
+                        PURGE_BATCH_SIZE, COUNT_ESTIMATE_THRESHOLD, FACETS_TOP_K, FACET_PRICE_STEP, FACET_YEAR_STEP)
 
 
+logger = logging.getLogger(__name__)
+
+
+@instrument()
 async def create_book(
         title: str,
         publication_year: int,
@@ -20,59 +39,62 @@ async def create_book(
         price: int | None = 0,
         author: str | None = None,
         description: Text | None = None,
-        cover_image: str | None = None
+        cover_image: str | None = None,
+        session: AsyncSession | None = None
 ) -> Book | Response:
     """
     func for create new book
     """
-    async with async_session_maker() as session:
-        async with session.begin():
-            try:
-                print(
-                    f"Trying to insert publication_year: {publication_year}, MIN_DATA: {MIN_DATA}, "
-                    f"MAX_DATA: {MAX_DATA}")
-
-                new_book = Book(title=title,
-                                publication_year=publication_year,
-                                genre=genre,
-                                author=author,
-                                price=price,
-                                description=description,
-                                cover_image=cover_image)
-                session.add(new_book)
-                await session.commit()
-                await session.flush()
-                return new_book
-            except (IntegrityError, DataError, TypeError, DBAPIError) as ex:
-                await session.rollback()
-                invalid_book = InvalidBook(title=title, publication_year=publication_year,
-                                           genre=genre, author=author, price=price,
-                                           description=description, cover_image=cover_image,
-                                           error=f'{str(ex)}').json()
-                raise HTTPException(detail={'invalid_book': invalid_book},
-                                    status_code=400)
-            except SQLAlchemyError as e:
-                await session.rollback()
-                raise e
+    async with session_scope(session) as session:
+        try:
+            logger.debug('create book', extra={'title': title, 'publication_year': publication_year,
+                                               'min_year': MIN_DATA, 'max_year': MAX_DATA})
 
-            except Exception as ex:
-                await session.rollback()
-                raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
-                                    status_code=500)
+            new_book = Book(title=title,
+                            publication_year=publication_year,
+                            genre=genre,
+                            author=author,
+                            price=price,
+                            description=description,
+                            cover_image=cover_image)
+            session.add(new_book)
+            await session.flush()
+            await book_cache.invalidate(session)
+            return new_book
+        except (IntegrityError, DataError, TypeError, DBAPIError) as ex:
+            await session.rollback()
+            invalid_book = InvalidBook(title=title, publication_year=publication_year,
+                                       genre=genre, author=author, price=price,
+                                       description=description, cover_image=cover_image,
+                                       error=f'{str(ex)}').json()
+            raise HTTPException(detail={'invalid_book': invalid_book},
+                                status_code=400)
+        except SQLAlchemyError as e:
+            await session.rollback()
+            raise e
+
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
 
 
+@instrument()
 async def delete_book(book_id: UUID) -> Response:
+    """archives book, it is deleted for good by purge job after PURGE_AFTER_DAYS"""
     async with async_session_maker() as session:
         async with session.begin():
             try:
                 stmt = (update(Book).where(Book.id == book_id)
-                        .values(archived=True)
+                        .values(archived=True, archived_at=func.coalesce(Book.archived_at, func.now()),
+                                version=Book.version + 1, updated_at=func.now())
                         .returning(Book.id))
                 deleted_id = await session.scalar(stmt)
 
                 if deleted_id:
+                    await book_cache.invalidate(session, [deleted_id])
                     await session.commit()
-                    return Response(content={
+                    return JSONResponse(content={
                         'message': f'Книга под №{deleted_id} заархивирована!'},
                         status_code=200)
 
@@ -80,6 +102,8 @@ async def delete_book(book_id: UUID) -> Response:
                 raise HTTPException(detail={
                     'message': f'Книги с id {book_id} не существует'},
                     status_code=404)
+            except HTTPException:
+                raise
             except SQLAlchemyError as e:
                 await session.rollback()
                 raise e
@@ -90,11 +114,14 @@ async def delete_book(book_id: UUID) -> Response:
                                     status_code=500)
 
 
-async def get_book(book_id: UUID) -> Book | Response:
+@instrument()
+async def get_book(book_id: UUID, include_archived: bool = False) -> Book | Response:
     async with async_session_maker() as session:
         async with session.begin():
             try:
                 query = select(Book).where(Book.id == book_id)
+                if not include_archived:
+                    query = query.where(~Book.archived)
                 row = await session.execute(query)
                 book_row = row.fetchone()
                 if book_row:
@@ -102,6 +129,8 @@ async def get_book(book_id: UUID) -> Book | Response:
                 raise HTTPException(detail={
                     'message': f'Книги с id {book_id} не существует'},
                     status_code=404)
+            except HTTPException:
+                raise
             except SQLAlchemyError as e:
                 await session.rollback()
                 raise e
@@ -110,98 +139,560 @@ async def get_book(book_id: UUID) -> Book | Response:
                                     status_code=500)
 
 
-async def update_book(book_id: UUID, update_book: UpdateBook) -> Dict | Response:
+# колонки BookDetail
+DETAIL_COLUMNS = (Book.id, Book.title, Book.publication_year, Book.author, Book.genre, Book.description,
+                  Book.cover_image, Book.price, Book.archived, Book.version, Book.created_at, Book.updated_at,
+                  Book.archived_at)
+
+
+@instrument()
+async def get_books_by_ids(book_ids: List[UUID], include_archived: bool = False) -> Dict[UUID, Dict]:
+    """books by one WHERE id = ANY(:ids) query, missing (or archived) ones are not in result"""
     async with async_session_maker() as session:
-        async with session.begin():
-            try:
-                query = select(Book).where(Book.id == book_id)
-                row = await session.execute(query)
-                book_row = row.fetchone()
-                if book_row:
-                    cur_book = book_row[0]
-                    price_flag = ((update_book.price is not None) and update_book.price != cur_book.price)
-                    book_data = update_book.model_dump(exclude_none=True, exclude_unset=True)
-                    for key, value in book_data.items():
-                        setattr(cur_book, key, value)
-                    await session.commit()
-                    return {'book': cur_book, 'flag': price_flag}
-                raise HTTPException(detail={
-                    'message': f'Книги с id {book_id} не существует'},
-                    status_code=404)
-            except SQLAlchemyError as e:
-                await session.rollback()
-                raise e
-            except Exception as ex:
-                await session.rollback()
-                raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
-                                    status_code=500)
+        try:
+            stmt = select(*DETAIL_COLUMNS).where(
+                Book.id == any_(bindparam('book_ids', list(book_ids), type_=ARRAY(UUID_TYPE(as_uuid=True)))))
+            if not include_archived:
+                stmt = stmt.where(~Book.archived)
+            # id строкой, как в _show_row: UUID asyncpg orjson не сериализует
+            return {row['id']: {**row, 'id': str(row['id'])} for row in (await session.execute(stmt)).mappings()}
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+# колонки ShowBook и версия, которые возвращает UPDATE ... RETURNING
+UPDATED_COLUMNS = (Book.id, Book.title, Book.publication_year, Book.author, Book.genre, Book.description,
+                   Book.cover_image, Book.price, Book.archived, Book.version)
+
+# сколько раз update_book повторяет пару запросов, если цену меняют одновременно с ним
+UPDATE_ATTEMPTS = 3
+
+
+def _update_stmt(book_id: UUID, values: Dict, expected_version: int | None = None,
+                 price: int | None = None, price_changed: bool = False):
+    """
+    one statement: UPDATE ... RETURNING, with price_changed only if price is distinct from new one
+    and then with history of new price in the same statement
+    """
+    # архивные книги не меняются, для них PATCH - 404 так же, как GET
+    conditions = [Book.id == book_id, ~Book.archived]
+    if expected_version is not None:
+        conditions.append(Book.version == expected_version)
+    if price is not None and price_changed:
+        conditions.append(Book.price.is_distinct_from(price))
+        values = {**values, 'price': price}
+    elif price is not None:
+        conditions.append(Book.price.is_not_distinct_from(price))
+
+    updated = (update(Book).where(*conditions)
+               .values(**values, version=Book.version + 1, updated_at=func.now())
+               .returning(*UPDATED_COLUMNS)
+               .cte('updated'))
+    stmt = select(updated)
+    if price_changed:
+        # время вставки, а не начала транзакции: одновременные изменения идут в истории в порядке записи
+        history = (insert(PriceHistory)
+                   .from_select(['id', 'book_id', 'price', 'created_at'],
+                                select(func.uuid_generate_v7(), updated.c.id, updated.c.price,
+                                       func.clock_timestamp()))
+                   .cte('history'))
+        stmt = stmt.add_cte(history)
+    return stmt
+
+
+@instrument(rows=lambda result: 1)
+async def update_book(book_id: UUID, update_book: UpdateBook, expected_version: int | None = None,
+                      session: AsyncSession | None = None) -> Dict:
+    """
+    patch without read before write. new price goes by UPDATE ... WHERE price IS DISTINCT FROM :price
+    with its history in the same statement, other fields (or the same price) by UPDATE ... WHERE
+    price IS NOT DISTINCT FROM :price, so history always matches the price which was written.
+    expected_version is version from If-Match, other version of book is 412.
+    returns row of book and flag whether price was changed
+    """
+    async with session_scope(session) as session:
+        try:
+            values = update_book.model_dump(exclude_none=True, exclude_unset=True)
+            price = values.pop('price', None)
+            if 'title' in values:
+                values['fingerprint'] = book_fingerprint(values['title'])
+
+            for _ in range(UPDATE_ATTEMPTS):
+                if price is not None:
+                    stmt = _update_stmt(book_id, values, expected_version, price, price_changed=True)
+                    row = (await session.execute(stmt)).mappings().first()
+                    if row is not None:
+                        await book_cache.invalidate(session, [book_id])
+                        return {'book': dict(row), 'flag': True}
+
+                stmt = _update_stmt(book_id, values, expected_version, price)
+                row = (await session.execute(stmt)).mappings().first()
+                if row is not None:
+                    await book_cache.invalidate(session, [book_id])
+                    return {'book': dict(row), 'flag': False}
+
+                # ни один UPDATE не подошел: книги нет, версия другая или цену только что поменяли
+                current = (await session.execute(
+                    select(Book.version, Book.price).where(Book.id == book_id, ~Book.archived))).first()
+                if current is None:
+                    raise HTTPException(detail={'message': f'Книги с id {book_id} не существует'},
+                                        status_code=404)
+                if expected_version is not None and current.version != expected_version:
+                    raise HTTPException(detail={'message': f'Книга изменилась, текущая версия {current.version}',
+                                                'version': current.version},
+                                        status_code=412)
+
+            raise HTTPException(detail={'message': 'Цену книги одновременно меняют другие запросы, повторите'},
+                                status_code=409)
+        except HTTPException:
+            raise
+        except SQLAlchemyError as e:
+            await session.rollback()
+            raise e
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+# title уникален, поэтому id в ключе сортировки нужен только для неуникальных колонок
+BOOK_ORDER_KEYS = {
+    BookOrder.created_at: (Book.created_at, Book.id),
+    BookOrder.title: (Book.title,),
+    BookOrder.publication_year: (Book.publication_year, Book.id),
+}
+
+
+def _ts_query(q: str):
+    return func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+
+
+def _show_row(row) -> Dict:
+    # то же, что ShowBook(**row).json(), строки из базы уже прошли ее ограничения и заново не валидируются
+    return {
+        'id': str(row['id']),
+        'title': row['title'],
+        'publication_year': row['publication_year'],
+        'genre': row['genre'],
+        'author': row['author'],
+        'description': row['description'],
+        'cover_image': row['cover_image'],
+        'price': row['price'],
+        'archived': row['archived']
+    }
 
 
+def apply_book_filters(stmt: Select, title: str = None, author: str = None, genres: str = None,
+                       price: int = None, description: str = None, genres_neq: str = None,
+                       q: str = None, archived: ArchivedScope = ArchivedScope.active) -> Select:
+    """applies search params of list of books to stmt"""
+    # условие NOT archived такое же, как у частичных индексов, иначе postgres их не выберет
+    if archived == ArchivedScope.active:
+        stmt = stmt.filter(~Book.archived)
+    elif archived == ArchivedScope.archived:
+        stmt = stmt.filter(Book.archived)
+    if title:
+        stmt = stmt.filter(Book.title == title)
+    if price:
+        stmt = stmt.filter(Book.price == price)
+    if author:
+        stmt = stmt.filter(Book.author == author)
+    if genres:
+        stmt = stmt.filter(Book.genre.contains(genres.split(',')))
+    if genres_neq:
+        stmt = stmt.filter(~(Book.genre.contains(genres_neq.split(','))))
+    if description:
+        stmt = stmt.filter(Book.description.ilike(f'%{description}%'))
+    if q:
+        stmt = stmt.filter(Book.search_vector.op('@@')(_ts_query(q)))
+    return stmt
+
+
+@instrument(rows=lambda result: len(result['books']) if isinstance(result, dict) else len(result))
 async def get_books(lim: int, offset: int, title: str = None,
                     author: str = None, genres: str = None, price: int = None,
-                    description: str = None, genres_neq: str = None
+                    description: str = None, genres_neq: str = None,
+                    cursor: str = None, order_by: BookOrder = BookOrder.created_at,
+                    q: str = None, archived: ArchivedScope = ArchivedScope.active
                     ):
+    """
+    without cursor returns page by offset, with cursor ('' for first page)
+    returns {'books': [...], 'next_cursor': ...} using keyset pagination.
+    q is full text search, results are ordered by rank and paginated by offset.
+    archived books are returned only with archived=all or archived=archived
+    """
     async with async_session_maker() as session:
         async with session.begin():
 
             try:
+                key_columns = BOOK_ORDER_KEYS[order_by]
                 stmt = select(Book.id, Book.title, Book.publication_year,
                               Book.author, Book.genre, Book.description,
-                              Book.cover_image, Book.price
-                              ).order_by(Book.id).limit(lim).offset(offset)
-                if title:
-                    stmt = stmt.filter(Book.title == title)
-                if price:
-                    stmt = stmt.filter(Book.price == price)
-                if author:
-                    stmt = stmt.filter(Book.author == author)
-                if genres:
-                    stmt = stmt.filter(Book.genre.contains(genres.split(',')))
-                if genres_neq:
-                    stmt = stmt.filter(~(Book.genre.contains(genres_neq.split(','))))
-                if description:
-                    stmt = stmt.filter(Book.description.ilike(f'%{description}%'))
-
-                res = await session.execute(stmt)
-                book_row = [ShowBook(**r).json() for r in res.mappings().all()]
+                              Book.cover_image, Book.price, Book.archived, Book.created_at
+                              )
+                stmt = apply_book_filters(stmt, title=title, author=author, genres=genres, price=price,
+                                          description=description, genres_neq=genres_neq, q=q, archived=archived)
+
+                order_columns = key_columns
+                if q:
+                    if cursor is not None:
+                        raise HTTPException(detail={'message': 'Поиск q работает только с offset пагинацией'},
+                                            status_code=400)
+                    order_columns = (func.ts_rank(Book.search_vector, _ts_query(q)).desc(), Book.id)
+
+                if cursor is not None:
+                    after = decode_cursor(cursor, order_by.value, key_columns) if cursor else None
+                    res = await session.execute(keyset_page(stmt, key_columns, after, lim))
+                    rows, next_cursor = split_page(res.mappings().all(), lim, order_by.value,
+                                                   [column.key for column in key_columns])
+                    return {'books': [_show_row(r) for r in rows], 'next_cursor': next_cursor}
+
+                res = await session.execute(stmt.order_by(*order_columns).limit(lim).offset(offset))
+                book_row = [_show_row(r) for r in res.mappings().all()]
 
                 if not book_row:
                     raise HTTPException(detail={'message': f'Нет книги с такими параметрами'},
                                         status_code=404)
                 return book_row
 
+            except HTTPException:
+                raise
             except Exception as ex:
                 await session.rollback()
                 raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
                                     status_code=500)
 
 
-async def load_data(load_data):
+class _Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of select, values of filters stay bound parameters of query"""
+    inherit_cache = False
+
+    def __init__(self, stmt: Select):
+        self.stmt = stmt
+
+
+@compiles(_Explain)
+def _compile_explain(element: _Explain, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.stmt, **kw)
+
+
+async def _estimate_rows(session: AsyncSession, stmt: Select) -> int:
+    """rows of stmt by planner statistics, EXPLAIN does not run the query"""
+    # без literal_binds: значения из запроса пользователя (":memo", обратный слеш) не попадают в текст SQL
+    plan = (await session.execute(_Explain(stmt))).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+@instrument(rows=lambda result: 1)
+async def count_books(filters: Dict, threshold: int = COUNT_ESTIMATE_THRESHOLD) -> Dict:
+    """
+    number of books which match filters of list of books. exact count of large result reads all
+    of it, so from threshold planner estimate is returned with estimated=True
+    """
     async with async_session_maker() as session:
-        async with session.begin():
+        try:
+            stmt = apply_book_filters(select(Book.id), **filters)
+            estimate = await _estimate_rows(session, stmt)
+            if estimate >= threshold:
+                return {'total': estimate, 'estimated': True}
+            total = await session.scalar(select(func.count()).select_from(stmt.subquery()))
+            return {'total': total, 'estimated': False}
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
 
-            duplicates = []
-            original = []
-            try:
-                stmt = select(Book.title)
-                res = await session.execute(stmt)
-                book_row = [r[0] for r in res.fetchall()]
-                for data in load_data:
-                    if data['title'] not in book_row:
-                        book = Book(**data)
-                        original.append(book)
-                        book_row.append(data['title'])
-                    else:
-                        duplicates.append(data)
 
-                session.add_all(original)
-                await session.commit()
+def _bucket(value, step: int):
+    # начало интервала гистограммы, floor и для отрицательных годов
+    return (func.floor(value / literal(float(step))) * step).cast(Integer)
+
+
+def _facets_stmt(filters: Dict, top_k: int, price_step: int, year_step: int):
+    """books are filtered once, every facet is (facet, value or bucket) group of one GROUP BY"""
+    filtered = apply_book_filters(select(Book.genre, Book.author, Book.price, Book.publication_year),
+                                  **filters).cte('filtered')
+    genres = func.unnest(filtered.c.genre).table_valued('value').render_derived().lateral('genres')
+    # имя фасета литералом в sql: у параметра в UNION postgres не всегда выводит тип.
+    # типы UNION выводятся попарно слева направо: без cast два первых NULL стали бы text
+    facet_values = union_all(
+        select(literal_column("'genre'").label('facet'), genres.c.value.label('value'),
+               null().cast(Integer).label('bucket'))
+        .select_from(filtered.join(genres, true())),
+        select(literal_column("'author'"), filtered.c.author, null()).where(filtered.c.author.is_not(None)),
+        select(literal_column("'price'"), null(), _bucket(filtered.c.price, price_step))
+        .where(filtered.c.price.is_not(None)),
+        select(literal_column("'publication_year'"), null(), _bucket(filtered.c.publication_year, year_step)),
+    ).cte('facet_values')
+    count = func.count()
+    grouped = (select(facet_values.c.facet, facet_values.c.value, facet_values.c.bucket, count.label('count'),
+                      func.row_number().over(partition_by=facet_values.c.facet,
+                                             order_by=(count.desc(), facet_values.c.value)).label('rank'))
+               .group_by(facet_values.c.facet, facet_values.c.value, facet_values.c.bucket)
+               .subquery())
+    stmt = (select(grouped.c.facet, grouped.c.value, grouped.c.bucket, grouped.c.count)
+            .where(or_(grouped.c.rank <= top_k, grouped.c.bucket.is_not(None)))
+            .order_by(grouped.c.facet, grouped.c.rank))
+    return stmt
+
+
+@instrument(rows=lambda facets: sum(len(values) for values in facets.values()))
+async def book_facets(filters: Dict, top_k: int = FACETS_TOP_K, price_step: int = FACET_PRICE_STEP,
+                      year_step: int = FACET_YEAR_STEP) -> Dict[str, List[Dict]]:
+    """top_k genres and authors and histograms of price and publication_year of books which match filters"""
+    async with async_session_maker() as session:
+        try:
+            rows = (await session.execute(_facets_stmt(filters, top_k, price_step, year_step))).all()
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+    facets = {'genre': [], 'author': [], 'price': [], 'publication_year': []}
+    steps = {'price': price_step, 'publication_year': year_step}
+    for facet, value, bucket, count in rows:
+        if bucket is None:
+            facets[facet].append({'value': value, 'count': count})
+        else:
+            facets[facet].append({'start': bucket, 'end': bucket + steps[facet], 'count': count})
+    for facet in steps:
+        facets[facet].sort(key=lambda item: item['start'])
+    return facets
+
+
+@instrument(rows=lambda count: count)
+async def set_archived(filters: Dict, archived: bool = True, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    archives (or unarchives) every book which matches filters of list of books.
+    every batch is its own short transaction, rows locked by other requests are skipped
+    and are left as they are. returns number of changed books
+    """
+    scope = ArchivedScope.active if archived else ArchivedScope.archived
+    batch = (apply_book_filters(select(Book.id), **filters, archived=scope)
+             .limit(batch_size)
+             .with_for_update(skip_locked=True))
+    stmt = (update(Book).where(Book.id.in_(batch.scalar_subquery()))
+            .values(archived=archived, archived_at=func.now() if archived else None,
+                    version=Book.version + 1, updated_at=func.now())
+            .returning(Book.id))
+    total = 0
+    while True:
+        async with async_session_maker() as session:
+            async with session.begin():
+                try:
+                    changed = list(await session.scalars(stmt))
+                    if changed:
+                        await book_cache.invalidate(session, changed)
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+                except Exception as ex:
+                    await session.rollback()
+                    raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                        status_code=500)
+        total += len(changed)
+        if len(changed) < batch_size:
+            return total
+
 
+@instrument(rows=lambda result: result['books'])
+async def purge_archived(older_than: timedelta, batch_size: int = PURGE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    one batch of purge: deletes up to batch_size books archived more than older_than ago with their price history
+    (price_stats is deleted by trigger and cascade). returns {'books': ..., 'history': ...},
+    fewer books than batch_size means nothing is left
+    """
+    async with async_session_maker() as session:
+        async with session.begin():
+            try:
+                # ix_books_archived_at, строки под запросами других транзакций ждут следующего запуска
+                ids = list(await session.scalars(
+                    select(Book.id).where(Book.archived, Book.archived_at < func.now() - older_than)
+                    .order_by(Book.archived_at).limit(batch_size).with_for_update(skip_locked=True)))
+                if not ids:
+                    return {'books': 0, 'history': 0}
+                history = await session.execute(delete(PriceHistory).where(PriceHistory.book_id.in_(ids)))
+                books = await session.execute(delete(Book).where(Book.id.in_(ids)))
+                await book_cache.invalidate(session, ids)
+                return {'books': books.rowcount, 'history': history.rowcount}
+            except SQLAlchemyError as e:
+                await session.rollback()
+                raise e
             except Exception as ex:
                 await session.rollback()
                 raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
                                     status_code=500)
-            finally:
-                await session.close()
 
-            return {'message': 'Data processed', 'valid_books': original, 'duplicate_books': duplicates}
+
+def _split_duplicates_in_batch(books: List[Dict]) -> Tuple[List[Tuple[str, Dict]], List[Dict]]:
+    """
+    repeats of one batch by fingerprint, the first book wins.
+    unique books are returned with their fingerprints
+    """
+    seen = set()
+    unique = []
+    duplicates = []
+    for book in books:
+        fingerprint = book_fingerprint(book['title'])
+        if fingerprint in seen:
+            duplicates.append(book)
+        else:
+            seen.add(fingerprint)
+            unique.append((fingerprint, book))
+    return unique, duplicates
+
+
+def _without_fingerprint(book: Dict) -> Dict:
+    return {key: value for key, value in book.items() if key != 'fingerprint'}
+
+
+def _chunks(books: List[Dict], size: int = LOAD_CHUNK_SIZE):
+    for i in range(0, len(books), size):
+        yield books[i:i + size]
+
+
+def _with_ids(books: List[Dict]) -> List[Dict]:
+    # id пачки одним вызовом и по возрастанию: вставки идут в правый край индекса books_pkey
+    return [{**book, 'id': book_id} for book_id, book in zip(uuid7_many(len(books)), books)]
+
+
+async def _insert_skip(session, books: List[Dict]) -> List[Dict]:
+    stmt = (insert(Book).values(_with_ids(books))
+            .on_conflict_do_nothing(index_elements=[Book.title])
+            .returning(Book.id, Book.title, Book.price))
+    res = await session.execute(stmt)
+    return [r._asdict() for r in res.fetchall()]
+
+
+async def _insert_update(session, books: List[Dict]) -> List[Dict]:
+    stmt = insert(Book).values(_with_ids(books))
+    # id существующей книги не меняется, новый id нужен только вставленным
+    updated_columns = {column: stmt.excluded[column] for column in books[0]
+                       if column not in ('id', 'title', 'fingerprint', 'archived')}
+    stmt = (stmt.on_conflict_do_update(index_elements=[Book.title],
+                                       set_={**updated_columns, 'version': Book.version + 1,
+                                             'updated_at': func.now()})
+            .returning(Book.id, Book.title, Book.price))
+    res = await session.execute(stmt)
+    return [r._asdict() for r in res.fetchall()]
+
+
+async def _existing_prices(session, titles: List[str]) -> Dict[str, int | None]:
+    res = await session.execute(select(Book.title, Book.price).where(Book.title.in_(titles)))
+    return {title: price for title, price in res.fetchall()}
+
+
+async def _existing_fingerprints(session, fingerprints: List[str]) -> Dict[str, str]:
+    """titles of books in db by fingerprint, one indexed = ANY(:fingerprints) query for chunk"""
+    stmt = select(Book.fingerprint, Book.title).where(
+        Book.fingerprint == any_(bindparam('fingerprints', fingerprints, type_=ARRAY(String))))
+    res = await session.execute(stmt)
+    return {fingerprint: title for fingerprint, title in res.fetchall()}
+
+
+@instrument(rows=lambda result: len(result['valid_books']) + len(result['updated_books']))
+async def load_data(load_data: List[Dict], on_conflict: ConflictMode = ConflictMode.skip,
+                    session: AsyncSession | None = None) -> Dict:
+    """
+    bulk insert of books, duplicates are repeated fingerprints of batch, books whose fingerprint
+    is already in db (see _existing_fingerprints) and books which db rejected by unique title.
+    skip - duplicates are not touched, update - books with the same title are overwritten,
+    report - nothing is written, only shows what would be loaded.
+    price_changes are (book_id, price) pairs which need new price history
+    """
+    async with session_scope(session) as session:
+        with stage('dedupe', rows=len(load_data)):
+            unique, duplicates = _split_duplicates_in_batch(load_data)
+        loaded = []
+        updated = []
+        price_changes = []
+        try:
+            for chunk in _chunks(unique):
+                with stage('insert', rows=len(chunk)):
+                    existing = await _existing_fingerprints(session, [fingerprint for fingerprint, _ in chunk])
+                    # при skip любая книга с тем же отпечатком повтор, иначе повтор только записанная
+                    # под другим названием, книгу с тем же названием обновляет или показывает on_conflict
+                    known = {fingerprint for fingerprint, book in chunk if fingerprint in existing
+                             and (on_conflict == ConflictMode.skip or existing[fingerprint] != book['title'])}
+                    duplicates.extend(book for fingerprint, book in chunk if fingerprint in known)
+                    chunk = [{**book, 'fingerprint': fingerprint} for fingerprint, book in chunk
+                             if fingerprint not in known]
+                    if not chunk:
+                        continue
+                    titles = [book['title'] for book in chunk]
+
+                    if on_conflict == ConflictMode.skip:
+                        rows = await _insert_skip(session, chunk)
+                        inserted_titles = {row['title'] for row in rows}
+                        loaded.extend(rows)
+                        duplicates.extend(_without_fingerprint(book) for book in chunk
+                                          if book['title'] not in inserted_titles)
+                        price_changes.extend((row['id'], row['price']) for row in rows)
+
+                    elif on_conflict == ConflictMode.update:
+                        old_prices = await _existing_prices(session, titles)
+                        for row in await _insert_update(session, chunk):
+                            if row['title'] not in old_prices:
+                                loaded.append(row)
+                                price_changes.append((row['id'], row['price']))
+                                continue
+                            updated.append(row)
+                            if old_prices[row['title']] != row['price']:
+                                price_changes.append((row['id'], row['price']))
+
+                    else:
+                        old_prices = await _existing_prices(session, titles)
+                        for book in chunk:
+                            target = duplicates if book['title'] in old_prices else loaded
+                            target.append(_without_fingerprint(book))
+
+            if on_conflict != ConflictMode.report and (loaded or updated):
+                await book_cache.invalidate(session, [book['id'] for book in updated])
+
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+        return {'message': 'Data processed', 'valid_books': loaded, 'updated_books': updated,
+                'duplicate_books': duplicates, 'price_changes': price_changes}
+
+
+@instrument(rows=lambda statuses: sum(status == 'updated' for status in statuses.values()))
+async def update_prices(prices: Dict[UUID, int], session: AsyncSession | None = None) -> Dict[UUID, str]:
+    """
+    set based repricing: UPDATE ... FROM (VALUES ...) touches only books whose price differs,
+    history is written for exactly these books. returns status of every book_id:
+    updated, unchanged or not_found (archived books too)
+    """
+    async with session_scope(session) as session:
+        try:
+            statuses = {}
+            changed_ids = []
+            for chunk in _chunks(list(prices.items()), PRICE_CHUNK_SIZE):
+                new_prices = (values(column('id', UUID_TYPE(as_uuid=True)), column('price', Integer),
+                                     name='new_prices')
+                              .data(chunk))
+                stmt = (update(Book)
+                        .where(Book.id == new_prices.c.id, ~Book.archived,
+                               Book.price.is_distinct_from(new_prices.c.price))
+                        .values(price=new_prices.c.price, version=Book.version + 1, updated_at=func.now())
+                        .returning(Book.id, Book.price))
+                changed = (await session.execute(stmt)).fetchall()
+                await history_crud.create_many_history(changed, session=session)
+
+                ids = [book_id for book_id, _ in chunk]
+                existing = set(await session.scalars(select(Book.id).where(Book.id.in_(ids), ~Book.archived)))
+                statuses.update({book_id: 'unchanged' if book_id in existing else 'not_found' for book_id in ids})
+                statuses.update({book_id: 'updated' for book_id, _ in changed})
+                changed_ids.extend(book_id for book_id, _ in changed)
+
+            if changed_ids:
+                await book_cache.invalidate(session, changed_ids)
+            return statuses
+        except SQLAlchemyError as e:
+            await session.rollback()
+            raise e
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
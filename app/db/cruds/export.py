@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List
+
+from sqlalchemy import select
+
+from app.db.models import Book, PriceHistory
+from app.db.database import async_session_maker
+from app.config import EXPORT_CHUNK_SIZE, EXPORT_SINCE_OVERLAP
+
+
+# выгружаемая сущность -> (колонки, колонка для since)
+EXPORTS = {
+    'books': ((Book.id, Book.title, Book.author, Book.publication_year, Book.genre, Book.description,
+               Book.cover_image, Book.price, Book.archived, Book.created_at, Book.updated_at),
+              Book.updated_at),
+    'price_history': ((PriceHistory.id, PriceHistory.book_id, PriceHistory.price, PriceHistory.created_at),
+                      PriceHistory.created_at),
+}
+
+
+def export_columns(entity: str) -> List[str]:
+    return [column.key for column in EXPORTS[entity][0]]
+
+
+async def stream_rows(entity: str, since: datetime | None = None,
+                      chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+    """
+    yields rows chunk by chunk from server side cursor, only one chunk is in memory.
+    the whole export reads one REPEATABLE READ snapshot, so rows written during export
+    are not half included. since is moved back by EXPORT_SINCE_OVERLAP: rows of the overlap
+    come again, in one snapshot every id is once and client upserts them by id
+    """
+    columns, since_column = EXPORTS[entity]
+    stmt = select(*columns)
+    if since is not None:
+        stmt = stmt.where(since_column > since - timedelta(seconds=EXPORT_SINCE_OVERLAP))
+
+    async with async_session_maker() as session:
+        await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
@@ -0,0 +1,46 @@
+from fastapi import HTTPException
+
+from sqlalchemy import delete, select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.models import ImportCheckpoint
+from app.db.database import session_scope
+from app.metrics import instrument
+
+
+@instrument(rows=lambda position: 1)
+async def get_checkpoint(source: str) -> int:
+    async with session_scope() as session:
+        try:
+            position = await session.scalar(
+                select(ImportCheckpoint.position).where(ImportCheckpoint.source == source))
+            return position or 0
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument()
+async def save_checkpoint(source: str, position: int):
+    async with session_scope() as session:
+        try:
+            stmt = insert(ImportCheckpoint).values(source=source, position=position)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ImportCheckpoint.source],
+                set_={'position': stmt.excluded.position, 'updated_at': func.now()})
+            await session.execute(stmt)
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument()
+async def delete_checkpoint(source: str):
+    async with session_scope() as session:
+        try:
+            await session.execute(delete(ImportCheckpoint).where(ImportCheckpoint.source == source))
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
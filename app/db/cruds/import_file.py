@@ -0,0 +1,36 @@
+from typing import Dict
+
+from fastapi import HTTPException
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.models import ImportFile
+from app.db.database import session_scope
+from app.metrics import instrument
+
+
+@instrument()
+async def get_import_file(digest: str, on_conflict: str) -> ImportFile | None:
+    async with session_scope() as session:
+        try:
+            return await session.get(ImportFile, (digest, on_conflict))
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument()
+async def save_import_file(digest: str, on_conflict: str, filename: str | None, report: Dict):
+    async with session_scope() as session:
+        try:
+            stmt = insert(ImportFile).values(digest=digest, on_conflict=on_conflict, filename=filename,
+                                             report=report)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ImportFile.digest, ImportFile.on_conflict],
+                set_={'filename': stmt.excluded.filename, 'report': stmt.excluded.report, 'updated_at': func.now()})
+            await session.execute(stmt)
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
@@ -0,0 +1,177 @@
+from datetime import timedelta
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+
+from sqlalchemy import select, update, delete, insert, func, or_, and_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ImportJob, ImportJobPayload
+from app.db.database import async_session_maker, session_scope
+from app.metrics import instrument
+from app.config import JOB_STALE_AFTER, JOB_MAX_ATTEMPTS
+
+
+def _stale():
+    # задача running без heartbeat дольше JOB_STALE_AFTER осталась от упавшего воркера
+    return and_(ImportJob.status == 'running',
+                ImportJob.heartbeat_at < func.now() - timedelta(seconds=JOB_STALE_AFTER))
+
+
+async def _delete_payload(session: AsyncSession, job_ids: List[UUID]):
+    if job_ids:
+        await session.execute(delete(ImportJobPayload).where(ImportJobPayload.job_id.in_(job_ids)))
+
+
+@instrument()
+async def create_job(kind: str, params: Dict, payload: Optional[AsyncIterator[bytes]] = None) -> ImportJob:
+    """payload is file of job by chunks, it is written in the same transaction as job"""
+    async with session_scope() as session:
+        try:
+            job = ImportJob(kind=kind, params=params, status='queued', progress={}, attempts=0)
+            session.add(job)
+            await session.flush()
+            if payload is not None:
+                seq = 0
+                async for data in payload:
+                    await session.execute(insert(ImportJobPayload).values(job_id=job.id, seq=seq, data=data))
+                    seq += 1
+            return job
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument(rows=lambda job: int(job is not None))
+async def schedule_job(kind: str, params: Dict, every: timedelta) -> Optional[ImportJob]:
+    """
+    creates job of kind unless one was created during last `every` or is still waiting or running.
+    schedulers of all workers call it at about the same time, so check and insert are done under
+    advisory lock of kind, the worker which did not get the lock skips its turn
+    """
+    async with session_scope() as session:
+        try:
+            # блокировка до конца транзакции: следующий воркер уже видит вставленную задачу
+            locked = await session.scalar(select(func.pg_try_advisory_xact_lock(func.hashtext(f'import_job:{kind}'))))
+            if not locked:
+                return None
+            recent = await session.scalar(select(exists().where(
+                ImportJob.kind == kind,
+                or_(ImportJob.created_at > func.now() - every, ImportJob.status.in_(('queued', 'running'))))))
+            if recent:
+                return None
+            job = ImportJob(kind=kind, params=params, status='queued', progress={}, attempts=0)
+            session.add(job)
+            await session.flush()
+            return job
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument()
+async def get_job(job_id: UUID) -> ImportJob:
+    async with session_scope() as session:
+        try:
+            job = await session.get(ImportJob, job_id)
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+        if job is None:
+            raise HTTPException(detail={'message': f'Задача с ID {job_id} не найдена'}, status_code=404)
+        return job
+
+
+async def iter_payload(job_id: UUID) -> AsyncIterator[bytes]:
+    """chunks of file of job in order from server side cursor, only one of them is in memory"""
+    async with async_session_maker() as session:
+        result = await session.stream(
+            select(ImportJobPayload.data).where(ImportJobPayload.job_id == job_id)
+            .order_by(ImportJobPayload.seq).execution_options(yield_per=1))
+        async for data in result.scalars():
+            yield data
+
+
+@instrument(rows=lambda job: int(job is not None))
+async def claim_job() -> Optional[Dict]:
+    """
+    takes the oldest queued or stale job, SKIP LOCKED lets every worker
+    take its own job without waiting for others. every claim gives job new lease,
+    progress and result are written only with it (see update_progress)
+    """
+    async with session_scope() as session:
+        # задачи, запущенные JOB_MAX_ATTEMPTS раз, больше не запускаем: и зависшие, и возвращенные в очередь
+        failed = await session.scalars(
+            update(ImportJob)
+            .where(or_(ImportJob.status == 'queued', _stale()), ImportJob.attempts >= JOB_MAX_ATTEMPTS)
+            .values(status='failed', error='Превышено число попыток', lease=None,
+                    finished_at=func.now(), updated_at=func.now())
+            .returning(ImportJob.id))
+        await _delete_payload(session, list(failed))
+
+        next_job = (
+            select(ImportJob.id)
+            .where(or_(ImportJob.status == 'queued', _stale()), ImportJob.attempts < JOB_MAX_ATTEMPTS)
+            .order_by(ImportJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        res = await session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == next_job)
+            .values(status='running', attempts=ImportJob.attempts + 1, lease=uuid4(),
+                    started_at=func.coalesce(ImportJob.started_at, func.now()),
+                    heartbeat_at=func.now(), updated_at=func.now())
+            .returning(ImportJob.id, ImportJob.kind, ImportJob.params, ImportJob.attempts, ImportJob.lease)
+        )
+        row = res.first()
+        return dict(row._mapping) if row else None
+
+
+def _leased(job_id: UUID, lease: UUID):
+    # задачу, которую забрал другой воркер, прежний уже не меняет
+    return and_(ImportJob.id == job_id, ImportJob.lease == lease)
+
+
+@instrument()
+async def update_progress(job_id: UUID, lease: UUID, progress: Optional[Dict] = None) -> bool:
+    """saves progress counters, every call is also heartbeat of job. False if job has other lease now"""
+    values = {'heartbeat_at': func.now(), 'updated_at': func.now()}
+    if progress is not None:
+        values['progress'] = progress
+    async with session_scope() as session:
+        updated = await session.scalar(
+            update(ImportJob).where(_leased(job_id, lease), ImportJob.status == 'running').values(**values)
+            .returning(ImportJob.id))
+        return updated is not None
+
+
+@instrument()
+async def finish_job(job_id: UUID, lease: UUID, result: Dict) -> bool:
+    """False if job has other lease now, its result is not written then"""
+    async with session_scope() as session:
+        updated = await session.scalar(
+            update(ImportJob).where(_leased(job_id, lease))
+            .values(status='done', result=result, error=None, finished_at=func.now(), updated_at=func.now())
+            .returning(ImportJob.id))
+        if updated is not None:
+            await _delete_payload(session, [job_id])
+        return updated is not None
+
+
+@instrument()
+async def fail_job(job_id: UUID, lease: UUID, error: str, retry: bool = False) -> bool:
+    """retry=True returns job to queue, e.g. when worker is stopped in the middle of it"""
+    values = {'status': 'queued'} if retry else {'status': 'failed', 'finished_at': func.now()}
+    async with session_scope() as session:
+        updated = await session.scalar(
+            update(ImportJob).where(_leased(job_id, lease))
+            .values(error=error, updated_at=func.now(), **values)
+            .returning(ImportJob.id))
+        if updated is not None and not retry:
+            await _delete_payload(session, [job_id])
+        return updated is not None
@@ -1,26 +1,39 @@
+import re
+from datetime import datetime
+from typing import Dict, List
 from uuid import UUID
 
 from fastapi import HTTPException, Response
 
-from sqlalchemy import delete, select
+from sqlalchemy import (delete, select, func, literal_column, literal, any_, bindparam, cast, table, column, text,
+                        union_all, BigInteger, Date, DateTime)
+from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by, insert, ARRAY, UUID as UUID_TYPE
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import PriceHistory
-from app.db.database import async_session_maker
+from app.db.models import PriceHistory, PriceHistoryDaily, PriceStats
+from app.db.ids import uuid7_many
+from app.dto.price_history import SeriesInterval
+from app.db.database import async_session_maker, session_scope
+from app.metrics import instrument, stage
+from app.config import PRICE_HISTORY_LOCK_TIMEOUT
+from app.db.pagination import decode_cursor, keyset_page, split_page
 
 
-async def create_history(book_id: UUID, price: int | None = 0):
-    async with async_session_maker() as session:
-        async with session.begin():
-            try:
-                new_history = PriceHistory(book_id=book_id, price=price)
-                session.add(new_history)
-                await session.commit()
-            except Exception as ex:
-                await session.rollback()
-                raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
-                                    status_code=500)
+@instrument()
+async def create_history(book_id: UUID, price: int | None = 0, session: AsyncSession | None = None):
+    async with session_scope(session) as session:
+        try:
+            new_history = PriceHistory(book_id=book_id, price=price)
+            session.add(new_history)
+            await session.flush()
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
 
 
+@instrument()
 async def delete_history_book(book_id: UUID):
     async with async_session_maker() as session:
         async with session.begin():
@@ -45,15 +58,75 @@ async def delete_history_book(book_id: UUID):
                                     status_code=500)
 
 
-async def get_history_book(book_id: UUID, lim: int, offset: int):
+def _in_range(stmt, date_from: datetime | None = None, date_to: datetime | None = None):
+    # [date_from, date_to) по индексу (book_id, created_at, id)
+    if date_from is not None:
+        stmt = stmt.where(PriceHistory.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(PriceHistory.created_at < date_to)
+    return stmt
+
+
+def _in_days(stmt, date_from: datetime | None = None, date_to: datetime | None = None):
+    # дни свернутых секций: день берется целиком, если диапазон начинается внутри него
+    if date_from is not None:
+        stmt = stmt.where(PriceHistoryDaily.day >= cast(date_from, Date))
+    if date_to is not None:
+        stmt = stmt.where(PriceHistoryDaily.day < date_to)
+    return stmt
+
+
+def _last_price():
+    return array_agg(aggregate_order_by(PriceHistory.price,
+                                        PriceHistory.created_at.desc(), PriceHistory.id.desc()))[1]
+
+
+def _first_price():
+    return array_agg(aggregate_order_by(PriceHistory.price, PriceHistory.created_at, PriceHistory.id))[1]
+
+
+# id дня свернутой секции в истории: его строк уже нет, а ключу keyset нужен не NULL
+COMPACTED_DAY_ID = UUID(int=0)
+
+
+def _history_stmt(book_id: UUID, date_from: datetime | None = None, date_to: datetime | None = None):
+    """
+    rows of price_history and before them days of compacted partitions from price_history_daily:
+    one row of close price of the day at its start with COMPACTED_DAY_ID
+    """
+    raw = _in_range(select(PriceHistory.id, PriceHistory.book_id, PriceHistory.price, PriceHistory.created_at)
+                    .where(PriceHistory.book_id == book_id), date_from, date_to)
+    daily = PriceHistoryDaily
+    rolled = _in_days(select(literal(COMPACTED_DAY_ID, UUID_TYPE(as_uuid=True)).label('id'), daily.book_id,
+                             daily.close.label('price'), cast(daily.day, DateTime).label('created_at'))
+                      .where(daily.book_id == book_id), date_from, date_to)
+    return union_all(rolled, raw).subquery('history')
+
+
+@instrument(rows=lambda result: len(result['history']) if isinstance(result, dict) else len(result))
+async def get_history_book(book_id: UUID, lim: int, offset: int, cursor: str = None,
+                           date_from: datetime | None = None, date_to: datetime | None = None):
+    """
+    without cursor returns page by offset, with cursor ('' for first page)
+    returns {'history': [...], 'next_cursor': ...} using keyset pagination.
+    days of compacted partitions come first, see _history_stmt
+    """
     async with async_session_maker() as session:
         async with session.begin():
 
             try:
-                stmt = select(PriceHistory.id, PriceHistory.book_id,
-                              PriceHistory.price, PriceHistory.updated_at
-                              ).where(PriceHistory.book_id == book_id
-                                      ).order_by(PriceHistory.updated_at).limit(lim).offset(offset)
+                history = _history_stmt(book_id, date_from, date_to)
+                key_columns = (history.c.created_at, history.c.id)
+                stmt = select(history)
+
+                if cursor is not None:
+                    after = decode_cursor(cursor, 'history', key_columns) if cursor else None
+                    res = await session.execute(keyset_page(stmt, key_columns, after, lim))
+                    rows, next_cursor = split_page(res.mappings().all(), lim, 'history',
+                                                   ['created_at', 'id'])
+                    return {'history': [dict(r) for r in rows], 'next_cursor': next_cursor}
+
+                stmt = stmt.order_by(*key_columns).limit(lim).offset(offset)
                 res = await session.execute(stmt)
                 history_row = [r._asdict() for r in res.fetchall()]
                 if not history_row:
@@ -61,24 +134,323 @@ async def get_history_book(book_id: UUID, lim: int, offset: int):
                         'message': f'История цен книги с id {book_id} не существует!'},
                         status_code=404)
                 return history_row
+            except HTTPException:
+                raise
             except Exception as ex:
                 await session.rollback()
                 raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
                                     status_code=500)
 
 
-async def create_many_history(books_data):
+@instrument(rows=lambda inserted: inserted)
+async def create_many_history(books_data, session: AsyncSession | None = None):
+    """books_data is list of (book_id, price), inserted by one bulk insert"""
+    async with session_scope(session) as session:
+        try:
+            if books_data:
+                with stage('history', rows=len(books_data)):
+                    rows = [{'id': history_id, 'book_id': book_id, 'price': price}
+                            for history_id, (book_id, price) in zip(uuid7_many(len(books_data)), books_data)]
+                    await session.execute(insert(PriceHistory), rows)
+            return len(books_data)
+        except Exception as ex:
+            await session.rollback()
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+def _stats_row(stats: PriceStats) -> Dict:
+    return {
+        'current_price': stats.current_price, 'min_price': stats.min_price,
+        'max_price': stats.max_price, 'avg_price': stats.price_sum / stats.change_count,
+        'change_count': stats.change_count, 'first_change_at': stats.first_change_at,
+        'last_change_at': stats.last_change_at,
+    }
+
+
+@instrument()
+async def get_price_stats_many(book_ids: List[UUID]) -> Dict[UUID, Dict]:
+    """ready rows of price_stats of many books by one query, books without history are missing"""
+    async with async_session_maker() as session:
+        try:
+            stmt = select(PriceStats).where(
+                PriceStats.book_id == any_(bindparam('book_ids', list(book_ids), type_=ARRAY(UUID_TYPE(as_uuid=True)))))
+            # book_id строкой, как id в book_crud.get_books_by_ids: UUID asyncpg orjson не сериализует
+            return {stats.book_id: {'book_id': str(stats.book_id), **_stats_row(stats)}
+                    for stats in await session.scalars(stmt)}
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+def _merge_stats(parts: List[Dict]) -> Dict | None:
+    # дни price_history_daily всегда раньше сырых строк, текущая цена - из последней непустой части
+    parts = sorted((part for part in parts if part['change_count']), key=lambda part: part['first_change_at'])
+    if not parts:
+        return None
+    change_count = sum(part['change_count'] for part in parts)
+    return {
+        'current_price': parts[-1]['current_price'],
+        'min_price': min(part['min_price'] for part in parts),
+        'max_price': max(part['max_price'] for part in parts),
+        'avg_price': sum(part['price_sum'] for part in parts) / change_count,
+        'change_count': change_count,
+        'first_change_at': parts[0]['first_change_at'],
+        'last_change_at': parts[-1]['last_change_at'],
+    }
+
+
+@instrument(rows=lambda stats: 1)
+async def get_price_stats(book_id: UUID, date_from: datetime | None = None,
+                          date_to: datetime | None = None) -> Dict:
+    """
+    without range reads ready row of price_stats (maintained by trigger),
+    with range aggregates rows of range and days of compacted partitions in it
+    (their changes are at start of the day)
+    """
+    async with async_session_maker() as session:
+        try:
+            if date_from is None and date_to is None:
+                stats = await session.get(PriceStats, book_id)
+                row = None if stats is None else _stats_row(stats)
+            else:
+                raw = _in_range(select(
+                    _last_price().label('current_price'),
+                    func.min(PriceHistory.price).label('min_price'),
+                    func.max(PriceHistory.price).label('max_price'),
+                    func.sum(PriceHistory.price).label('price_sum'),
+                    func.count().label('change_count'),
+                    func.min(PriceHistory.created_at).label('first_change_at'),
+                    func.max(PriceHistory.created_at).label('last_change_at'),
+                ).where(PriceHistory.book_id == book_id), date_from, date_to)
+                daily = PriceHistoryDaily
+                rolled = _in_days(select(
+                    array_agg(aggregate_order_by(daily.close, daily.day.desc()))[1].label('current_price'),
+                    func.min(daily.low).label('min_price'),
+                    func.max(daily.high).label('max_price'),
+                    cast(func.sum(daily.price_sum), BigInteger).label('price_sum'),
+                    func.coalesce(func.sum(daily.changes), 0).label('change_count'),
+                    cast(func.min(daily.day), DateTime).label('first_change_at'),
+                    cast(func.max(daily.day), DateTime).label('last_change_at'),
+                ).where(daily.book_id == book_id), date_from, date_to)
+                res = await session.execute(union_all(rolled, raw))
+                row = _merge_stats(res.mappings().all())
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+        if row is None:
+            raise HTTPException(detail={'message': f'История цен книги с id {book_id} не существует!'},
+                                status_code=404)
+        return {'book_id': book_id, **row}
+
+
+def _merge_bars(bars: List[Dict]) -> List[Dict]:
+    # неделя на границе свертки собирается из дней price_history_daily и сырых строк, дни всегда раньше
+    merged = []
+    for bar in bars:
+        if merged and merged[-1]['bucket'] == bar['bucket']:
+            last = merged[-1]
+            last.update(high=max(last['high'], bar['high']), low=min(last['low'], bar['low']),
+                        close=bar['close'], changes=last['changes'] + bar['changes'])
+        else:
+            merged.append(dict(bar))
+    return merged
+
+
+@instrument()
+async def get_price_series(book_id: UUID, interval: SeriesInterval = SeriesInterval.day,
+                           date_from: datetime | None = None, date_to: datetime | None = None) -> List[Dict]:
+    """
+    OHLC bars of price by day or week, one group by over rows of range. days of compacted partitions
+    come from price_history_daily, there a day is taken whole if range starts inside it
+    """
+    # interval из enum, поэтому литерал: с параметром postgres не узнает выражение в GROUP BY
+    unit = literal_column(f"'{SeriesInterval(interval).value}'")
+    bucket = func.date_trunc(unit, PriceHistory.created_at)
+    raw = _in_range(select(
+        bucket.label('bucket'),
+        _first_price().label('open'),
+        func.max(PriceHistory.price).label('high'),
+        func.min(PriceHistory.price).label('low'),
+        _last_price().label('close'),
+        func.count().label('changes'),
+    ).where(PriceHistory.book_id == book_id), date_from, date_to).group_by(bucket)
+
+    daily = PriceHistoryDaily
+    daily_bucket = func.date_trunc(unit, cast(daily.day, DateTime))
+    rolled = select(
+        daily_bucket.label('bucket'),
+        array_agg(aggregate_order_by(daily.open, daily.day))[1].label('open'),
+        func.max(daily.high).label('high'),
+        func.min(daily.low).label('low'),
+        array_agg(aggregate_order_by(daily.close, daily.day.desc()))[1].label('close'),
+        cast(func.sum(daily.changes), daily.changes.type).label('changes'),
+    ).where(daily.book_id == book_id)
+    rolled = _in_days(rolled, date_from, date_to).group_by(daily_bucket)
+
+    bars = union_all(rolled, raw).subquery()
+    stmt = select(bars).order_by(bars.c.bucket)
+
+    async with async_session_maker() as session:
+        try:
+            res = await session.execute(stmt)
+            return _merge_bars(res.mappings().all())
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+# верхняя граница секции в pg_get_expr: FOR VALUES FROM (...) TO ('2026-12-01 00:00:00'), у DEFAULT ее нет
+PARTITION_UPPER = re.compile(r"TO \('([^']+)'\)")
+
+PARTITIONS = text("""
+SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound, c.reltuples::bigint AS estimated_rows
+FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'price_history'::regclass
+""")
+
+
+# таблицы секций, отключенные прерванной сверткой: они уже не в price_history, но еще не свернуты
+DETACHED = text("""
+SELECT c.relname FROM pg_class c
+WHERE c.relkind = 'r' AND NOT c.relispartition AND c.relname ~ '^price_history_([0-9]{4}_[0-9]{2}|legacy)$'
+""")
+
+DEFAULT_PARTITION = 'price_history_default'
+
+# SQLSTATE lock_not_available: не дождались блокировки за lock_timeout
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def _partition_table(name: str):
+    return table(name, column('id'), column('book_id'), column('price'), column('created_at'))
+
+
+@instrument()
+async def list_partitions() -> List[Dict]:
+    """partitions of price_history by upper bound (None for DEFAULT, it goes last)"""
+    async with async_session_maker() as session:
+        try:
+            res = await session.execute(PARTITIONS)
+            partitions = []
+            for row in res.mappings().all():
+                upper = PARTITION_UPPER.search(row['bound'])
+                partitions.append({'name': row['name'], 'bound': row['bound'],
+                                   'upper': datetime.fromisoformat(upper.group(1)) if upper else None,
+                                   'estimated_rows': max(row['estimated_rows'], 0)})
+            return sorted(partitions, key=lambda p: (p['upper'] is None, p['upper'] or datetime.min))
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+@instrument(rows=lambda result: result['created'])
+async def create_partitions(months_ahead: int) -> Dict:
+    """
+    monthly partitions from current month to months_ahead months ahead, a month whose rows are already
+    in DEFAULT partition takes them. returns number of new partitions and rows left in DEFAULT
+    """
     async with async_session_maker() as session:
         async with session.begin():
+            try:
+                created = await session.scalar(select(func.price_history_create_partitions(months_ahead)))
+                default_rows = await session.scalar(select(func.count()).select_from(table(DEFAULT_PARTITION)))
+                return {'created': created, 'default_rows': default_rows}
+            except Exception as ex:
+                raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                    status_code=500)
 
+
+def _rollup_stmt(partition):
+    day = cast(partition.c.created_at, Date)
+    first = array_agg(aggregate_order_by(partition.c.price, partition.c.created_at, partition.c.id))[1]
+    last = array_agg(aggregate_order_by(partition.c.price, partition.c.created_at.desc(), partition.c.id.desc()))[1]
+    stmt = insert(PriceHistoryDaily).from_select(
+        ['book_id', 'day', 'open', 'high', 'low', 'close', 'changes', 'price_sum'],
+        select(partition.c.book_id, day, first, func.max(partition.c.price), func.min(partition.c.price), last,
+               func.count(), func.sum(partition.c.price))
+        .group_by(partition.c.book_id, day))
+    # день лежит целиком в одной секции, повторная свертка той же таблицы пишет те же значения
+    inserted = (stmt.on_conflict_do_update(
+                    index_elements=[PriceHistoryDaily.book_id, PriceHistoryDaily.day],
+                    set_={name: stmt.excluded[name]
+                          for name in ('open', 'high', 'low', 'close', 'changes', 'price_sum')})
+                .returning(PriceHistoryDaily.changes)
+                .cte('inserted'))
+    return select(func.count(), func.coalesce(func.sum(inserted.c.changes), 0))
+
+
+def _quote(session: AsyncSession, name: str) -> str:
+    return session.get_bind().dialect.identifier_preparer.quote(name)
+
+
+async def _set_lock_timeout(session: AsyncSession):
+    await session.execute(text(f"SET LOCAL lock_timeout = '{int(PRICE_HISTORY_LOCK_TIMEOUT * 1000)}ms'"))
+
+
+async def _detach_partition(name: str) -> bool:
+    """
+    own short transaction: DETACH locks whole price_history, so it waits for lock only lock_timeout
+    and does not hold readers and writers behind it. False if lock was not taken
+    """
+    async with async_session_maker() as session:
+        try:
+            async with session.begin():
+                await _set_lock_timeout(session)
+                await session.execute(text(f'ALTER TABLE price_history DETACH PARTITION {_quote(session, name)}'))
+            return True
+        except DBAPIError as ex:
+            if getattr(ex.orig, 'sqlstate', None) == LOCK_NOT_AVAILABLE:
+                return False
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+
+async def _compact_table(name: str) -> tuple:
+    """daily OHLC of detached partition and its DROP in one transaction, locks only the partition itself"""
+    async with async_session_maker() as session:
+        async with session.begin():
             try:
-                print(books_data)
-                all_history = []
-                for book in books_data:
-                    all_history.append(PriceHistory(book_id=book[0], price=book[1]))
-                session.add_all(all_history)
-                await session.commit()
+                await _set_lock_timeout(session)
+                days, rows = (await session.execute(_rollup_stmt(_partition_table(name)))).one()
+                await session.execute(text(f'DROP TABLE {_quote(session, name)}'))
+                return days, rows
             except Exception as ex:
-                await session.rollback()
                 raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
                                     status_code=500)
+
+
+@instrument(rows=lambda report: report['partitions'])
+async def rollup_partitions(retention_months: int) -> Dict:
+    """
+    compacts partitions which end before first day of month retention_months ago. every partition is first
+    detached (see _detach_partition), then its daily OHLC goes to price_history_daily and it is dropped
+    in the same transaction, so no row is counted twice. tables left detached by interrupted run are
+    compacted too. partitions whose lock was not taken are in skipped, the next run takes them.
+    price_stats keeps its totals, dropping of partition does not fire delete trigger
+    """
+    report = {'partitions': 0, 'rows': 0, 'days': 0, 'dropped': [], 'skipped': []}
+    async with async_session_maker() as session:
+        try:
+            cutoff = await session.scalar(select(
+                func.date_trunc('month', func.localtimestamp()) - func.make_interval(0, retention_months)))
+            detached = list(await session.scalars(DETACHED))
+        except Exception as ex:
+            raise HTTPException(detail={'message': f'Произошла ошибка!: {str(ex)}'},
+                                status_code=500)
+
+    for partition in await list_partitions():
+        if partition['upper'] is None or partition['upper'] > cutoff:
+            continue
+        if await _detach_partition(partition['name']):
+            detached.append(partition['name'])
+        else:
+            report['skipped'].append(partition['name'])
+
+    for name in detached:
+        days, rows = await _compact_table(name)
+        report['partitions'] += 1
+        report['rows'] += rows
+        report['days'] += days
+        report['dropped'].append(name)
+    return report
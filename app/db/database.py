@@ -1,8 +1,103 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+from uuid import uuid4
 
-from app.config import REAL_DATABASE_URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
+from app.metrics import instrument_engine
+from app.config import (REAL_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                        DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_PGBOUNCER)
 
-print(REAL_DATABASE_URL)
-engine = create_async_engine(REAL_DATABASE_URL)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """queue pool which measures how long checkouts wait for free connection"""
+
+    def __init__(self, *args, wait_window: int = 1000, **kwargs):
+        super().__init__(*args, **kwargs)
+        # последние ожидания для перцентилей, счетчики за все время
+        self._waits = deque(maxlen=wait_window)
+        self.stats = {'checkouts': 0, 'timeouts': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            self._waits.append(wait)
+            self.stats['checkouts'] += 1
+            self.stats['wait_total'] += wait
+            self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+
+    def info(self) -> Dict:
+        waits = sorted(self._waits)
+
+        def percentile(q: float) -> float:
+            return round(waits[min(int(len(waits) * q), len(waits) - 1)] * 1000, 3) if waits else 0.0
+
+        return {
+            'size': self.size(), 'max_overflow': self._max_overflow, 'timeout': self._timeout,
+            'checked_out': self.checkedout(), 'checked_in': self.checkedin(),
+            # до заполнения пула sqlalchemy считает overflow отрицательным
+            'overflow': max(self.overflow(), 0),
+            'checkouts': self.stats['checkouts'], 'timeouts': self.stats['timeouts'],
+            'wait_mean_ms': round(self.stats['wait_total'] / self.stats['checkouts'] * 1000, 3)
+            if self.stats['checkouts'] else 0.0,
+            'wait_max_ms': round(self.stats['wait_max'] * 1000, 3),
+            'wait_p50_ms': percentile(0.50), 'wait_p99_ms': percentile(0.99),
+        }
+
+
+def connect_args(statement_cache_size: int = DB_STATEMENT_CACHE_SIZE, pgbouncer: bool = DB_PGBOUNCER) -> Dict:
+    """arguments of asyncpg connection, see DB_PGBOUNCER in config"""
+    if not pgbouncer:
+        return {'prepared_statement_cache_size': statement_cache_size}
+    # кеш asyncpg и кеш sqlalchemy выключены, а имя каждого запроса уникально на любом соединении сервера
+    return {'statement_cache_size': 0, 'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__'}
+
+
+def make_engine(url: str = REAL_DATABASE_URL, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW,
+                pool_timeout: float = DB_POOL_TIMEOUT, pool_recycle: int = DB_POOL_RECYCLE,
+                pool_pre_ping: bool = DB_POOL_PRE_PING, statement_cache_size: int = DB_STATEMENT_CACHE_SIZE,
+                pgbouncer: bool = DB_PGBOUNCER):
+    return create_async_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args(statement_cache_size, pgbouncer),
+    )
+
+
+engine = make_engine()
+instrument_engine(engine)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+
+def pool_info() -> Dict:
+    return engine.pool.info()
+
+
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None) -> AsyncIterator[AsyncSession]:
+    """
+    gives session of unit of work if it is passed, commit is done by unit of work then.
+    otherwise opens own session with own transaction
+    """
+    if session is not None:
+        yield session
+        return
+    async with async_session_maker() as session:
+        async with session.begin():
+            yield session
@@ -0,0 +1,32 @@
+"""
+fingerprints for duplicates of import: one of book by its normalized title and digest of whole file
+"""
+import hashlib
+import unicodedata
+from typing import BinaryIO
+
+from app.config import FINGERPRINT_UNICODE_FORM, FINGERPRINT_COLLAPSE_SPACES, FINGERPRINT_LOWERCASE
+
+
+def normalize_title(title: str) -> str:
+    if FINGERPRINT_UNICODE_FORM:
+        title = unicodedata.normalize(FINGERPRINT_UNICODE_FORM, title)
+    if FINGERPRINT_COLLAPSE_SPACES:
+        title = ' '.join(title.split())
+    if FINGERPRINT_LOWERCASE:
+        title = title.lower()
+    return title
+
+
+def book_fingerprint(title: str) -> str:
+    return hashlib.sha256(normalize_title(title).encode()).hexdigest()
+
+
+def file_digest(file: BinaryIO, block_size: int = 1024 * 1024) -> str:
+    """sha256 of file from its start, position of file is returned to start"""
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(block_size), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
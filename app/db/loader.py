@@ -0,0 +1,80 @@
+"""
+DataLoader: keys requested by one request during one iteration of event loop are loaded by one query.
+loaders keep loaded values, so they are made per request by get_loaders dependency
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from app.db.cruds import book as book_crud
+from app.db.cruds import price_history as history_crud
+from app.config import BATCH_GET_MAX_IDS
+
+
+BatchLoad = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class DataLoader:
+    """
+    load(key) is future of value, batch_load(keys) -> {key: value} is called once for all keys
+    which were requested before the loop got to dispatch. missing key resolves to None
+    """
+
+    def __init__(self, batch_load: BatchLoad, max_batch_size: Optional[int] = None):
+        self._batch_load = batch_load
+        self._max_batch_size = max_batch_size
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[key] = loop.create_future()
+        self._queue.append(key)
+        # первый ключ пачки: запрос уйдет после того, как остальные корутины успеют добавить свои
+        if len(self._queue) == 1:
+            loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        size = self._max_batch_size or len(keys)
+        for i in range(0, len(keys), size):
+            task = asyncio.create_task(self._load_batch(keys[i:i + size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, keys: List[Hashable]):
+        try:
+            values = await self._batch_load(keys)
+        except Exception as ex:
+            # ошибку получат все ждущие, а следующий load попробует снова
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        for key in keys:
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+class Loaders:
+    """loaders of one request"""
+
+    def __init__(self):
+        # архивные книги тоже грузятся, include_archived решает обработчик, как у GET /books/{id}
+        self.books = DataLoader(lambda ids: book_crud.get_books_by_ids(ids, include_archived=True),
+                                max_batch_size=BATCH_GET_MAX_IDS)
+        self.price_stats = DataLoader(history_crud.get_price_stats_many, max_batch_size=BATCH_GET_MAX_IDS)
+
+
+async def get_loaders() -> Loaders:
+    """request scoped dependency"""
+    return Loaders()
@@ -2,23 +2,30 @@ from datetime import datetime
 from typing import Annotated
 from uuid import uuid4
 
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
-from sqlalchemy import Column, Integer, String, Text, CheckConstraint, ForeignKey, Boolean
-from sqlalchemy.orm import relationship, Mapped, declarative_base
-from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR, JSONB
+from sqlalchemy import (Column, Integer, String, Text, CheckConstraint, ForeignKey, Boolean, Index, Computed,
+                        DateTime, BigInteger, Date, LargeBinary)
+from sqlalchemy.orm import relationship, Mapped, declarative_base, deferred, validates
+from sqlalchemy import func, text, event, DDL
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
 # from app.db.database import Base
-from app.config import MAX_DATA, MIN_DATA
+from app.config import MAX_DATA, MIN_DATA, SEARCH_CONFIG
+from app.db.fingerprint import book_fingerprint
+from app.db.ids import uuid7, UUID_V7_FUNCTION
 
 # annotation
 created_at = Annotated[datetime, mapped_column(server_default=func.now())]
 updated_at = Annotated[datetime, mapped_column(server_default=func.now(), onupdate=datetime.now)]
 
 
-class Base(AsyncAttrs, DeclarativeBase):
+class Model(AsyncAttrs, DeclarativeBase):
+    __abstract__ = True
+
+
+class Base(Model):
     __abstract__ = True
 
     created_at: Mapped[created_at]
@@ -27,7 +34,7 @@ class Base(AsyncAttrs, DeclarativeBase):
 class Book(Base):
     __tablename__ = 'books'
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7, server_default=text('uuid_generate_v7()'))
     title = Column(String, nullable=False, unique=True)
     author = Column(String)
     publication_year = Column(Integer, nullable=False)
@@ -36,6 +43,17 @@ class Book(Base):
     cover_image = Column(String)
     price = Column(Integer, nullable=True)
     archived = Column(Boolean, nullable=False, default=False)
+    archived_at = Column(DateTime)
+    # sha256 of normalized title, see app.db.fingerprint
+    fingerprint = Column(String(64), nullable=False)
+    # optimistic concurrency: every write increments it, GET returns it as ETag, PATCH checks If-Match
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # full text search by q=, title is more important than author and description
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(author, '')), 'B') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'C')",
+        persisted=True)))
 
     history: Mapped['PriceHistory'] = relationship(back_populates='book', cascade='all, delete-orphan',
                                                    single_parent=True)
@@ -43,15 +61,42 @@ class Book(Base):
     __table_args__ = (
         CheckConstraint(f'publication_year >= {MIN_DATA}', name='min_publication_year_error'),
         CheckConstraint(f'publication_year <= {MAX_DATA}', name='max_publication_year_error'),
-        CheckConstraint('price >= 0', name='price must be positive')
-
+        CheckConstraint('price >= 0', name='price must be positive'),
+        # keyset pagination, reads skip archived books by default and use partial indexes
+        Index('ix_books_created_at_id_active', 'created_at', 'id', postgresql_where=text('NOT archived')),
+        Index('ix_books_publication_year_id_active', 'publication_year', 'id', postgresql_where=text('NOT archived')),
+        # search
+        Index('ix_books_genre', 'genre', postgresql_using='gin'),
+        Index('ix_books_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+        Index('ix_books_author_trgm', 'author', postgresql_using='gin', postgresql_ops={'author': 'gin_trgm_ops'}),
+        Index('ix_books_description_trgm', 'description', postgresql_using='gin',
+              postgresql_ops={'description': 'gin_trgm_ops'}),
+        Index('ix_books_author_active', 'author', postgresql_where=text('NOT archived')),
+        Index('ix_books_price_active', 'price', postgresql_where=text('NOT archived')),
+        # only_archived and purge of old archived books
+        Index('ix_books_archived_at', 'archived_at', postgresql_where=text('archived')),
+        Index('ix_books_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_books_updated_at', 'updated_at'),
+        Index('ix_books_fingerprint', 'fingerprint'),
     )
 
+    @validates('title')
+    def _set_fingerprint(self, key, title):
+        # orm объекты получают отпечаток сами, в bulk insert его добавляет load_data
+        self.fingerprint = book_fingerprint(title)
+        return title
+
 
-class PriceHistory(Base):
+class PriceHistory(Model):
+    """
+    append only, range partitioned by month of created_at (migration 4f8a2c6e1b93), so created_at
+    is part of primary key. history maintenance job creates partitions ahead and compacts partitions
+    older than PRICE_HISTORY_RETENTION_MONTHS into price_history_daily
+    """
     __tablename__ = 'price_history'
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7, server_default=text('uuid_generate_v7()'))
+    created_at = Column(DateTime, primary_key=True, server_default=func.now())
     book_id = Column(UUID, ForeignKey('books.id'), nullable=False)
     price = Column(Integer, nullable=False)
 
@@ -59,4 +104,97 @@ class PriceHistory(Base):
 
     __table_args__ = (
         CheckConstraint('price >= 0', name='positive_price'),
+        # индексы секционированной таблицы: у каждой секции свой (book_id, created_at, id)
+        Index('ix_price_history_book_id_created_at_id', 'book_id', 'created_at', 'id'),
+        Index('ix_price_history_created_at_brin', 'created_at', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
+
+
+# схема из моделей (create_all) без миграций: функция id до всех таблиц и секция DEFAULT, чтобы было куда вставлять
+event.listen(Model.metadata, 'before_create', DDL(UUID_V7_FUNCTION))
+event.listen(PriceHistory.__table__, 'after_create',
+             DDL('CREATE TABLE price_history_default PARTITION OF price_history DEFAULT'))
+
+
+class PriceHistoryDaily(Model):
+    """daily OHLC of price_history rows of compacted partitions, written only by history maintenance job"""
+    __tablename__ = 'price_history_daily'
+
+    book_id = Column(UUID(as_uuid=True), ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    open = Column(Integer, nullable=False)
+    high = Column(Integer, nullable=False)
+    low = Column(Integer, nullable=False)
+    close = Column(Integer, nullable=False)
+    changes = Column(Integer, nullable=False)
+    # сумма цен дня для среднего за диапазон
+    price_sum = Column(BigInteger, nullable=False)
+
+
+class PriceStats(Base):
+    """
+    summary of price_history of one book. it is maintained by statement level triggers
+    on price_history (migration 2d6f0b8e4c17), so it is never written by app
+    """
+    __tablename__ = 'price_stats'
+
+    book_id = Column(UUID(as_uuid=True), ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    current_price = Column(Integer, nullable=False)
+    min_price = Column(Integer, nullable=False)
+    max_price = Column(Integer, nullable=False)
+    price_sum = Column(BigInteger, nullable=False)
+    change_count = Column(Integer, nullable=False)
+    first_change_at = Column(DateTime, nullable=False)
+    last_change_at = Column(DateTime, nullable=False)
+
+
+class ImportCheckpoint(Base):
+    """progress of import from third party api, position is last processed page or item"""
+    __tablename__ = 'import_checkpoints'
+
+    source = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+
+
+class ImportFile(Base):
+    """file which was already imported with given on_conflict, its repeated upload is not processed again"""
+    __tablename__ = 'import_files'
+
+    digest = Column(String(64), primary_key=True)
+    on_conflict = Column(String, primary_key=True)
+    filename = Column(String)
+    report = Column(JSONB, nullable=False, default=dict)
+
+
+class ImportJob(Base):
+    """background import, status: queued -> running -> done | failed"""
+    __tablename__ = 'import_jobs'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='queued')
+    params = Column(JSONB, nullable=False, default=dict)
+    progress = Column(JSONB, nullable=False, default=dict)
+    result = Column(JSONB)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    # выдается при каждом захвате задачи, пишет в задачу только воркер с тем же lease
+    lease = Column(UUID(as_uuid=True))
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # очередь выбирается по статусу в порядке создания
+        Index('ix_import_jobs_status_created_at', 'status', 'created_at'),
+    )
+
+
+class ImportJobPayload(Model):
+    """uploaded file of job by chunks, so any worker can run the job, it is deleted when job is over"""
+    __tablename__ = 'import_job_payloads'
+
+    job_id = Column(UUID(as_uuid=True), ForeignKey('import_jobs.id', ondelete='CASCADE'), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import Column, tuple_
+from sqlalchemy.sql import Select
+
+
+def encode_cursor(order: str, values: Sequence[Any]) -> str:
+    """opaque token with name of ordering and sort key of last row on page"""
+    payload = [order, [_dump(value) for value in values]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def decode_cursor(token: str, order: str, columns: Sequence[Column]) -> List[Any]:
+    try:
+        token_order, values = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if token_order != order or len(values) != len(columns):
+            raise ValueError
+        return [_restore(column, value) for column, value in zip(columns, values)]
+    except Exception:
+        raise HTTPException(detail={'message': 'Невалидный cursor'}, status_code=400)
+
+
+def _restore(column: Column, value: Any) -> Any:
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is UUID:
+        return UUID(value)
+    return python_type(value)
+
+
+def keyset_page(stmt: Select, columns: Sequence[Column], after: Sequence[Any] | None, lim: int) -> Select:
+    """
+    orders stmt by columns and takes rows after sort key of previous page.
+    one row more than lim is selected to know if there is next page
+    """
+    if after is not None:
+        stmt = stmt.where(tuple_(*columns) > tuple_(*after))
+    return stmt.order_by(*columns).limit(lim + 1)
+
+
+def split_page(rows: List[Any], lim: int, order: str, key_names: Sequence[str]):
+    """returns rows of page and cursor of next page, None if it is the last one"""
+    if len(rows) <= lim:
+        return rows, None
+    rows = rows[:lim]
+    return rows, encode_cursor(order, [rows[-1][name] for name in key_names])
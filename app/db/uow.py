@@ -0,0 +1,36 @@
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db.database import async_session_maker
+
+
+class UnitOfWork:
+    """
+    one session and one transaction for the whole handler,
+    commits if handler finished without error, otherwise rollbacks
+    """
+
+    def __init__(self, session_maker: async_sessionmaker = async_session_maker):
+        self._session_maker = session_maker
+        self.session: AsyncSession | None = None
+
+    async def __aenter__(self) -> 'UnitOfWork':
+        self.session = self._session_maker()
+        await self.session.begin()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.session.commit()
+            else:
+                await self.session.rollback()
+        finally:
+            await self.session.close()
+
+
+async def get_uow() -> AsyncIterator[UnitOfWork]:
+    """request scoped dependency"""
+    async with UnitOfWork() as uow:
+        yield uow
@@ -1,7 +1,37 @@
+from datetime import datetime
+from enum import Enum
 from uuid import UUID, uuid4
 from pydantic import BaseModel, conint, ConfigDict
 from typing import List, Any
 from app.config import MIN_DATA, MAX_DATA
+from app.dto.price_history import PriceStatsShow
+
+
+class ConflictMode(str, Enum):
+    """what to do with loaded book whose title already exists"""
+    skip = 'skip'
+    update = 'update'
+    report = 'report'
+
+
+class BookOrder(str, Enum):
+    """indexed columns which list of books can be ordered by"""
+    created_at = 'created_at'
+    title = 'title'
+    publication_year = 'publication_year'
+
+
+class ArchivedScope(str, Enum):
+    """which books reads return: active - not archived (default), all, archived - only archived"""
+    active = 'active'
+    all = 'all'
+    archived = 'archived'
+
+
+class UploadEngine(str, Enum):
+    """rows - row by row validation with pydantic, pandas - columnar validation of whole file"""
+    rows = 'rows'
+    pandas = 'pandas'
 
 
 class TunedModel(BaseModel):
@@ -49,7 +79,7 @@ class CreateBook(TunedModel):
 
 
 class UpdateBook(TunedModel):
-    """ class for patch update"""
+    """ class for patch update, archived is changed only by DELETE and /archive, /unarchive"""
     title: str | None = None
     publication_year: conint(le=MAX_DATA, ge=MIN_DATA) | None = None
     genre: List[str] | None = None
@@ -57,7 +87,6 @@ class UpdateBook(TunedModel):
     author: str | None = None
     description: str | None = None
     cover_image: str | None = None
-    archived: bool = False
 
 
 class ShowBook(CreateBook):
@@ -77,6 +106,72 @@ class ShowBook(CreateBook):
         }
 
 
+class BookDetail(ShowBook):
+    version: int = 1
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    archived_at: datetime | None = None
+
+
+class BookPage(TunedModel):
+    """page of keyset pagination"""
+    books: List[ShowBook]
+    next_cursor: str | None = None
+
+
+class FacetValue(TunedModel):
+    value: str
+    count: int
+
+
+class FacetBucket(TunedModel):
+    """bucket of histogram, start <= value < end"""
+    start: int
+    end: int
+    count: int
+
+
+class BookFacets(TunedModel):
+    genre: List[FacetValue]
+    author: List[FacetValue]
+    price: List[FacetBucket]
+    publication_year: List[FacetBucket]
+
+
+class BookSearch(TunedModel):
+    """list of books with include=count,facets, total is estimated for large results"""
+    books: List[ShowBook]
+    next_cursor: str | None = None
+    total: int | None = None
+    total_estimated: bool = False
+    facets: BookFacets | None = None
+
+
+class BatchBook(TunedModel):
+    """item of GET /books/batch in order of requested ids, status is found or not_found"""
+    id: UUID
+    status: str
+    book: BookDetail | None = None
+    price_stats: PriceStatsShow | None = None
+
+
+class BookFilter(TunedModel):
+    """filters of bulk archive/unarchive, the same as of list of books"""
+    title: str | None = None
+    author: str | None = None
+    genres: str | None = None
+    genres_neq: str | None = None
+    price: int | None = None
+    description: str | None = None
+    q: str | None = None
+
+
+class PriceUpdate(TunedModel):
+    """item of bulk repricing"""
+    book_id: UUID
+    price: conint(ge=0)
+
+
 class DeleteBook(TunedModel):
     id: UUID
 
@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class ExportEntity(str, Enum):
+    books = 'books'
+    price_history = 'price_history'
+
+
+class ExportFormat(str, Enum):
+    ndjson = 'ndjson'
+    csv = 'csv'
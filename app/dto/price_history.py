@@ -1,13 +1,48 @@
+from enum import Enum
+from typing import List
+
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from uuid import UUID
 
 
+class SeriesInterval(str, Enum):
+    """bucket of price series, argument of date_trunc"""
+    day = 'day'
+    week = 'week'
+
+
 class PriceHistoryShow(BaseModel):
     id: UUID
-    book_id: int
+    book_id: UUID
     price: int
-    time: datetime
+    created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
+
+class PriceStatsShow(BaseModel):
+    book_id: UUID
+    current_price: int
+    min_price: int
+    max_price: int
+    avg_price: float
+    change_count: int
+    first_change_at: datetime
+    last_change_at: datetime
+
+
+class PriceBar(BaseModel):
+    """OHLC of one bucket: first, max, min and last price of bucket"""
+    bucket: datetime
+    open: int
+    high: int
+    low: int
+    close: int
+    changes: int
+
+
+class PriceSeries(BaseModel):
+    book_id: UUID
+    interval: SeriesInterval
+    bars: List[PriceBar]
@@ -1,97 +1,259 @@
+import asyncio
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 from uuid import UUID
 
-from httpx import AsyncClient, HTTPError
 from asyncio import get_event_loop
-from openpyxl import load_workbook
 
 from fastapi import UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import ValidationError
 
-from app.dto.book import (SearchBook, CreateBook, ShowBook,
-                          DeleteBook, UpdateBook, InvalidBook,
+from app.dto.book import (SearchBook, CreateBook, ShowBook, BookDetail,
+                          UpdateBook, InvalidBook,
+                          ConflictMode, BookOrder, PriceUpdate, UploadEngine,
+                          ArchivedScope, BookFilter,
                           )
+from app.cache import book_cache
+from app.coalesce import Coalescer
+from app.db.uow import UnitOfWork
+from app.db.loader import Loaders
 from app.db.cruds import book as book_crud
 from app.db.cruds import price_history as history_crud
-from app.config import COLUMNS, LOAD_BOOKS_URL
+from app.db.cruds import import_file as import_file_crud
+from app.db.fingerprint import file_digest
+from app.handlers.upload import open_rows, read_header, read_chunk, columns_are_valid
+from app.handlers.validation import validate_rows_async
+from app.handlers.columnar import read_frame, validate_frame
+from app.metrics import stage
+from app.handlers.ingest import new_report, flush_chunk, report_counters, ProgressCallback
+from app.config import (UPLOAD_CHUNK_SIZE, BULK_PRICE_MAX_ITEMS, BATCH_GET_MAX_IDS, BOOKS_LIST_COALESCE,
+                        BOOKS_LIST_MICROCACHE_TTL, BOOKS_LIST_MICROCACHE_STALE, BOOK_COALESCE,
+                        UPLOAD_COLUMNAR_ENABLED)
 
 
-async def create_new_book(body: CreateBook):
+books_list_flight = Coalescer('/books/', enabled=BOOKS_LIST_COALESCE, ttl=BOOKS_LIST_MICROCACHE_TTL,
+                              stale=BOOKS_LIST_MICROCACHE_STALE)
+book_flight = Coalescer('/books/{book_id}', enabled=BOOK_COALESCE)
+
+
+async def create_new_book(body: CreateBook, uow: UnitOfWork):
     new_book = await book_crud.create_book(
         title=body.title, author=body.author, genre=body.genre,
         description=body.description, cover_image=body.cover_image,
-        publication_year=body.publication_year, price=body.price
-    )
-    await history_crud.create_history(book_id=new_book.id, price=new_book.price)
-    return ShowBook(
-        id=new_book.id, title=new_book.title, genre=new_book.genre,
-        author=new_book.author, description=new_book.description,
-        publication_year=new_book.publication_year, price=new_book.price,
-        cover_image=new_book.cover_image
+        publication_year=body.publication_year, price=body.price,
+        session=uow.session
     )
+    await history_crud.create_history(book_id=new_book.id, price=new_book.price, session=uow.session)
+    return ORJSONResponse(ShowBook.model_validate(new_book).model_dump(mode='json'),
+                          headers={'ETag': etag(new_book.version)})
+
+
+async def archive_current_book(book_id: UUID):
+    return await book_crud.delete_book(book_id=book_id)
+
 
+def archived_scope(include_archived: bool = False, only_archived: bool = False) -> ArchivedScope:
+    if only_archived:
+        return ArchivedScope.archived
+    return ArchivedScope.all if include_archived else ArchivedScope.active
 
-async def delete_book(body: DeleteBook):
-    return await book_crud.delete_book(book_id=body.id)
 
+async def archive_books(body: BookFilter, archived: bool = True) -> Dict:
+    """bulk archive/unarchive of books which match filters, without filters it would be the whole table"""
+    filters = body.model_dump(exclude_none=True)
+    if not filters:
+        raise HTTPException(detail={'message': 'Нужен хотя бы один фильтр книг'}, status_code=400)
+    count = await book_crud.set_archived(filters, archived=archived)
+    return {'archived_count' if archived else 'unarchived_count': count}
 
-async def get_current_book(book_id: UUID):
-    return await book_crud.get_book(book_id=book_id)
 
+def etag(version: int) -> str:
+    return f'"{version}"'
 
-async def update_current_book(book_id: UUID, body: UpdateBook) -> ShowBook:
+
+def if_match_version(if_match: Optional[str]) -> Optional[int]:
+    """version from If-Match, * or no header - any version"""
+    if if_match is None or if_match.strip() == '*':
+        return None
+    value = if_match.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(detail={'message': 'If-Match должен быть ETag книги, например "3"'}, status_code=400)
+
+
+async def _load_book(book_id: UUID) -> Dict:
+    # dto строится один раз, в кеш кладется уже готовый для json словарь.
+    # в кеше и архивные книги, чтобы include_archived не давал отдельный ключ
+    book = await book_crud.get_book(book_id=book_id, include_archived=True)
+    return BookDetail.model_validate(book).model_dump(mode='json')
+
+
+async def get_current_book(book_id: UUID, if_none_match: Optional[str] = None, include_archived: bool = False):
+    book = await book_flight.get({'book_id': book_id},
+                                 lambda: book_cache.book(book_id, lambda: _load_book(book_id)))
+    if book['archived'] and not include_archived:
+        raise HTTPException(detail={'message': f'Книги с id {book_id} не существует'}, status_code=404)
+    headers = {'ETag': etag(book['version'])}
+    if if_none_match is not None and if_none_match.strip() in (headers['ETag'], f'W/{headers["ETag"]}'):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(book, headers=headers)
+
+
+async def get_books_batch(ids: List[UUID], loaders: Loaders, include_archived: bool = False,
+                          with_price_stats: bool = False):
+    """
+    books in order of ids by one query (and one more for price stats), repeated ids are read once.
+    rows go to orjson as they are, without dto
+    """
+    if not ids:
+        raise HTTPException(detail={'message': 'Нужен хотя бы один id'}, status_code=400)
+    if len(ids) > BATCH_GET_MAX_IDS:
+        raise HTTPException(detail={'message': f'Не больше {BATCH_GET_MAX_IDS} книг за запрос'},
+                            status_code=413)
+
+    loads = [loaders.books.load_many(ids)]
+    if with_price_stats:
+        loads.append(loaders.price_stats.load_many(ids))
+    books, *stats = await asyncio.gather(*loads)
+
+    result = []
+    for i, (book_id, book) in enumerate(zip(ids, books)):
+        if book is None or (book['archived'] and not include_archived):
+            result.append({'id': book_id, 'status': 'not_found'})
+            continue
+        item = {'id': book_id, 'status': 'found', 'book': book}
+        if with_price_stats:
+            item['price_stats'] = stats[0][i]
+        result.append(item)
+    return ORJSONResponse(result)
+
+
+async def update_current_book(book_id: UUID, body: UpdateBook, uow: UnitOfWork, if_match: Optional[str] = None):
+    """history of new price is written by the same statement as price, see book_crud.update_book"""
     if body.genre == ['string']:
         body.genre = None
-    data = await book_crud.update_book(book_id=book_id, update_book=body)
-    if data['flag']:
-        await history_crud.create_history(book_id=book_id, price=body.price)
-    return data['book']
+    data = await book_crud.update_book(book_id=book_id, update_book=body, expected_version=if_match_version(if_match),
+                                       session=uow.session)
+    book = data['book']
+    return ORJSONResponse(ShowBook.model_validate(book).model_dump(mode='json'),
+                          headers={'ETag': etag(book['version'])})
+
+
+def _parse_price_updates(body: bytes, content_type: str) -> List:
+    try:
+        if 'ndjson' in content_type:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError as ex:
+        raise HTTPException(detail={'message': f'Невалидный JSON: {str(ex)}'}, status_code=400)
+    if not isinstance(items, list):
+        raise HTTPException(detail={'message': 'Ожидается список [{"book_id": ..., "price": ...}]'},
+                            status_code=400)
+    return items
+
+
+async def reprice_books(body: bytes, content_type: str, uow: UnitOfWork):
+    items = _parse_price_updates(body, content_type)
+    if len(items) > BULK_PRICE_MAX_ITEMS:
+        raise HTTPException(detail={'message': f'Не больше {BULK_PRICE_MAX_ITEMS} книг за запрос'},
+                            status_code=413)
+
+    updates = []
+    for item in items:
+        try:
+            updates.append(PriceUpdate.model_validate(item))
+        except ValidationError as ex:
+            updates.append(str(ex))
+
+    # при повторе book_id применяется последняя цена
+    prices = {update.book_id: update.price for update in updates if isinstance(update, PriceUpdate)}
+    last_index = {update.book_id: i for i, update in enumerate(updates) if isinstance(update, PriceUpdate)}
+    statuses = await book_crud.update_prices(prices, session=uow.session)
+
+    result = []
+    for i, update in enumerate(updates):
+        if isinstance(update, str):
+            result.append({'index': i, 'status': 'invalid', 'error': update})
+        elif last_index[update.book_id] != i:
+            result.append({'index': i, 'book_id': update.book_id, 'price': update.price, 'status': 'duplicate'})
+        else:
+            result.append({'index': i, 'book_id': update.book_id, 'price': update.price,
+                           'status': statuses[update.book_id]})
+
+    summary = dict(Counter(item['status'] for item in result))
+    return {'summary': summary, 'items': result}
+
+
+# что можно добавить к списку книг через include
+LIST_INCLUDES = {'count', 'facets'}
+
+
+def _parse_include(include: Optional[str]) -> set:
+    parts = {part.strip() for part in (include or '').split(',') if part.strip()}
+    unknown = parts - LIST_INCLUDES
+    if unknown:
+        raise HTTPException(detail={'message': f'include может быть только {", ".join(sorted(LIST_INCLUDES))}'},
+                            status_code=400)
+    return parts
 
 
 async def get_list_books(
         lim: int, offset: int, title: str = None,
         author: str = None, genres: str = None, price: int = None,
-        description: str = None, genres_neq: str = None
+        description: str = None, genres_neq: str = None,
+        cursor: str = None, order_by: BookOrder = BookOrder.created_at,
+        q: str = None, archived: ArchivedScope = ArchivedScope.active,
+        include: str = None
                         ):
-    return await book_crud.get_books(
+    includes = _parse_include(include)
+    params = dict(
         lim=lim, offset=offset, title=title,
         author=author, genres=genres, genres_neq=genres_neq,
-        description=description, price=price
+        description=description, price=price,
+        cursor=cursor, order_by=order_by, q=q, archived=archived
     )
-
-
-async def _make_api_request():
-    async with AsyncClient() as client:
-        try:
-            response = await client.get(LOAD_BOOKS_URL)
-            response.raise_for_status()
-            data = response.json()
-            return data
-        except HTTPError as ex:
-            return JSONResponse({'message': f'Возникла ошибка во время стороннего запроса!: {ex}'}, status_code=500)
-
-
-async def filter_books():
-    books_data = await _make_api_request()
-    loaded_book = []
-    unloaded_book = []
-    for book in books_data:
-        try:
-            new = CreateBook(**book)
-            loaded_book.append(new.json())
-        except ValidationError:
-            unloaded_book.append(book)
-    information = await book_crud.load_data(loaded_book)
-
-    return {'loaded_books': information['valid_books'],
-            'invalid_books': unloaded_book, 'duplicates': information['duplicate_books']}
+    # строки уже готовы для json, orjson пишет их в ответ без jsonable_encoder
+    books = await books_list_flight.get(
+        params, lambda: book_cache.books(params, lambda: book_crud.get_books(**params)))
+    if not includes:
+        return ORJSONResponse(books)
+
+    # счетчик и фасеты зависят только от фильтров, поэтому общие для всех страниц
+    filters = dict(title=title, author=author, genres=genres, genres_neq=genres_neq,
+                   description=description, price=price, q=q, archived=archived)
+    result = dict(books) if isinstance(books, dict) else {'books': books, 'next_cursor': None}
+    loads = {}
+    if 'count' in includes:
+        loads['count'] = books_list_flight.get(
+            {'include': 'count', **filters},
+            lambda: book_cache.aggregates('count', filters, lambda: book_crud.count_books(filters)))
+    if 'facets' in includes:
+        loads['facets'] = books_list_flight.get(
+            {'include': 'facets', **filters},
+            lambda: book_cache.aggregates('facets', filters, lambda: book_crud.book_facets(filters)))
+    values = dict(zip(loads, await asyncio.gather(*loads.values())))
+    if 'count' in values:
+        result['total'] = values['count']['total']
+        result['total_estimated'] = values['count']['estimated']
+    if 'facets' in values:
+        result['facets'] = values['facets']
+    return ORJSONResponse(result)
 
 
 async def finalize_books(func, *args, **kwargs):
     books_data = await func(*args, **kwargs)
+    if isinstance(books_data, JSONResponse):
+        return books_data
 
-    price_data = [(book.id, book.price) for book in books_data['loaded_books']]
-    await history_crud.create_many_history(price_data)
+    price_data = books_data.pop('price_changes')
+    if price_data:
+        await history_crud.create_many_history(price_data)
     return books_data
 
 
@@ -101,77 +263,130 @@ async def run_in_threadpool(func, *args, **kwargs):
 
 
 async def _validate_columns(actual_columns):
-    if set(COLUMNS.keys()) != set(actual_columns):
+    if not columns_are_valid(actual_columns):
         return JSONResponse(
-            content={'Ваши поля не соответсвуют стандартной форме.\n'
+            content={'message': 'Ваши поля не соответсвуют стандартной форме.\n'
                      'title|publication_year|genre|price|author|description|cover_image\n'
                      'Внимательно следите чтобы в названиях не было дополнительно символов и пробелов'},
             status_code=400)
 
 
-async def check_file(file: UploadFile):
-    if file.filename[-5:] != '.xlsx':
-        raise HTTPException(detail={'message': 'Файл должен быть в формате .xlsx'}, status_code=400)
+async def check_digest(file: UploadFile, on_conflict: ConflictMode,
+                       force: bool = False) -> Tuple[Optional[str], Optional[JSONResponse]]:
+    """
+    digest of file which is recorded after import and response for file which was already imported
+    with the same on_conflict, report mode writes nothing and is never recorded
+    """
+    if on_conflict == ConflictMode.report:
+        return None, None
+    digest = await run_in_threadpool(file_digest, file.file)
+    imported = None if force else await import_file_crud.get_import_file(digest, on_conflict.value)
+    if imported is None:
+        return digest, None
+    return digest, JSONResponse(content=jsonable_encoder({
+        'message': 'Этот файл уже загружен, чтобы загрузить его снова передайте force=true',
+        'digest': digest, 'filename': imported.filename, 'imported_at': imported.created_at,
+        'report': imported.report}), status_code=200)
 
-    try:
-        workbook = await run_in_threadpool(load_workbook, file.file)
-    except Exception as e:
-        raise HTTPException(detail={'message': f'Ошибка чтения файла: {str(e)}'}, status_code=400)
 
-    sheet = workbook.active
+async def _remember_file(digest: Optional[str], on_conflict: ConflictMode, filename: Optional[str], counters: Dict):
+    if digest is not None:
+        await import_file_crud.save_import_file(digest, on_conflict.value, filename, counters)
 
-    columns = [cell.value for cell in sheet[1]]
 
-    check_response = await _validate_columns(columns)
+async def _check_frame(file: UploadFile):
+    header, frame = await run_in_threadpool(read_frame, file)
+
+    check_response = await _validate_columns(header)
     if isinstance(check_response, JSONResponse):
         return check_response
 
-    valid = []
-    invalid = []
+    with stage('validate', rows=len(frame)):
+        return await run_in_threadpool(validate_frame, header, frame)
 
-    # Проходим по каждой строке, начиная со второй (первая строка — заголовки)
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        book = [
-            row[0],  # title
-            row[1],  # publication_year
-            row[2],  # genre
-            row[3],  # price
-            row[4],  # author
-            row[5],  # description
-            row[6]   # cover_image
-        ]
 
-        if isinstance(row[2], str):
-            book[2] = row[2].split(',')
+async def _check_rows(file: UploadFile):
+    rows = open_rows(file)
+    columns = await run_in_threadpool(read_header, rows)
 
-        try:
-            new = CreateBook(
-                title=book[0],
-                publication_year=book[1],
-                genre=book[2],
-                price=book[3],
-                author=book[4],
-                description=book[5],
-                cover_image=book[6]
-            )
-            valid.append(new.json())
-        except ValidationError as ex:
-            invalid_book = InvalidBook(
-                title=book[0],
-                publication_year=book[1],
-                genre=book[2],
-                price=book[3],
-                author=book[4],
-                error=str(ex),
-                description=book[5],
-                cover_image=book[6]
-            )
-            invalid.append(invalid_book)
-
-    information = await book_crud.load_data(valid)
+    check_response = await _validate_columns(columns)
+    if isinstance(check_response, JSONResponse):
+        return check_response
+
+    with stage('parse') as timer:
+        all_rows = await run_in_threadpool(list, rows)
+        timer.rows = len(all_rows)
+    valid, invalid = await validate_rows_async(columns, all_rows)
+    # повторы в файле построчный путь оставляет load_data
+    return valid, invalid, []
+
+
+async def check_file(file: UploadFile, on_conflict: ConflictMode = ConflictMode.skip,
+                     engine: UploadEngine = UploadEngine.rows, force: bool = False):
+    if engine == UploadEngine.pandas and not UPLOAD_COLUMNAR_ENABLED:
+        raise HTTPException(detail={'message': 'Колоночная проверка файла (engine=pandas) выключена'},
+                            status_code=400)
+    digest, imported = await check_digest(file, on_conflict, force)
+    if imported is not None:
+        return imported
+
+    checked = await (_check_frame(file) if engine == UploadEngine.pandas else _check_rows(file))
+    if isinstance(checked, JSONResponse):
+        return checked
+    valid, invalid, repeated = checked
+
+    information = await book_crud.load_data(valid, on_conflict=on_conflict)
+    duplicates = repeated + information['duplicate_books']
+    await _remember_file(digest, on_conflict, file.filename, {
+        'parsed_count': len(valid) + len(repeated) + len(invalid), 'valid_count': len(valid) + len(repeated),
+        'loaded_count': len(information['valid_books']), 'updated_count': len(information['updated_books']),
+        'duplicate_count': len(duplicates), 'invalid_count': len(invalid)})
 
     return {
         'loaded_books': information['valid_books'],
+        'updated_books': information['updated_books'],
         'invalid_books': invalid,
-        'duplicates': information['duplicate_books']
+        'duplicates': duplicates,
+        'price_changes': information['price_changes']
     }
+
+
+async def stream_file(file: UploadFile, on_conflict: ConflictMode = ConflictMode.skip,
+                      chunk_size: int = UPLOAD_CHUNK_SIZE, on_progress: Optional[ProgressCallback] = None,
+                      force: bool = False):
+    """
+    reads file chunk by chunk and flushes every chunk to db with its price history,
+    so memory depends on chunk size and not on size of file
+    """
+    digest, imported = await check_digest(file, on_conflict, force)
+    if imported is not None:
+        return imported
+
+    rows = open_rows(file)
+    columns = await run_in_threadpool(read_header, rows)
+
+    check_response = await _validate_columns(columns)
+    if isinstance(check_response, JSONResponse):
+        return check_response
+
+    report = new_report()
+    # пока пишется пачка, следующая уже читается и валидируется в пуле процессов
+    pending = None
+    try:
+        while True:
+            with stage('parse') as timer:
+                chunk = await run_in_threadpool(read_chunk, rows, chunk_size)
+                timer.rows = len(chunk)
+            validation = asyncio.ensure_future(validate_rows_async(columns, chunk)) if chunk else None
+            previous, pending = pending, validation
+            if previous is not None:
+                valid, invalid = await previous
+                await flush_chunk(valid, invalid, report, on_conflict=on_conflict, on_progress=on_progress)
+            if pending is None:
+                break
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+    await _remember_file(digest, on_conflict, file.filename, report_counters(report))
+    return report
@@ -0,0 +1,169 @@
+"""
+columnar validation of uploaded file with pandas: the whole sheet is one DataFrame, rules of CreateBook
+are checked by masks over columns, genres are split and repeated titles are found by columns too.
+csv is read by pyarrow into arrow string columns, so masks and split run in arrow compute.
+rows which masks can not accept for sure (wrong types, "2000.0", out of range years...) go through
+the same pydantic validation as upload.validate_row, so valid/invalid split and errors are the same
+as of row by row path
+"""
+import gc
+import heapq
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+from fastapi import UploadFile, HTTPException
+
+from app.dto.book import InvalidBook
+from app.handlers.upload import SUPPORTED_FORMATS, validate_row
+from app.config import COLUMNS, MIN_DATA, MAX_DATA
+
+# calamine (python-calamine из requirements.txt) читает xlsx в разы быстрее openpyxl
+EXCEL_ENGINE = 'calamine'
+
+
+# больше этого числа float теряет точность целого, такие значения проверяет pydantic
+MAX_EXACT_INT = 10 ** 15
+# целое в каноничной записи (без пробелов, "+", ведущих нулей и ".0"), меньше MAX_EXACT_INT
+CANONICAL_INT = r'0|-?[1-9][0-9]{0,14}'
+TEXT = pd.ArrowDtype(pa.string())
+
+
+def read_frame(file: UploadFile) -> Tuple[List[str], pd.DataFrame]:
+    """returns header as upload.read_header does and all rows below it (arrow strings of csv, objects of xlsx)"""
+    filename = (file.filename or '').lower()
+    if not filename.endswith(SUPPORTED_FORMATS):
+        raise HTTPException(detail={'message': 'Файл должен быть в формате .xlsx или .csv'}, status_code=400)
+    try:
+        if filename.endswith('.xlsx'):
+            frame = pd.read_excel(file.file, engine=EXCEL_ENGINE, header=None, dtype=object)
+        else:
+            # пустая ячейка в csv это None, как в upload._iter_csv
+            frame = pd.read_csv(file.file, header=None, engine='pyarrow', dtype=TEXT, keep_default_na=False,
+                                na_values=[''], encoding='utf-8-sig')
+    except pd.errors.EmptyDataError:
+        raise HTTPException(detail={'message': 'Файл пустой'}, status_code=400)
+    except Exception as e:
+        raise HTTPException(detail={'message': f'Ошибка чтения файла: {str(e)}'}, status_code=400)
+    if frame.empty:
+        raise HTTPException(detail={'message': 'Файл пустой'}, status_code=400)
+
+    header = [str(value).strip() if pd.notna(value) else None for value in frame.iloc[0]]
+    return header, frame.iloc[1:].reset_index(drop=True)
+
+
+def _is_text(column: pd.Series) -> bool:
+    return isinstance(column.dtype, pd.ArrowDtype) and pa.types.is_string(column.dtype.pyarrow_dtype)
+
+
+def _is_str(column: pd.Series) -> pd.Series:
+    # колонки csv целиком из строк, тогда тип каждой ячейки смотреть не нужно
+    if _is_text(column) or pd.api.types.infer_dtype(column, skipna=True) == 'string':
+        return column.notna()
+    return column.map(type).eq(str)
+
+
+def _ints(column: pd.Series, is_str: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    mask of cells which are int or canonical int string ("2000", not " 2000", "2000.0" or "02000")
+    and their values as nullable int column
+    """
+    if _is_text(column):
+        ok = column.str.fullmatch(CANONICAL_INT).fillna(False).astype(bool)
+        return ok, column.where(ok).astype('int64[pyarrow]')
+    numbers = pd.to_numeric(column, errors='coerce')
+    numbers = numbers.where((numbers % 1 == 0) & (numbers.abs() < MAX_EXACT_INT)).astype('Int64')
+    canonical = is_str & column.eq(numbers.astype(str).where(numbers.notna(), None))
+    if is_str.sum() == column.notna().sum():
+        ok = canonical
+    else:
+        ok = (column.map(type).eq(int) | canonical) & numbers.notna()
+    return ok, numbers.where(ok)
+
+
+def _values(column: pd.Series) -> List:
+    """python values of column, None for missing ones; arrow column is converted by arrow itself"""
+    if isinstance(column.dtype, pd.ArrowDtype):
+        return pa.array(column).to_pylist()
+    if isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+        return column.astype(object).where(column.notna(), None).tolist()
+    return column.tolist()
+
+
+def _books(frame: pd.DataFrame, years: pd.Series, prices: pd.Series) -> List[Tuple[int, Dict]]:
+    """(index of row, book as CreateBook.json) of rows which passed masks"""
+    return list(zip(frame.index, (
+        {'title': title, 'publication_year': year, 'genre': genre, 'author': author,
+         'description': description, 'cover_image': cover_image, 'price': price, 'archived': False}
+        for title, year, genre, author, description, cover_image, price in zip(
+            _values(frame['title']), _values(years[frame.index]), _values(frame['genre'].str.split(',')),
+            _values(frame['author']), _values(frame['description']), _values(frame['cover_image']),
+            _values(prices[frame.index]))
+    )))
+
+
+def _in_order(books: List[Tuple[int, Dict]], checked: Dict[int, Dict]) -> List[Dict]:
+    # книги по маскам и проверенные pydantic в порядке строк файла
+    if checked:
+        books = heapq.merge(books, checked.items(), key=lambda pair: pair[0])
+    return [book for _, book in books]
+
+
+@contextmanager
+def _gc_paused():
+    # сотни тысяч dict и list подряд запускают полный сбор мусора снова и снова, а циклов среди них нет
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def validate_frame(header: List[str], frame: pd.DataFrame) -> Tuple[List[Dict], List[InvalidBook], List[Dict]]:
+    """
+    returns (valid, invalid, duplicates) in order of rows in file, valid and invalid are the same as
+    of upload.validate_rows. duplicates are valid books whose title is already in the file above,
+    load_data would report them as duplicates of batch anyway
+    """
+    frame = frame.copy()
+    frame.columns = header
+    frame = frame[list(COLUMNS)]
+    # полностью пустые строки в конце листа не считаем книгами
+    frame = frame[frame.notna().any(axis=1)]
+
+    is_str = {name: _is_str(frame[name]) for name in COLUMNS}
+    year_ok, years = _ints(frame['publication_year'], is_str['publication_year'])
+    year_ok &= years.between(MIN_DATA, MAX_DATA).fillna(False).astype(bool)
+    price_ok, prices = _ints(frame['price'], is_str['price'])
+    price_ok |= frame['price'].isna()
+
+    passed = is_str['title'] & year_ok & is_str['genre'] & price_ok
+    for name in ('author', 'description', 'cover_image'):
+        passed &= frame[name].isna() | is_str[name]
+
+    # остальные строки проверяет pydantic, как при построчной загрузке: из них и отчет о невалидных
+    checked = {}
+    invalid = []
+    columns = list(COLUMNS)
+    rest = frame[~passed].astype(object)
+    for index, values in zip(rest.index, rest.where(rest.notna(), None).itertuples(index=False, name=None)):
+        book, invalid_book = validate_row(columns, values)
+        if book is not None:
+            checked[index] = book
+        else:
+            invalid.append(invalid_book)
+
+    # повтор названия среди валидных строк файла, первая строка остается
+    valid = passed.copy()
+    valid[list(checked)] = True
+    repeated = frame['title'].where(valid).duplicated() & valid
+
+    with _gc_paused():
+        ordered = _in_order(_books(frame[passed & ~repeated], years, prices),
+                            {index: book for index, book in checked.items() if not repeated[index]})
+        duplicates = _in_order(_books(frame[passed & repeated], years, prices),
+                               {index: book for index, book in checked.items() if repeated[index]})
+    return ordered, invalid, duplicates
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List
+
+from fastapi.responses import StreamingResponse
+
+from app.dto.export import ExportEntity, ExportFormat
+from app.db.cruds import export as export_crud
+from app.handlers.book import run_in_threadpool
+from app.handlers.price_history import naive_utc
+
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {ExportFormat.ndjson: 'application/x-ndjson', ExportFormat.csv: 'text/csv'}
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell(value):
+    # жанры через запятую, как их принимает загрузка файла
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(rows: List[Dict]) -> bytes:
+    return ''.join(json.dumps(row, default=_value, ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+def _csv(rows: List[Dict], columns: List[str], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(value) for value in row.values()])
+    return buffer.getvalue().encode()
+
+
+async def _encode(entity: ExportEntity, fmt: ExportFormat, since: datetime | None,
+                  gzip: bool) -> AsyncIterator[bytes]:
+    columns = export_crud.export_columns(entity.value)
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    rows_count = 0
+    try:
+        if fmt == ExportFormat.csv:
+            data = _csv([], columns, header=True)
+            yield compressor.compress(data) if compressor else data
+        async for rows in export_crud.stream_rows(entity.value, since):
+            # сериализация пачки в потоке, чтобы не держать event loop
+            if fmt == ExportFormat.ndjson:
+                data = await run_in_threadpool(_ndjson, rows)
+            else:
+                data = await run_in_threadpool(_csv, rows, columns, False)
+            rows_count += len(rows)
+            yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+    except Exception:
+        # статус уже отправлен, клиент увидит оборванный ответ без завершающего блока gzip
+        logger.exception('export failed', extra={'entity': entity.value, 'rows': rows_count})
+        raise
+    logger.info('export finished', extra={'entity': entity.value, 'rows': rows_count})
+
+
+async def export_data(entity: ExportEntity, fmt: ExportFormat = ExportFormat.ndjson,
+                      since: datetime | None = None, gzip: bool = False) -> StreamingResponse:
+    filename = f'{entity.value}.{fmt.value}' + ('.gz' if gzip else '')
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(_encode(entity, fmt, naive_utc(since), gzip),
+                             media_type=MEDIA_TYPES[fmt], headers=headers)
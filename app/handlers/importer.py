@@ -0,0 +1,199 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from httpx import AsyncClient, AsyncHTTPTransport, HTTPStatusError, Limits, Timeout, TransportError
+
+from app.dto.book import ConflictMode
+from app.db.cruds import import_checkpoint as checkpoint_crud
+from app.metrics import stage
+from app.handlers.validation import validate_items_async
+from app.handlers.ingest import new_report, flush_chunk, ProgressCallback
+from app.config import (LOAD_BOOKS_URL, UPLOAD_CHUNK_SIZE, IMPORT_PAGE_SIZE, IMPORT_PAGE_PARAM,
+                        IMPORT_LIMIT_PARAM, IMPORT_CONCURRENCY, IMPORT_RETRIES, IMPORT_BACKOFF,
+                        IMPORT_TIMEOUT, HTTP_MAX_CONNECTIONS)
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: AsyncClient | None = None
+
+
+def get_http_client() -> AsyncClient:
+    """one pooled client per worker, closed in lifespan of app"""
+    global _client
+    if _client is None:
+        _client = AsyncClient(
+            transport=AsyncHTTPTransport(retries=IMPORT_RETRIES),
+            limits=Limits(max_connections=HTTP_MAX_CONNECTIONS),
+            timeout=Timeout(IMPORT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def iter_json_array(chunks: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """
+    yields items of top level JSON array as soon as they arrive,
+    only one item is kept in memory
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = finished = False
+    async for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while not finished:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Ожидается JSON массив')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                finished = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            # элемент массива всегда продолжается "," или "]", иначе он может быть обрезан
+            if end >= len(buffer):
+                break
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    if not finished:
+        raise ValueError('JSON массив оборвался')
+
+
+async def _with_retries(request):
+    """retries request on network errors, 429 and 5xx with exponential backoff, broken JSON is not retried"""
+    for attempt in range(IMPORT_RETRIES + 1):
+        try:
+            return await request()
+        except (TransportError, HTTPStatusError, ValueError) as ex:
+            if isinstance(ex, HTTPStatusError):
+                retryable = ex.response.status_code in RETRY_STATUSES
+            else:
+                retryable = isinstance(ex, TransportError)
+            if not retryable or attempt == IMPORT_RETRIES:
+                raise HTTPException(
+                    detail={'message': f'Возникла ошибка во время стороннего запроса!: {ex}'}, status_code=502)
+            await asyncio.sleep(IMPORT_BACKOFF * 2 ** attempt)
+
+
+async def _import_stream(url: str, report: Dict, on_conflict: ConflictMode, position: int,
+                         on_progress: Optional[ProgressCallback] = None):
+    """source without pagination: one response, checkpoint is number of processed items"""
+    client = get_http_client()
+
+    async def request():
+        nonlocal position
+        async with client.stream('GET', url) as response:
+            response.raise_for_status()
+            # при повторе запроса пропускаем уже записанные книги
+            to_skip = position
+            batch = []
+            async for item in iter_json_array(response.aiter_text()):
+                if to_skip:
+                    to_skip -= 1
+                    continue
+                batch.append(item)
+                if len(batch) >= UPLOAD_CHUNK_SIZE:
+                    valid, invalid = await validate_items_async(batch)
+                    await flush_chunk(valid, invalid, report, on_conflict=on_conflict, on_progress=on_progress)
+                    position += len(batch)
+                    await checkpoint_crud.save_checkpoint(url, position)
+                    batch = []
+            if batch:
+                valid, invalid = await validate_items_async(batch)
+                await flush_chunk(valid, invalid, report, on_conflict=on_conflict, on_progress=on_progress)
+
+    await _with_retries(request)
+
+
+async def _fetch_page(url: str, page: int) -> List[Any]:
+    client = get_http_client()
+
+    async def request():
+        params = {IMPORT_PAGE_PARAM: page, IMPORT_LIMIT_PARAM: IMPORT_PAGE_SIZE}
+        with stage('fetch') as timer:
+            async with client.stream('GET', url, params=params) as response:
+                response.raise_for_status()
+                items = [item async for item in iter_json_array(response.aiter_text())]
+            timer.rows = len(items)
+        return items
+
+    return await _with_retries(request)
+
+
+async def _import_pages(url: str, report: Dict, on_conflict: ConflictMode, done_pages: int,
+                        on_progress: Optional[ProgressCallback] = None):
+    """
+    source with pagination: IMPORT_CONCURRENCY pages are fetched and written at once,
+    checkpoint is the last page before which all pages are written
+    """
+    next_page = done_pages + 1
+    last_page = None
+    completed = set()
+    lock = asyncio.Lock()
+
+    async def worker():
+        nonlocal next_page, last_page, done_pages
+        while last_page is None or next_page <= last_page:
+            page = next_page
+            next_page += 1
+            items = await _fetch_page(url, page)
+            if len(items) < IMPORT_PAGE_SIZE:
+                last_page = page if last_page is None else min(last_page, page)
+            if items:
+                valid, invalid = await validate_items_async(items)
+                await flush_chunk(valid, invalid, report, on_conflict=on_conflict, on_progress=on_progress)
+
+            async with lock:
+                completed.add(page)
+                advanced = done_pages + 1 in completed
+                while done_pages + 1 in completed:
+                    done_pages += 1
+                    completed.discard(done_pages)
+                if advanced:
+                    await checkpoint_crud.save_checkpoint(url, done_pages)
+
+    workers = [asyncio.create_task(worker()) for _ in range(IMPORT_CONCURRENCY)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+
+
+async def import_books(on_conflict: ConflictMode = ConflictMode.skip, restart: bool = False,
+                       url: str = LOAD_BOOKS_URL, on_progress: Optional[ProgressCallback] = None) -> Dict:
+    """
+    imports books from third party api chunk by chunk. if previous import of url was interrupted
+    it continues from saved checkpoint, restart=True starts from the beginning
+    """
+    position = 0 if restart else await checkpoint_crud.get_checkpoint(url)
+    report = new_report()
+    report['resumed_from'] = position
+
+    if IMPORT_PAGE_SIZE:
+        await _import_pages(url, report, on_conflict, position, on_progress)
+    else:
+        await _import_stream(url, report, on_conflict, position, on_progress)
+
+    await checkpoint_crud.delete_checkpoint(url)
+    return report
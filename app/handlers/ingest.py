@@ -0,0 +1,52 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.dto.book import ConflictMode
+from app.db.uow import UnitOfWork
+from app.db.cruds import book as book_crud
+from app.db.cruds import price_history as history_crud
+from app.config import UPLOAD_REPORT_LIMIT
+
+
+# вызывается после каждой записанной пачки с текущим отчетом, так фоновые задачи обновляют прогресс
+ProgressCallback = Callable[[Dict], Awaitable[None]]
+
+
+REPORT_COUNTERS = ('parsed_count', 'valid_count', 'loaded_count', 'updated_count', 'duplicate_count', 'invalid_count')
+
+
+def new_report() -> Dict:
+    return {'parsed_count': 0, 'valid_count': 0, 'loaded_count': 0, 'updated_count': 0, 'invalid_count': 0, 'duplicate_count': 0,
+            'invalid_books': [], 'duplicates': []}
+
+
+def report_counters(report: Dict) -> Dict:
+    return {key: report[key] for key in REPORT_COUNTERS}
+
+
+def _extend_limited(target: list, items: list, limit: int = UPLOAD_REPORT_LIMIT):
+    # в отчет попадают только первые строки, иначе он растет вместе с файлом
+    target.extend(items[:max(limit - len(target), 0)])
+
+
+async def flush_chunk(valid: List[Dict], invalid: List, report: Dict,
+                      on_conflict: ConflictMode = ConflictMode.skip,
+                      on_progress: Optional[ProgressCallback] = None):
+    """
+    writes validated chunk of books and their price history in one transaction
+    and adds counters of chunk to report
+    """
+    if valid:
+        async with UnitOfWork() as uow:
+            information = await book_crud.load_data(valid, on_conflict=on_conflict, session=uow.session)
+            await history_crud.create_many_history(information['price_changes'], session=uow.session)
+        report['loaded_count'] += len(information['valid_books'])
+        report['updated_count'] += len(information['updated_books'])
+        report['duplicate_count'] += len(information['duplicate_books'])
+        _extend_limited(report['duplicates'], information['duplicate_books'])
+
+    report['parsed_count'] += len(valid) + len(invalid)
+    report['valid_count'] += len(valid)
+    report['invalid_count'] += len(invalid)
+    _extend_limited(report['invalid_books'], invalid)
+    if on_progress is not None:
+        await on_progress(report)
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+from typing import AsyncIterator, Dict
+from uuid import UUID
+
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+
+from app.dto.book import ConflictMode
+from app.db.cruds import import_job as job_crud
+from app.db.cruds import book as book_crud
+from app.db.cruds import price_history as history_crud
+from app.handlers.book import stream_file, check_digest, run_in_threadpool
+from app.handlers.importer import import_books
+from app.handlers.upload import SUPPORTED_FORMATS
+from app.config import (JOB_PAYLOAD_CHUNK_SIZE, JOB_POLL_INTERVAL, JOB_HEARTBEAT_INTERVAL, PURGE_AFTER_DAYS,
+                        PURGE_BATCH_SIZE, PURGE_PAUSE, PURGE_EVERY, PRICE_HISTORY_PARTITIONS_AHEAD,
+                        PRICE_HISTORY_RETENTION_MONTHS, PRICE_HISTORY_MAINTENANCE_EVERY)
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobLost(Exception):
+    """job was taken by another worker (this one missed heartbeats), it is not changed any more"""
+
+
+async def _chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    await file.seek(0)
+    while data := await file.read(JOB_PAYLOAD_CHUNK_SIZE):
+        yield data
+
+
+async def submit_upload(file: UploadFile, on_conflict: ConflictMode = ConflictMode.skip, force: bool = False):
+    """
+    saves file to database together with job, the job is run by any worker.
+    already imported file is answered at once without job
+    """
+    suffix = os.path.splitext((file.filename or '').lower())[1]
+    if suffix not in SUPPORTED_FORMATS:
+        raise HTTPException(detail={'message': 'Файл должен быть в формате .xlsx или .csv'}, status_code=400)
+    _, imported = await check_digest(file, on_conflict, force)
+    if imported is not None:
+        return imported
+    job = await job_crud.create_job('upload', {'filename': file.filename, 'on_conflict': on_conflict.value,
+                                               'force': force}, payload=_chunks(file))
+    return {'job_id': job.id, 'status': job.status}
+
+
+async def submit_loading(on_conflict: ConflictMode = ConflictMode.skip, restart: bool = False) -> Dict:
+    job = await job_crud.create_job('loading', {'on_conflict': on_conflict.value, 'restart': restart})
+    return {'job_id': job.id, 'status': job.status}
+
+
+async def submit_purge(older_than_days: int = PURGE_AFTER_DAYS) -> Dict:
+    if older_than_days < 0:
+        raise HTTPException(detail={'message': 'older_than_days не может быть отрицательным'}, status_code=400)
+    job = await job_crud.create_job('purge', {'older_than_days': older_than_days})
+    return {'job_id': job.id, 'status': job.status}
+
+
+async def submit_history_maintenance(months_ahead: int = PRICE_HISTORY_PARTITIONS_AHEAD,
+                                     retention_months: int = PRICE_HISTORY_RETENTION_MONTHS) -> Dict:
+    if months_ahead < 0 or retention_months < 0:
+        raise HTTPException(detail={'message': 'months_ahead и retention_months не могут быть отрицательными'},
+                            status_code=400)
+    job = await job_crud.create_job('history_maintenance', {'months_ahead': months_ahead,
+                                                            'retention_months': retention_months})
+    return {'job_id': job.id, 'status': job.status}
+
+
+async def show_job(job_id: UUID) -> Dict:
+    job = await job_crud.get_job(job_id)
+    return {
+        'job_id': job.id, 'kind': job.kind, 'status': job.status, 'attempts': job.attempts,
+        'progress': job.progress, 'result': job.result, 'error': job.error,
+        'created_at': job.created_at, 'started_at': job.started_at, 'finished_at': job.finished_at,
+    }
+
+
+async def _run_upload(params: Dict, on_progress) -> Dict:
+    # файл задачи из базы во временный файл этого воркера, в памяти только один кусок
+    with tempfile.TemporaryFile() as file:
+        async for data in job_crud.iter_payload(params['job_id']):
+            await run_in_threadpool(file.write, data)
+        file.seek(0)
+        report = await stream_file(UploadFile(file=file, filename=params['filename']),
+                                   on_conflict=ConflictMode(params['on_conflict']), on_progress=on_progress,
+                                   force=params.get('force', False))
+    # файл успели загрузить раньше, это не ошибка задачи
+    if isinstance(report, JSONResponse) and report.status_code == 200:
+        return json.loads(report.body)
+    if isinstance(report, JSONResponse):
+        raise HTTPException(detail=json.loads(report.body), status_code=report.status_code)
+    return report
+
+
+async def _run_loading(params: Dict, on_progress) -> Dict:
+    # после первой попытки продолжаем с чекпоинта, а не с начала
+    return await import_books(on_conflict=ConflictMode(params['on_conflict']),
+                              restart=params['restart'] and params['attempts'] == 1,
+                              on_progress=on_progress)
+
+
+async def _run_purge(params: Dict, on_progress) -> Dict:
+    """
+    deletes long archived books batch by batch, every batch is its own short transaction
+    and pause between them lets other writers take locks
+    """
+    older_than = timedelta(days=params['older_than_days'])
+    report = {'purged_count': 0, 'history_count': 0, 'batch_count': 0}
+    while True:
+        batch = await book_crud.purge_archived(older_than, batch_size=PURGE_BATCH_SIZE)
+        report['purged_count'] += batch['books']
+        report['history_count'] += batch['history']
+        report['batch_count'] += 1
+        await on_progress(report)
+        # неполная пачка: старых архивных книг больше нет или остальные заняты, их удалит следующий запуск
+        if batch['books'] < PURGE_BATCH_SIZE:
+            return report
+        await asyncio.sleep(PURGE_PAUSE)
+
+
+async def _run_history_maintenance(params: Dict, on_progress) -> Dict:
+    """
+    creates partitions of price_history ahead, so rows never go to DEFAULT partition (rows which got there
+    while job was not running are moved to their month), then compacts partitions older than retention
+    into daily summaries (retention 0 keeps them)
+    """
+    partitions = await history_crud.create_partitions(params['months_ahead'])
+    report = {'created_count': partitions['created'], 'default_count': partitions['default_rows'],
+              'compacted_count': 0, 'history_count': 0, 'day_count': 0, 'dropped': [], 'skipped': []}
+    if partitions['default_rows']:
+        logger.warning('%s rows of price_history are in DEFAULT partition', partitions['default_rows'])
+    await on_progress(report)
+    if params['retention_months'] > 0:
+        rollup = await history_crud.rollup_partitions(params['retention_months'])
+        report.update(compacted_count=rollup['partitions'], history_count=rollup['rows'],
+                      day_count=rollup['days'], dropped=rollup['dropped'], skipped=rollup['skipped'])
+    return report
+
+
+RUNNERS = {'upload': _run_upload, 'loading': _run_loading, 'purge': _run_purge,
+           'history_maintenance': _run_history_maintenance}
+
+
+async def _heartbeat(job_id: UUID, lease: UUID):
+    # пачка может писаться дольше JOB_STALE_AFTER, поэтому heartbeat идет отдельно от прогресса
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            if not await job_crud.update_progress(job_id, lease):
+                logger.warning('job %s was taken by another worker', job_id)
+                return
+        except Exception as ex:
+            logger.warning('heartbeat of job %s failed: %s', job_id, ex)
+
+
+async def run_job(job: Dict):
+    job_id, lease = job['id'], job['lease']
+    params = {**job['params'], 'attempts': job['attempts'], 'job_id': job_id}
+    started = time.monotonic()
+
+    async def on_progress(report: Dict):
+        # счетчики отчета любой задачи, скорость по разобранным (или удаленным) строкам
+        progress = {key: value for key, value in report.items() if key.endswith('_count')}
+        rows = report.get('parsed_count', report.get('purged_count', 0))
+        elapsed = time.monotonic() - started
+        progress['elapsed'] = round(elapsed, 3)
+        progress['rows_per_second'] = round(rows / elapsed, 1) if elapsed else None
+        # задачу забрал другой воркер - эта копия останавливается на ближайшей пачке
+        if not await job_crud.update_progress(job_id, lease, progress):
+            raise JobLost(job_id)
+
+    heartbeat = asyncio.create_task(_heartbeat(job_id, lease))
+    try:
+        report = await RUNNERS[job['kind']](params, on_progress)
+        await on_progress(report)
+        result = jsonable_encoder(report)
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        if not await job_crud.finish_job(job_id, lease, result):
+            logger.warning('job %s was taken by another worker, its result is dropped', job_id)
+    except asyncio.CancelledError:
+        # воркер останавливается - возвращаем задачу в очередь, ее продолжит другой
+        await asyncio.shield(job_crud.fail_job(job_id, lease, 'Воркер остановлен', retry=True))
+        raise
+    except JobLost:
+        logger.warning('job %s was taken by another worker, it is stopped here', job_id)
+    except Exception as ex:
+        detail = ex.detail if isinstance(ex, HTTPException) else str(ex)
+        error = detail.get('message', str(detail)) if isinstance(detail, dict) else str(detail)
+        logger.exception('job %s failed', job_id)
+        await job_crud.fail_job(job_id, lease, error)
+    finally:
+        heartbeat.cancel()
+
+
+async def job_worker(poll_interval: float = JOB_POLL_INTERVAL):
+    """one slot of worker pool: takes jobs one by one while there are any, otherwise polls the queue"""
+    while True:
+        try:
+            job = await job_crud.claim_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warning('claiming of job failed: %s', ex)
+            job = None
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        # не записался итог (например, база недоступна) - слот продолжает работать,
+        # задачу без heartbeat потом заберет другой воркер как зависшую
+        try:
+            await run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('job %s was not finished', job['id'])
+            await asyncio.sleep(poll_interval)
+
+
+async def job_scheduler(kind: str, every: float, params: Dict):
+    """queues job of kind every `every` hours unless there was one, the job is run by any job worker"""
+    while True:
+        try:
+            await job_crud.schedule_job(kind, params, timedelta(hours=every))
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warning('scheduling of %s failed: %s', kind, ex)
+        await asyncio.sleep(every * 3600)
+
+
+def scheduled_jobs():
+    """schedulers of periodic jobs turned on in config, for lifespan of app and for app.worker"""
+    jobs = [('purge', PURGE_EVERY, {'older_than_days': PURGE_AFTER_DAYS}),
+            ('history_maintenance', PRICE_HISTORY_MAINTENANCE_EVERY,
+             {'months_ahead': PRICE_HISTORY_PARTITIONS_AHEAD, 'retention_months': PRICE_HISTORY_RETENTION_MONTHS})]
+    return [job_scheduler(kind, every, params) for kind, every, params in jobs if every > 0]
@@ -1,9 +1,46 @@
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Dict
 from uuid import UUID
-from app.dto.price_history import PriceHistoryShow
+
+from fastapi import HTTPException
+
+from app.dto.price_history import PriceHistoryShow, PriceStatsShow, PriceSeries, SeriesInterval
 
 from app.db.cruds import price_history as history_cruds
 
 
-async def show_history_book(book_id: UUID, lim: int, offset: int) -> List[PriceHistoryShow]:
-    return await history_cruds.get_history_book(book_id=book_id, lim=lim, offset=offset)
+def naive_utc(value: datetime | None) -> datetime | None:
+    # created_at хранится без часового пояса, в UTC
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _time_range(date_from: datetime | None, date_to: datetime | None):
+    date_from, date_to = naive_utc(date_from), naive_utc(date_to)
+    if date_from is not None and date_to is not None and date_from >= date_to:
+        raise HTTPException(detail={'message': 'from должен быть раньше to'}, status_code=400)
+    return date_from, date_to
+
+
+async def show_history_book(book_id: UUID, lim: int, offset: int, cursor: str = None,
+                            date_from: datetime | None = None,
+                            date_to: datetime | None = None) -> List[PriceHistoryShow] | Dict:
+    date_from, date_to = _time_range(date_from, date_to)
+    return await history_cruds.get_history_book(book_id=book_id, lim=lim, offset=offset, cursor=cursor,
+                                                date_from=date_from, date_to=date_to)
+
+
+async def show_price_stats(book_id: UUID, date_from: datetime | None = None,
+                           date_to: datetime | None = None) -> PriceStatsShow:
+    date_from, date_to = _time_range(date_from, date_to)
+    return PriceStatsShow(**await history_cruds.get_price_stats(book_id=book_id, date_from=date_from,
+                                                                date_to=date_to))
+
+
+async def show_price_series(book_id: UUID, interval: SeriesInterval = SeriesInterval.day,
+                            date_from: datetime | None = None, date_to: datetime | None = None) -> PriceSeries:
+    date_from, date_to = _time_range(date_from, date_to)
+    bars = await history_cruds.get_price_series(book_id=book_id, interval=interval,
+                                                date_from=date_from, date_to=date_to)
+    return PriceSeries(book_id=book_id, interval=interval, bars=bars)
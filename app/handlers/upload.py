@@ -0,0 +1,111 @@
+import csv
+import io
+from itertools import islice
+from typing import Any, Iterator, List, Sequence, Tuple, Dict
+
+from fastapi import UploadFile, HTTPException
+from openpyxl import load_workbook
+from pydantic import ValidationError
+
+from app.dto.book import CreateBook, InvalidBook
+from app.config import COLUMNS
+
+
+SUPPORTED_FORMATS = ('.xlsx', '.csv')
+
+
+def _iter_xlsx(file) -> Iterator[Sequence]:
+    # read_only режим читает лист построчно и не держит всю книгу в памяти
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def _iter_csv(file) -> Iterator[Sequence]:
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.reader(text):
+            # пустая ячейка в csv это пустая строка, в xlsx это None
+            yield [value if value != '' else None for value in row]
+    finally:
+        text.detach()
+
+
+def open_rows(file: UploadFile) -> Iterator[Sequence]:
+    """
+    returns lazy iterator over rows of uploaded file, first row is header
+    """
+    filename = (file.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        return _iter_xlsx(file.file)
+    if filename.endswith('.csv'):
+        return _iter_csv(file.file)
+    raise HTTPException(detail={'message': 'Файл должен быть в формате .xlsx или .csv'}, status_code=400)
+
+
+def read_header(rows: Iterator[Sequence]) -> List[str]:
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise HTTPException(detail={'message': 'Файл пустой'}, status_code=400)
+    except Exception as e:
+        raise HTTPException(detail={'message': f'Ошибка чтения файла: {str(e)}'}, status_code=400)
+    return [str(value).strip() if value is not None else None for value in header]
+
+
+def read_chunk(rows: Iterator[Sequence], size: int) -> List[Sequence]:
+    try:
+        return list(islice(rows, size))
+    except Exception as e:
+        raise HTTPException(detail={'message': f'Ошибка чтения файла: {str(e)}'}, status_code=400)
+
+
+def columns_are_valid(columns: Sequence) -> bool:
+    # повтор колонки множество не заметит: построчно взялась бы последняя, в DataFrame - обе
+    return len(columns) == len(set(columns)) and set(COLUMNS.keys()) == set(columns)
+
+
+def validate_row(header: Sequence[str], row: Sequence) -> Tuple[Dict | None, InvalidBook | None]:
+    """
+    maps row on header and validates it, returns (valid book, None) or (None, invalid book)
+    """
+    book = {column: None for column in COLUMNS}
+    book.update({column: value for column, value in zip(header, row) if column in COLUMNS})
+
+    if isinstance(book['genre'], str):
+        book['genre'] = book['genre'].split(',')
+
+    try:
+        return CreateBook(**book).json(), None
+    except ValidationError as ex:
+        return None, InvalidBook(**book, error=str(ex))
+
+
+def validate_rows(header: Sequence[str], rows: Sequence[Sequence]) -> Tuple[List[Dict], List[InvalidBook]]:
+    valid = []
+    invalid = []
+    for row in rows:
+        # полностью пустые строки в конце листа не считаем книгами
+        if all(value is None for value in row):
+            continue
+        book, invalid_book = validate_row(header, row)
+        if book is not None:
+            valid.append(book)
+        else:
+            invalid.append(invalid_book)
+    return valid, invalid
+
+
+def validate_items(items: List[Any]) -> Tuple[List[Dict], List[Any]]:
+    """validates books from third party api, invalid ones are returned as they came"""
+    valid = []
+    invalid = []
+    for book in items:
+        try:
+            valid.append(CreateBook(**book).json())
+        except (ValidationError, TypeError):
+            invalid.append(book)
+    return valid, invalid
@@ -0,0 +1,74 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from app.metrics import stage
+from app.handlers.upload import validate_rows, validate_items
+from app.config import VALIDATION_WORKERS, VALIDATION_PARALLEL_MIN, VALIDATION_BATCH_SIZE
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_validation_pool(workers: int = VALIDATION_WORKERS) -> ProcessPoolExecutor:
+    """one pool per worker, closed in lifespan of app"""
+    global _pool
+    if _pool is None:
+        # spawn: fork процесса с запущенным event loop и открытыми соединениями небезопасен
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def close_validation_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _batches(items: Sequence, size: int) -> List[Sequence]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _in_pool(func: Callable, args: Tuple, items: Sequence, workers: int,
+                   batch_size: int) -> Tuple[List, List]:
+    """
+    pure cpu pydantic validation: batches go to processes, event loop only waits.
+    result keeps order of items as with serial validation
+    """
+    if workers <= 0 or len(items) < VALIDATION_PARALLEL_MIN:
+        return func(*args, items)
+
+    loop = asyncio.get_running_loop()
+    pool = get_validation_pool(workers)
+    # пачек не меньше числа процессов, чтобы занять их все
+    size = max(min(batch_size, -(-len(items) // workers)), 1)
+    try:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, func, *args, batch)
+                                         for batch in _batches(items, size)))
+    except BrokenProcessPool:
+        # упавший процесс ломает весь пул, следующий вызов создаст новый
+        close_validation_pool()
+        raise
+    valid = []
+    invalid = []
+    for batch_valid, batch_invalid in results:
+        valid.extend(batch_valid)
+        invalid.extend(batch_invalid)
+    return valid, invalid
+
+
+async def validate_rows_async(header: Sequence[str], rows: Sequence[Sequence], workers: int = VALIDATION_WORKERS,
+                              batch_size: int = VALIDATION_BATCH_SIZE) -> Tuple[List[Dict], List]:
+    """the same split as upload.validate_rows"""
+    with stage('validate', rows=len(rows)):
+        return await _in_pool(validate_rows, (header,), rows, workers, batch_size)
+
+
+async def validate_items_async(items: List[Any], workers: int = VALIDATION_WORKERS,
+                               batch_size: int = VALIDATION_BATCH_SIZE) -> Tuple[List[Dict], List]:
+    """the same split as upload.validate_items"""
+    with stage('validate', rows=len(items)):
+        return await _in_pool(validate_items, (), items, workers, batch_size)
@@ -1,13 +1,51 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from app.cache import book_cache, listen_invalidations
+from app.handlers.importer import close_http_client
+from app.handlers.job import job_worker, scheduled_jobs
+from app.handlers.validation import close_validation_pool
 from app.routers.routers import main_api_router
+from app.log import setup_logging
+from app.metrics import MetricsMiddleware, metrics_endpoint
+from app.config import JOB_WORKERS
+
+
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = asyncio.create_task(listen_invalidations()) if book_cache.enabled else None
+    # ограниченный пул фоновых задач: не больше JOB_WORKERS импортов на воркер
+    job_workers = [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+    schedulers = [asyncio.create_task(scheduler) for scheduler in scheduled_jobs()]
+    yield
+    if listener:
+        listener.cancel()
+    for task in schedulers:
+        task.cancel()
+    for task in job_workers:
+        task.cancel()
+    # прерванные задачи возвращаются в очередь
+    await asyncio.gather(*job_workers, *schedulers, *([listener] if listener else []), return_exceptions=True)
+    await close_http_client()
+    close_validation_pool()
+
 
 app = FastAPI(
-    title="Library"
+    title="Library",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+app.add_middleware(MetricsMiddleware)
 app.include_router(main_api_router)
+app.add_route('/metrics', metrics_endpoint, include_in_schema=False)
 
 if __name__ == '__main__':
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,165 @@
+"""
+prometheus metrics of app. with gunicorn set PROMETHEUS_MULTIPROC_DIR (see run.sh and gunicorn.conf.py),
+then every worker writes its values to files of this dir and /metrics sums all workers
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.config import SLOW_QUERY_MS
+
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'route'])
+HTTP_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests being handled now',
+                         multiprocess_mode='livesum')
+
+CRUD_LATENCY = Histogram('crud_duration_seconds', 'Latency of crud functions', ['function', 'outcome'])
+CRUD_ROWS = Counter('crud_rows_total', 'Rows returned or written by crud functions', ['function'])
+
+SQL_LATENCY = Histogram('db_statement_duration_seconds', 'Latency of SQL statements', ['operation'])
+SQL_ERRORS = Counter('db_statement_errors_total', 'Failed SQL statements', ['operation'])
+
+COALESCE_REQUESTS = Counter('coalesce_requests_total', 'Requests of coalesced routes: hit, stale, coalesced or miss',
+                            ['route', 'outcome'])
+
+STAGE_LATENCY = Histogram('import_stage_duration_seconds', 'Stages of import pipeline', ['stage'])
+STAGE_ROWS = Counter('import_stage_rows_total', 'Rows passed through stages of import pipeline', ['stage'])
+
+# первое слово запроса, остальное в одну метку, чтобы не плодить серии
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK'}
+
+
+def _default_rows(result: Any) -> int:
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def instrument(rows: Optional[Callable[[Any], int]] = None):
+    """decorator of async crud function: latency by outcome and number of rows of result"""
+    count_rows = rows or _default_rows
+
+    def decorator(func):
+        name = f'{func.__module__.rsplit(".", 1)[-1]}.{func.__name__}'
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = await func(*args, **kwargs)
+                outcome = 'ok'
+            finally:
+                CRUD_LATENCY.labels(name, outcome).observe(time.perf_counter() - start)
+            if not isinstance(result, Response):
+                # ошибка подсчета строк не должна превращать успешный вызов в 500 или откат записи
+                try:
+                    CRUD_ROWS.labels(name).inc(count_rows(result))
+                except Exception:
+                    logger.exception('counting rows of %s failed', name)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class StageTimer:
+    rows = 0
+
+
+@contextmanager
+def stage(name: str, rows: int = 0):
+    """times stage of import pipeline, rows can be set on timer when they are known only after stage"""
+    timer = StageTimer()
+    timer.rows = rows
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - start)
+        STAGE_ROWS.labels(name).inc(timer.rows)
+
+
+def _operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return operation if operation in SQL_OPERATIONS else 'OTHER'
+
+
+def instrument_engine(engine: AsyncEngine):
+    """times every statement of engine, slow ones are logged"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        SQL_LATENCY.labels(_operation(statement)).observe(elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning('slow statement', extra={'duration_ms': round(elapsed * 1000, 2),
+                                                    'statement': statement[:1000], 'executemany': executemany})
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+        SQL_ERRORS.labels(_operation(context.statement or '')).inc()
+
+
+class MetricsMiddleware:
+    """
+    pure ASGI middleware: latency and status of every request by route template,
+    so /books/{book_id} is one series and not one per book
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # /metrics добавлен через add_route и не кладет route в scope, поэтому исключаем его по пути
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        HTTP_IN_PROGRESS.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            path = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_LATENCY.labels(scope['method'], path).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(scope['method'], path, str(status)).inc()
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,104 @@
+"""Price stats summary table maintained by triggers
+
+Revision ID: 2d6f0b8e4c17
+Revises: 7b2e5d9f1a36
+Create Date: 2026-10-18 15:07:31.402518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d6f0b8e4c17'
+down_revision: Union[str, None] = '7b2e5d9f1a36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# одна агрегация на statement: bulk insert истории обновляет каждую книгу один раз
+AFTER_INSERT = """
+CREATE OR REPLACE FUNCTION price_stats_after_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO price_stats AS s (book_id, current_price, min_price, max_price, price_sum,
+                                  change_count, first_change_at, last_change_at)
+    SELECT book_id, (array_agg(price ORDER BY created_at DESC, id DESC))[1],
+           min(price), max(price), sum(price), count(*), min(created_at), max(created_at)
+    FROM new_rows
+    GROUP BY book_id
+    ON CONFLICT (book_id) DO UPDATE SET
+        current_price = CASE WHEN excluded.last_change_at >= s.last_change_at
+                             THEN excluded.current_price ELSE s.current_price END,
+        min_price = least(s.min_price, excluded.min_price),
+        max_price = greatest(s.max_price, excluded.max_price),
+        price_sum = s.price_sum + excluded.price_sum,
+        change_count = s.change_count + excluded.change_count,
+        first_change_at = least(s.first_change_at, excluded.first_change_at),
+        last_change_at = greatest(s.last_change_at, excluded.last_change_at),
+        updated_at = now();
+    RETURN NULL;
+END
+$$;
+"""
+
+# min/max нельзя вычесть, после удаления книги пересчитываются по индексу (book_id, created_at, id)
+AFTER_DELETE = """
+CREATE OR REPLACE FUNCTION price_stats_after_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM price_stats WHERE book_id IN (SELECT book_id FROM old_rows);
+    INSERT INTO price_stats (book_id, current_price, min_price, max_price, price_sum,
+                             change_count, first_change_at, last_change_at)
+    SELECT book_id, (array_agg(price ORDER BY created_at DESC, id DESC))[1],
+           min(price), max(price), sum(price), count(*), min(created_at), max(created_at)
+    FROM price_history
+    WHERE book_id IN (SELECT book_id FROM old_rows)
+    GROUP BY book_id;
+    RETURN NULL;
+END
+$$;
+"""
+
+BACKFILL = """
+INSERT INTO price_stats (book_id, current_price, min_price, max_price, price_sum,
+                         change_count, first_change_at, last_change_at)
+SELECT book_id, (array_agg(price ORDER BY created_at DESC, id DESC))[1],
+       min(price), max(price), sum(price), count(*), min(created_at), max(created_at)
+FROM price_history
+GROUP BY book_id
+"""
+
+
+def upgrade() -> None:
+    op.create_table('price_stats',
+    sa.Column('book_id', sa.UUID(), nullable=False),
+    sa.Column('current_price', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Integer(), nullable=False),
+    sa.Column('max_price', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.BigInteger(), nullable=False),
+    sa.Column('change_count', sa.Integer(), nullable=False),
+    sa.Column('first_change_at', sa.DateTime(), nullable=False),
+    sa.Column('last_change_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.execute(AFTER_INSERT)
+    op.execute(AFTER_DELETE)
+    # CREATE TRIGGER блокирует вставки в price_history до конца миграции,
+    # поэтому backfill ниже не пропустит и не посчитает дважды ни одной строки
+    op.execute('CREATE TRIGGER price_stats_after_insert AFTER INSERT ON price_history '
+               'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION price_stats_after_insert()')
+    op.execute('CREATE TRIGGER price_stats_after_delete AFTER DELETE ON price_history '
+               'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION price_stats_after_delete()')
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS price_stats_after_delete ON price_history')
+    op.execute('DROP TRIGGER IF EXISTS price_stats_after_insert ON price_history')
+    op.execute('DROP FUNCTION IF EXISTS price_stats_after_delete()')
+    op.execute('DROP FUNCTION IF EXISTS price_stats_after_insert()')
+    op.drop_table('price_stats')
@@ -0,0 +1,64 @@
+"""Search indexes and full text search column
+
+search_vector is STORED generated column: add_column rewrites the whole books table
+under ACCESS EXCLUSIVE lock, reads and writes of books wait for it. on large table
+run it in maintenance window. indexes are built concurrently after it
+
+Revision ID: 3f7d8e2a9c51
+Revises: 9e1b2c7a4d10
+Create Date: 2026-10-18 11:03:27.904412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7d8e2a9c51'
+down_revision: Union[str, None] = '9e1b2c7a4d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# конфигурация зафиксирована в миграции, а не берется из app.config.SEARCH_CONFIG: миграция должна
+# создавать ту же колонку при любом конфиге. другая конфигурация - новая миграция search_vector
+SEARCH_CONFIG = 'simple'
+SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(author, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'C')"
+)
+
+# publication_year покрыт ix_books_publication_year_id из 9e1b2c7a4d10
+INDEXES = [
+    ('ix_books_genre', ['genre'], {'postgresql_using': 'gin'}),
+    ('ix_books_title_trgm', ['title'], {'postgresql_using': 'gin', 'postgresql_ops': {'title': 'gin_trgm_ops'}}),
+    ('ix_books_author_trgm', ['author'], {'postgresql_using': 'gin', 'postgresql_ops': {'author': 'gin_trgm_ops'}}),
+    ('ix_books_description_trgm', ['description'],
+     {'postgresql_using': 'gin', 'postgresql_ops': {'description': 'gin_trgm_ops'}}),
+    ('ix_books_author', ['author'], {}),
+    ('ix_books_price', ['price'], {}),
+    ('ix_books_search_vector', ['search_vector'], {'postgresql_using': 'gin'}),
+]
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('books', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                     sa.Computed(SEARCH_VECTOR, persisted=True), nullable=True))
+
+    with op.get_context().autocommit_block():
+        for name, columns, kwargs in INDEXES:
+            op.create_index(name, 'books', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True, **kwargs)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='books', postgresql_concurrently=True, if_exists=True)
+
+    op.drop_column('books', 'search_vector')
@@ -0,0 +1,206 @@
+"""Monthly partitions of price_history, UUIDv7 ids and daily rollup table
+
+Revision ID: 4f8a2c6e1b93
+Revises: b7d2e8f4a619
+Create Date: 2026-10-18 21:26:48.731054
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f8a2c6e1b93'
+down_revision: Union[str, None] = 'b7d2e8f4a619'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# 48 бит времени в миллисекундах поверх случайного uuid4 и версия 7 вместо 4 (RFC 9562), как app.db.ids.uuid7
+UUID_V7 = """
+CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid LANGUAGE plpgsql VOLATILE AS $$
+DECLARE
+    value bytea := uuid_send(gen_random_uuid());
+BEGIN
+    value := overlay(value PLACING substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint)
+                                             FROM 3)
+                     FROM 1 FOR 6);
+    value := set_bit(set_bit(value, 52, 1), 53, 1);
+    RETURN encode(value, 'hex')::uuid;
+END
+$$;
+"""
+
+# секции price_history_YYYY_MM от текущего месяца на months_ahead вперед, уже существующие пропускает.
+# месяцы до границы legacy покрыты секцией price_history_legacy, postgres отвечает на них overlap.
+# месяц, строки которого уже попали в DEFAULT (job не работал), postgres не дает создать секцией:
+# строки переносятся в новую таблицу, и она подключается секцией. ошибка одного месяца не останавливает
+# остальные, она в WARNING, а строки остаются в DEFAULT до следующего запуска
+CREATE_PARTITIONS = """
+CREATE OR REPLACE FUNCTION price_history_create_partitions(months_ahead integer) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month date := date_trunc('month', now())::date;
+    next_month date;
+    created integer := 0;
+    moved bigint;
+    name text;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        name := format('price_history_%s', to_char(month, 'YYYY_MM'));
+        next_month := (month + interval '1 month')::date;
+        IF to_regclass(name) IS NULL THEN
+            BEGIN
+                EXECUTE format('CREATE TABLE %I PARTITION OF price_history FOR VALUES FROM (%L) TO (%L)',
+                               name, month, next_month);
+                created := created + 1;
+            EXCEPTION
+                WHEN invalid_object_definition THEN
+                    -- месяц покрыт секцией price_history_legacy
+                    NULL;
+                WHEN check_violation THEN
+                    BEGIN
+                        EXECUTE format('CREATE TABLE %I (LIKE price_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                                       name);
+                        EXECUTE format('WITH moved AS (DELETE FROM price_history_default '
+                                       'WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                                       'INSERT INTO %I SELECT * FROM moved', month, next_month, name);
+                        GET DIAGNOSTICS moved = ROW_COUNT;
+                        EXECUTE format('ALTER TABLE price_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                       name, month, next_month);
+                        created := created + 1;
+                        RAISE NOTICE 'partition % took % rows from price_history_default', name, moved;
+                    EXCEPTION WHEN OTHERS THEN
+                        RAISE WARNING 'partition % was not created: %', name, SQLERRM;
+                    END;
+            END;
+        END IF;
+        month := next_month;
+    END LOOP;
+    RETURN created;
+END
+$$;
+"""
+
+STATS_TRIGGERS = [
+    'CREATE TRIGGER price_stats_after_insert AFTER INSERT ON price_history '
+    'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION price_stats_after_insert()',
+    'CREATE TRIGGER price_stats_after_delete AFTER DELETE ON price_history '
+    'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION price_stats_after_delete()',
+]
+
+# (индекс price_history, его имя после переименования таблицы в legacy)
+LEGACY_INDEXES = [
+    ('ix_price_history_book_id_created_at_id', 'price_history_legacy_book_id_created_at_id_idx'),
+    ('ix_price_history_created_at_brin', 'price_history_legacy_created_at_brin_idx'),
+]
+
+PARTITIONS_AHEAD = 3
+
+
+def _legacy_bound() -> date:
+    # первое число через месяц: до него строки пишутся в legacy, дальше в месячные секции
+    today = date.today()
+    month = today.month + 1
+    return date(today.year + month // 12, month % 12 + 1, 1)
+
+
+def drop_stats_triggers() -> None:
+    # триггеры с transition tables запрещены на секциях, старые снимаем до ATTACH
+    op.execute('DROP TRIGGER IF EXISTS price_stats_after_delete ON price_history')
+    op.execute('DROP TRIGGER IF EXISTS price_stats_after_insert ON price_history')
+
+
+def upgrade() -> None:
+    bound = _legacy_bound().isoformat()
+    op.execute(UUID_V7)
+
+    # старая таблица не копируется, а становится секцией до bound. подготовка без долгих блокировок:
+    # уникальный индекс под новый первичный ключ (id, created_at) и CHECK, с которым ATTACH не сканирует таблицу
+    with op.get_context().autocommit_block():
+        op.create_index('price_history_legacy_id_created_at', 'price_history', ['id', 'created_at'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.execute(f"ALTER TABLE price_history ADD CONSTRAINT price_history_legacy_bound "
+                   f"CHECK (created_at < '{bound}') NOT VALID")
+        op.execute('ALTER TABLE price_history VALIDATE CONSTRAINT price_history_legacy_bound')
+
+    drop_stats_triggers()
+    op.rename_table('price_history', 'price_history_legacy')
+    op.execute('ALTER TABLE price_history_legacy DROP CONSTRAINT price_history_pkey')
+    op.execute('ALTER TABLE price_history_legacy ADD CONSTRAINT price_history_legacy_pkey '
+               'PRIMARY KEY USING INDEX price_history_legacy_id_created_at')
+    for name, legacy_name in LEGACY_INDEXES:
+        op.execute(f'ALTER INDEX {name} RENAME TO {legacy_name}')
+    op.drop_column('price_history_legacy', 'updated_at')
+
+    op.create_table('price_history',
+    sa.Column('id', sa.UUID(), server_default=sa.text('uuid_generate_v7()'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('book_id', sa.UUID(), nullable=False),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.CheckConstraint('price >= 0', name='positive_price'),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    # индексы родителя: у секций свои такие же, legacy подходит готовыми индексами
+    op.create_index('ix_price_history_book_id_created_at_id', 'price_history', ['book_id', 'created_at', 'id'],
+                    unique=False)
+    op.create_index('ix_price_history_created_at_brin', 'price_history', ['created_at'], unique=False,
+                    postgresql_using='brin')
+    for trigger in STATS_TRIGGERS:
+        op.execute(trigger)
+
+    op.execute(f"ALTER TABLE price_history ATTACH PARTITION price_history_legacy "
+               f"FOR VALUES FROM (MINVALUE) TO ('{bound}')")
+    op.execute('ALTER TABLE price_history_legacy DROP CONSTRAINT price_history_legacy_bound')
+    # строки вне созданных секций не теряются, job создает секции заранее, и default остается пустой
+    op.execute('CREATE TABLE price_history_default PARTITION OF price_history DEFAULT')
+    op.execute(CREATE_PARTITIONS)
+    op.execute(f'SELECT price_history_create_partitions({PARTITIONS_AHEAD})')
+
+    op.create_table('price_history_daily',
+    sa.Column('book_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('open', sa.Integer(), nullable=False),
+    sa.Column('high', sa.Integer(), nullable=False),
+    sa.Column('low', sa.Integer(), nullable=False),
+    sa.Column('close', sa.Integer(), nullable=False),
+    sa.Column('changes', sa.Integer(), nullable=False),
+    sa.Column('price_sum', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'day')
+    )
+
+
+def downgrade() -> None:
+    # обратно одна таблица: строки всех секций копируются, свернутые в price_history_daily дни не возвращаются
+    drop_stats_triggers()
+    op.rename_table('price_history', 'price_history_partitioned')
+    op.execute('ALTER INDEX price_history_pkey RENAME TO price_history_partitioned_pkey')
+    op.create_table('price_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('book_id', sa.UUID(), nullable=False),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.CheckConstraint('price >= 0', name='positive_price'),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO price_history (id, book_id, price, created_at, updated_at) '
+               'SELECT id, book_id, price, created_at, created_at FROM price_history_partitioned')
+    op.drop_table('price_history_partitioned')
+    op.create_index('ix_price_history_book_id_created_at_id', 'price_history', ['book_id', 'created_at', 'id'],
+                    unique=False)
+    op.create_index('ix_price_history_created_at_brin', 'price_history', ['created_at'], unique=False,
+                    postgresql_using='brin')
+    for trigger in STATS_TRIGGERS:
+        op.execute(trigger)
+
+    op.drop_table('price_history_daily')
+    op.execute('DROP FUNCTION IF EXISTS price_history_create_partitions(integer)')
+    op.execute('DROP FUNCTION IF EXISTS uuid_generate_v7()')
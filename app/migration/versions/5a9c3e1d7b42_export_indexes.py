@@ -0,0 +1,36 @@
+"""Indexes for incremental export
+
+Revision ID: 5a9c3e1d7b42
+Revises: 2d6f0b8e4c17
+Create Date: 2026-10-18 16:22:05.731960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9c3e1d7b42'
+down_revision: Union[str, None] = '2d6f0b8e4c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_updated_at', 'books', ['updated_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # история только дописывается, created_at идет по порядку страниц и brin занимает килобайты
+        op.create_index('ix_price_history_created_at_brin', 'price_history', ['created_at'],
+                        unique=False, postgresql_using='brin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_price_history_created_at_brin', table_name='price_history',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_books_updated_at', table_name='books',
+                      postgresql_concurrently=True, if_exists=True)
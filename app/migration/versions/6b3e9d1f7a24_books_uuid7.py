@@ -0,0 +1,31 @@
+"""Time ordered UUIDv7 ids of books
+
+Revision ID: 6b3e9d1f7a24
+Revises: 4f8a2c6e1b93
+Create Date: 2026-10-18 22:04:51.160387
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b3e9d1f7a24'
+down_revision: Union[str, None] = '4f8a2c6e1b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # id существующих книг не меняются: они в url клиентов, в истории цен и в кеше.
+    # новые книги получают UUIDv7 приложения (app.db.ids), default базы для вставок мимо него
+    op.alter_column('books', 'id', server_default=sa.text('uuid_generate_v7()'))
+    # страницы индекса после случайных uuid4 заполнены наполовину, пересборка не блокирует запись
+    with op.get_context().autocommit_block():
+        op.execute('REINDEX INDEX CONCURRENTLY books_pkey')
+
+
+def downgrade() -> None:
+    op.alter_column('books', 'id', server_default=None)
@@ -0,0 +1,75 @@
+"""Import fingerprints
+
+Revision ID: 8c3f1a6d2e59
+Revises: 5a9c3e1d7b42
+Create Date: 2026-10-18 18:06:12.934017
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.db.fingerprint import book_fingerprint
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f1a6d2e59'
+down_revision: Union[str, None] = '5a9c3e1d7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 5000
+# символы, которые str.split() считает пробелами (str.isspace)
+PY_WHITESPACE = ('[\\u0009-\\u000d\\u001c-\\u0020\\u0085\\u00a0\\u1680\\u2000-\\u200a'
+                 '\\u2028\\u2029\\u202f\\u205f\\u3000]+')
+
+
+def _backfill_fingerprints() -> None:
+    # отпечаток считает та же функция, что и импорт: у regex и lower() базы своя семантика юникода
+    books = sa.table('books', sa.column('id'), sa.column('title'), sa.column('fingerprint'))
+    bind = op.get_bind()
+    update = books.update().where(books.c.id == sa.bindparam('book_id')).values(fingerprint=sa.bindparam('value'))
+    last_id = None
+    while True:
+        stmt = sa.select(books.c.id, books.c.title).order_by(books.c.id).limit(BACKFILL_BATCH)
+        if last_id is not None:
+            stmt = stmt.where(books.c.id > last_id)
+        rows = bind.execute(stmt).all()
+        if not rows:
+            break
+        bind.execute(update, [{'book_id': row.id, 'value': book_fingerprint(row.title)} for row in rows])
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('fingerprint', sa.String(length=64), nullable=True))
+    if context.is_offline_mode():
+        # в sql-скрипте питона нет: те же пробелы, что у str.split(), lower() базы совпадает с питоном
+        # только на ASCII, книги с другими буквами стоит пересчитать после миграции
+        op.execute(f"""
+            UPDATE books
+            SET fingerprint = encode(sha256(convert_to(
+                lower(btrim(regexp_replace(normalize(title, NFKC), '{PY_WHITESPACE}', ' ', 'g'))), 'UTF8')), 'hex')
+        """)
+    else:
+        _backfill_fingerprints()
+    op.alter_column('books', 'fingerprint', nullable=False)
+    op.create_index('ix_books_fingerprint', 'books', ['fingerprint'], unique=False)
+
+    op.create_table('import_files',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('on_conflict', sa.String(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('report', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('digest', 'on_conflict')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_files')
+    op.drop_index('ix_books_fingerprint', table_name='books')
+    op.drop_column('books', 'fingerprint')
@@ -0,0 +1,40 @@
+"""Keyset pagination indexes
+
+Revision ID: 9e1b2c7a4d10
+Revises: 5c455d44157b
+Create Date: 2026-10-18 10:12:41.532017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e1b2c7a4d10'
+down_revision: Union[str, None] = '5c455d44157b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_created_at_id', 'books', ['created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_books_publication_year_id', 'books', ['publication_year', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_price_history_book_id_created_at_id', 'price_history',
+                        ['book_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_price_history_book_id_created_at_id', table_name='price_history',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_books_publication_year_id', table_name='books',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_books_created_at_id', table_name='books',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,55 @@
+"""Archived books: archived_at and partial indexes of active books
+
+Revision ID: b7d2e8f4a619
+Revises: e1a7c4b9d305
+Create Date: 2026-10-18 20:37:14.295418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e8f4a619'
+down_revision: Union[str, None] = 'e1a7c4b9d305'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (новый частичный индекс, колонки, старый полный индекс)
+ACTIVE_INDEXES = [
+    ('ix_books_created_at_id_active', ['created_at', 'id'], 'ix_books_created_at_id'),
+    ('ix_books_publication_year_id_active', ['publication_year', 'id'], 'ix_books_publication_year_id'),
+    ('ix_books_author_active', ['author'], 'ix_books_author'),
+    ('ix_books_price_active', ['price'], 'ix_books_price'),
+]
+
+
+def upgrade() -> None:
+    op.add_column('books', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    # точное время архивации старых книг неизвестно, ближе всего последнее изменение
+    op.execute('UPDATE books SET archived_at = updated_at WHERE archived')
+
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции.
+    # старые индексы удаляем только после того, как готовы новые
+    with op.get_context().autocommit_block():
+        for name, columns, _ in ACTIVE_INDEXES:
+            op.create_index(name, 'books', columns, unique=False, postgresql_where=sa.text('NOT archived'),
+                            postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_books_archived_at', 'books', ['archived_at'], unique=False,
+                        postgresql_where=sa.text('archived'), postgresql_concurrently=True, if_not_exists=True)
+        for _, _, old_name in ACTIVE_INDEXES:
+            op.drop_index(old_name, table_name='books', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for _, columns, old_name in ACTIVE_INDEXES:
+            op.create_index(old_name, 'books', columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_books_archived_at', table_name='books', postgresql_concurrently=True, if_exists=True)
+        for name, _, _ in ACTIVE_INDEXES:
+            op.drop_index(name, table_name='books', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('books', 'archived_at')
@@ -0,0 +1,32 @@
+"""Import checkpoints
+
+Revision ID: c4a81e6f2b93
+Revises: 3f7d8e2a9c51
+Create Date: 2026-10-18 12:41:09.118350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a81e6f2b93'
+down_revision: Union[str, None] = '3f7d8e2a9c51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('import_checkpoints',
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_checkpoints')
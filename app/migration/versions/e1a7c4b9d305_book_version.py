@@ -0,0 +1,27 @@
+"""Book version
+
+Revision ID: e1a7c4b9d305
+Revises: 8c3f1a6d2e59
+Create Date: 2026-10-18 19:41:27.508113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7c4b9d305'
+down_revision: Union[str, None] = '8c3f1a6d2e59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # константный default в postgres 11+ не переписывает таблицу
+    op.add_column('books', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('books', 'version')
@@ -1,54 +1,112 @@
+from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, UploadFile
+from fastapi import APIRouter, UploadFile, Depends, Request, Header, Query
 
-from app.dto.book import CreateBook, ShowBook, DeleteBook, SearchBook, UpdateBook
-from app.handlers.book import create_new_book, delete_book, get_current_book, update_current_book, get_list_books, \
-    finalize_books, check_file, filter_books
+from app.db.uow import UnitOfWork, get_uow
+from app.db.loader import Loaders, get_loaders
+from app.dto.book import CreateBook, ShowBook, SearchBook, UpdateBook, ConflictMode, BookOrder, \
+    UploadEngine, BookDetail, BookPage, BookFilter, BatchBook, BookSearch
+from app.handlers.book import create_new_book, archive_current_book, get_current_book, update_current_book, \
+    get_list_books, finalize_books, check_file, stream_file, reprice_books, archive_books, archived_scope, \
+    get_books_batch
+from app.handlers.importer import import_books
 
 book_router = APIRouter()
 
 
 @book_router.post('/create', tags=['books'], response_model=ShowBook)
-async def create_book(body: CreateBook) -> ShowBook:
+async def create_book(body: CreateBook, uow: UnitOfWork = Depends(get_uow)):
+    """ETag of answer is version of new book"""
+    return await create_new_book(body=body, uow=uow)
 
-    return await create_new_book(body=body)
 
+@book_router.post('/prices/bulk', tags=['books'])
+async def bulk_update_prices(request: Request, uow: UnitOfWork = Depends(get_uow)):
+    """
+    body is JSON list or NDJSON (Content-Type: application/x-ndjson)
+    of {"book_id": ..., "price": ...}, all changes are applied in one transaction
+    """
+    return await reprice_books(body=await request.body(), content_type=request.headers.get('content-type', ''),
+                               uow=uow)
+
+
+@book_router.post('/archive', tags=['books'])
+async def archive_books_by_filter(body: BookFilter):
+    """archives every book which matches filters, the same as of GET /books/"""
+    return await archive_books(body=body, archived=True)
 
-@book_router.delete('/{book_id}', tags=['books'])
-async def delete_book(book_id: UUID):
 
-    return await delete_book(book_id=book_id)
+@book_router.post('/unarchive', tags=['books'])
+async def unarchive_books_by_filter(body: BookFilter):
+    """returns archived books which match filters back to list of books"""
+    return await archive_books(body=body, archived=False)
 
 
-@book_router.get('/{book_id}', tags=['books'])
-async def get_book(book_id: UUID):
+@book_router.get('/batch', tags=['books'], response_model=List[BatchBook])
+async def get_books_by_ids(ids: List[UUID] = Query(...), include_archived: bool = False,
+                           with_price_stats: bool = False, loaders: Loaders = Depends(get_loaders)):
+    """
+    ?ids=...&ids=... up to BATCH_GET_MAX_IDS books in order of ids, missing ones are {"status": "not_found"}.
+    with_price_stats=true embeds price stats of every book
+    """
+    return await get_books_batch(ids=ids, loaders=loaders, include_archived=include_archived,
+                                 with_price_stats=with_price_stats)
+
+
+@book_router.delete('/{book_id}', tags=['books'])
+async def archive_book(book_id: UUID):
+    """book is archived, purge job deletes it for good after PURGE_AFTER_DAYS"""
+    return await archive_current_book(book_id=book_id)
 
-    return await get_current_book(book_id=book_id)
 
+@book_router.get('/{book_id}', tags=['books'], response_model=BookDetail)
+async def get_book(book_id: UUID, if_none_match: str | None = Header(None), include_archived: bool = False):
+    """ETag is version of book, the same If-None-Match is answered with 304"""
+    return await get_current_book(book_id=book_id, if_none_match=if_none_match, include_archived=include_archived)
 
-@book_router.patch('/{book_id}', tags=['books'])
-async def update_book(book_id: UUID, body: UpdateBook):
 
-    return await update_current_book(body=body, book_id=book_id)
+@book_router.patch('/{book_id}', tags=['books'], response_model=ShowBook)
+async def update_book(book_id: UUID, body: UpdateBook, uow: UnitOfWork = Depends(get_uow),
+                      if_match: str | None = Header(None)):
+    """with If-Match (ETag of GET) book is changed only if nobody changed it since, otherwise 412"""
+    return await update_current_book(body=body, book_id=book_id, uow=uow, if_match=if_match)
 
 
-@book_router.get('/', tags=['books'])
+@book_router.get('/', tags=['books'], response_model=List[ShowBook] | BookPage | BookSearch)
 async def get_books(offset: int = 0, lim: int = 10, title: str = None,
                     author: str = None, genres: str = None, price: int = None,
                     description: str = None, genres_neq: str = None,
+                    cursor: str = None, order_by: BookOrder = BookOrder.created_at,
+                    q: str = None, include_archived: bool = False, only_archived: bool = False,
+                    include: str = None,
                     ):
+    """
+    archived books are skipped, include_archived=true returns them too, only_archived=true - only them.
+    include=count,facets adds number of matching books and genre/author/price/year facets of them
+    """
     return await get_list_books(lim=lim, offset=offset, title=title,
                                 author=author, genres=genres, genres_neq=genres_neq,
-                                description=description, price=price
+                                description=description, price=price,
+                                cursor=cursor, order_by=order_by, q=q,
+                                archived=archived_scope(include_archived, only_archived),
+                                include=include
                                 )
 
 
 @book_router.post("/file/upload-file", tags=['books'])
-async def upload_file(file: UploadFile):
-    return await finalize_books(file=file, func=check_file)
+async def upload_file(file: UploadFile, stream: bool = False, on_conflict: ConflictMode = ConflictMode.skip,
+                      engine: UploadEngine = UploadEngine.rows, force: bool = False):
+    """
+    stream=true writes file chunk by chunk, otherwise the whole file is validated at once:
+    row by row (engine=rows) or by columns with pandas (engine=pandas, only with UPLOAD_COLUMNAR_ENABLED).
+    file which was already imported with the same on_conflict is not processed again without force=true
+    """
+    if stream:
+        return await stream_file(file=file, on_conflict=on_conflict, force=force)
+    return await finalize_books(file=file, on_conflict=on_conflict, engine=engine, force=force, func=check_file)
 
 
 @book_router.get('/loading/', tags=['books'])
-async def load_books():
-    return await finalize_books(func=filter_books)
+async def load_books(on_conflict: ConflictMode = ConflictMode.skip, restart: bool = False):
+    return await import_books(on_conflict=on_conflict, restart=restart)
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from fastapi import APIRouter
+
+from app.dto.export import ExportEntity, ExportFormat
+from app.handlers.export import export_data
+
+export_router = APIRouter()
+
+
+@export_router.get('/{entity}', tags=['export'])
+async def export(entity: ExportEntity, format: ExportFormat = ExportFormat.ndjson,
+                 since: datetime = None, gzip: bool = False):
+    """
+    streams all books or all price history as NDJSON or CSV, gzip=true compresses the stream.
+    since returns only rows changed (books) or added (history) after it, for incremental export.
+    rows of EXPORT_SINCE_OVERLAP seconds before since are repeated, they are upserted by id
+    """
+    return await export_data(entity=entity, fmt=format, since=since, gzip=gzip)
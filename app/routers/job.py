@@ -0,0 +1,40 @@
+from uuid import UUID
+
+from fastapi import APIRouter, UploadFile
+
+from app.dto.book import ConflictMode
+from app.handlers.job import submit_upload, submit_loading, submit_purge, submit_history_maintenance, show_job
+from app.config import PURGE_AFTER_DAYS, PRICE_HISTORY_PARTITIONS_AHEAD, PRICE_HISTORY_RETENTION_MONTHS
+
+job_router = APIRouter()
+
+
+@job_router.post('/upload-file', tags=['jobs'], status_code=202)
+async def upload_file_job(file: UploadFile, on_conflict: ConflictMode = ConflictMode.skip, force: bool = False):
+    """same as /books/file/upload-file, but returns job id at once, progress is in GET /jobs/{job_id}"""
+    return await submit_upload(file=file, on_conflict=on_conflict, force=force)
+
+
+@job_router.post('/loading', tags=['jobs'], status_code=202)
+async def loading_job(on_conflict: ConflictMode = ConflictMode.skip, restart: bool = False):
+    """same as /books/loading/ in background"""
+    return await submit_loading(on_conflict=on_conflict, restart=restart)
+
+
+@job_router.post('/purge', tags=['jobs'], status_code=202)
+async def purge_job(older_than_days: int = PURGE_AFTER_DAYS):
+    """deletes books archived more than older_than_days ago with their price history"""
+    return await submit_purge(older_than_days=older_than_days)
+
+
+@job_router.post('/history-maintenance', tags=['jobs'], status_code=202)
+async def history_maintenance_job(months_ahead: int = PRICE_HISTORY_PARTITIONS_AHEAD,
+                                  retention_months: int = PRICE_HISTORY_RETENTION_MONTHS):
+    """creates monthly partitions of price history ahead and compacts old ones into daily summaries"""
+    return await submit_history_maintenance(months_ahead=months_ahead, retention_months=retention_months)
+
+
+@job_router.get('/{job_id}', tags=['jobs'])
+async def get_job(job_id: UUID):
+
+    return await show_job(job_id=job_id)
@@ -1,12 +1,32 @@
+from datetime import datetime
 from uuid import UUID
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 
-from app.handlers.price_history import show_history_book
+from app.dto.price_history import PriceStatsShow, PriceSeries, SeriesInterval
+from app.handlers.price_history import show_history_book, show_price_stats, show_price_series
 
 price_history_router = APIRouter()
 
 
 @price_history_router.get('/{book_id}', tags=['price_history'])
-async def show_history(book_id: UUID, lim: int = 10, offset: int = 0):
-    return await show_history_book(book_id=book_id, lim=lim, offset=offset)
+async def show_history(book_id: UUID, lim: int = 10, offset: int = 0, cursor: str = None,
+                       date_from: datetime = Query(None, alias='from'),
+                       date_to: datetime = Query(None, alias='to')):
+    return await show_history_book(book_id=book_id, lim=lim, offset=offset, cursor=cursor,
+                                   date_from=date_from, date_to=date_to)
+
+
+@price_history_router.get('/{book_id}/stats', tags=['price_history'], response_model=PriceStatsShow)
+async def show_stats(book_id: UUID, date_from: datetime = Query(None, alias='from'),
+                     date_to: datetime = Query(None, alias='to')):
+    """current, min, max, avg price and number of changes, for all time or for [from, to)"""
+    return await show_price_stats(book_id=book_id, date_from=date_from, date_to=date_to)
+
+
+@price_history_router.get('/{book_id}/series', tags=['price_history'], response_model=PriceSeries)
+async def show_series(book_id: UUID, interval: SeriesInterval = SeriesInterval.day,
+                      date_from: datetime = Query(None, alias='from'),
+                      date_to: datetime = Query(None, alias='to')):
+    """daily or weekly OHLC bars of price"""
+    return await show_price_series(book_id=book_id, interval=interval, date_from=date_from, date_to=date_to)
@@ -1,8 +1,14 @@
 from fastapi import APIRouter
 from app.routers.book import book_router
 from app.routers.price_history import price_history_router
+from app.routers.service import service_router
+from app.routers.job import job_router
+from app.routers.export import export_router
 
 main_api_router = APIRouter(prefix='/api/v1')
 
 main_api_router.include_router(book_router, prefix='/books', tags=['books'])
 main_api_router.include_router(price_history_router, prefix='/price-history', tags=['price_history'])
+main_api_router.include_router(service_router, prefix='/service', tags=['service'])
+main_api_router.include_router(job_router, prefix='/jobs', tags=['jobs'])
+main_api_router.include_router(export_router, prefix='/export', tags=['export'])
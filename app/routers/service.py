@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from app.cache import book_cache
+from app.coalesce import coalesce_info
+from app.db.database import pool_info
+
+service_router = APIRouter()
+
+
+@service_router.get('/cache', tags=['service'])
+async def cache_stats():
+    """counters of cache of this worker"""
+    return book_cache.info()
+
+
+@service_router.get('/coalesce', tags=['service'])
+async def coalesce_stats():
+    """request coalescing and micro cache of hot routes of this worker, with most requested keys"""
+    return coalesce_info()
+
+
+@service_router.get('/pool', tags=['service'])
+async def pool_stats():
+    """connection pool of this worker: checked out connections, overflow and wait for checkout"""
+    return pool_info()
@@ -0,0 +1,35 @@
+"""
+standalone worker of background jobs, runs them apart from web workers:
+
+    JOB_WORKERS=4 python -m app.worker
+
+set JOB_WORKERS=0 for gunicorn then, so web workers only accept jobs
+"""
+import asyncio
+
+from app.cache import book_cache, listen_invalidations
+from app.handlers.importer import close_http_client
+from app.handlers.job import job_worker, scheduled_jobs
+from app.handlers.validation import close_validation_pool
+from app.log import setup_logging
+from app.config import JOB_WORKERS
+
+
+async def main(workers: int = JOB_WORKERS):
+    tasks = [asyncio.create_task(job_worker()) for _ in range(max(workers, 1))]
+    if book_cache.enabled:
+        tasks.append(asyncio.create_task(listen_invalidations()))
+    tasks.extend(asyncio.create_task(scheduler) for scheduler in scheduled_jobs())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_http_client()
+        close_validation_pool()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    asyncio.run(main())
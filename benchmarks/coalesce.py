@@ -0,0 +1,61 @@
+"""
+thundering herd on one list query: `clients` concurrent identical requests in `waves`, loader is
+a fake query which sleeps `query_ms`. counts loader calls and latency without coalescing,
+with single flight only and with micro cache (stale while revalidate). db is not used
+
+    python -m benchmarks.coalesce --clients 1000 --waves 20 --query-ms 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.coalesce import Coalescer
+from benchmarks.suite.common import summarize
+
+
+async def run(coalescer: Coalescer, clients: int, waves: int, query_ms: float, pause_ms: float):
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(query_ms / 1000)
+        return [{'id': i} for i in range(10)]
+
+    latencies = []
+
+    async def client():
+        began = time.perf_counter()
+        await coalescer.get({'genres': 'poetry', 'lim': 10}, query)
+        latencies.append(time.perf_counter() - began)
+
+    start = time.perf_counter()
+    for _ in range(waves):
+        await asyncio.gather(*(client() for _ in range(clients)))
+        await asyncio.sleep(pause_ms / 1000)
+    return calls, summarize(latencies, time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--waves', type=int, default=20)
+    parser.add_argument('--query-ms', type=float, default=20)
+    parser.add_argument('--pause-ms', type=float, default=100)
+    parser.add_argument('--ttl', type=float, default=0.5)
+    parser.add_argument('--stale', type=float, default=2.0)
+    args = parser.parse_args()
+
+    modes = {
+        'off': Coalescer('bench-off', enabled=False),
+        'single_flight': Coalescer('bench-single-flight'),
+        'micro_cache': Coalescer('bench-micro-cache', ttl=args.ttl, stale=args.stale),
+    }
+    for name, coalescer in modes.items():
+        calls, stats = await run(coalescer, args.clients, args.waves, args.query_ms, args.pause_ms)
+        print(json.dumps({'mode': name, 'requests': args.clients * args.waves, 'queries': calls, **stats}))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+row by row (pydantic) against columnar (pandas) validation of uploaded file: rows/sec of reading,
+of validation and of both, and check that both give the same report
+
+    python -m benchmarks.columnar --rows 1000000 --format csv
+    python -m benchmarks.columnar --rows 100000 --format xlsx
+
+every 20th row is invalid and every 50th repeats previous one
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from fastapi import UploadFile
+
+from app.config import COLUMNS
+from app.handlers.upload import open_rows, read_header, validate_rows
+from app.handlers.columnar import read_frame, validate_frame, EXCEL_ENGINE
+from app.db.cruds.book import _split_duplicates_in_batch
+from benchmarks.upload import make_file
+
+
+def make_messy_file(path: str, rows: int):
+    make_file(path, rows)
+    if not path.endswith('.csv'):
+        return
+    # в csv портим строки, чтобы часть уходила в невалидные и в повторы
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for i in range(1, len(lines)):
+        if i % 20 == 0:
+            lines[i] = lines[i].replace(',', ',not a year,', 1).rsplit(',', 1)[0]
+        elif i % 50 == 0:
+            lines[i] = lines[i - 1]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def upload(path: str) -> UploadFile:
+    with open(path, 'rb') as f:
+        return UploadFile(file=io.BytesIO(f.read()), filename=os.path.basename(path))
+
+
+def run_rows(path: str):
+    start = time.perf_counter()
+    rows = open_rows(upload(path))
+    header = read_header(rows)
+    all_rows = list(rows)
+    read = time.perf_counter() - start
+    result = validate_rows(header, all_rows)
+    return read, time.perf_counter() - start - read, result
+
+
+def run_columnar(path: str):
+    start = time.perf_counter()
+    header, frame = read_frame(upload(path))
+    read = time.perf_counter() - start
+    result = validate_frame(header, frame)
+    return read, time.perf_counter() - start - read, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'books.{args.format}')
+        make_messy_file(path, args.rows)
+
+        results = {}
+        for name, run in (('rows', run_rows), ('pandas', run_columnar)):
+            read, validate, result = run(path)
+            results[name], results[f'{name}_s'] = result, read + validate
+            print(json.dumps({
+                'engine': name, 'format': args.format, 'rows': args.rows,
+                'excel_engine': EXCEL_ENGINE if name == 'pandas' and args.format == 'xlsx' else None,
+                'read_s': round(read, 2), 'validate_s': round(validate, 2),
+                'read_rows_per_sec': round(args.rows / read), 'validate_rows_per_sec': round(args.rows / validate),
+                'total_rows_per_sec': round(args.rows / (read + validate)),
+                'valid': len(result[0]), 'invalid': len(result[1]),
+            }))
+
+        # повторы строк в файле pandas находит сам, построчно их находит load_data
+        rows, pandas = results['rows'], results['pandas']
+        unique, repeated = _split_duplicates_in_batch(rows[0])
+        same = ([book for _, book in unique] == pandas[0] and repeated == pandas[2]
+                and [book.model_dump() for book in rows[1]] == [book.model_dump() for book in pandas[1]])
+        speedup = results['rows_s'] / results['pandas_s']
+        print(json.dumps({'same_report': same, 'speedup': round(speedup, 1), 'columns': list(COLUMNS)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+stress of concurrent PATCH of price of one book on running app, then checks that nothing was lost:
+history has one row per written price change, ends with price of book and has no repeated prices,
+version of book grew once per successful PATCH
+
+    python -m benchmarks.concurrent_patch --url http://localhost:9999 --writers 20 --patches 50
+    python -m benchmarks.concurrent_patch --url http://localhost:9999 --if-match
+
+with --if-match every writer reads ETag and sends If-Match, on 412 it reads book again and retries
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from uuid import uuid4
+
+from httpx import AsyncClient, Limits
+
+
+async def writer(client: AsyncClient, book_id: str, patches: int, if_match: bool, stats: dict):
+    for _ in range(patches):
+        price = random.randint(0, 5)
+        while True:
+            headers = {}
+            if if_match:
+                response = await client.get(f'/books/{book_id}')
+                headers['If-Match'] = response.headers['ETag']
+            response = await client.patch(f'/books/{book_id}', json={'price': price}, headers=headers)
+            stats[response.status_code] = stats.get(response.status_code, 0) + 1
+            if response.status_code != 412:
+                response.raise_for_status()
+                break
+
+
+async def read_history(client: AsyncClient, book_id: str) -> list:
+    history = []
+    cursor = ''
+    while cursor is not None:
+        response = await client.get(f'/price-history/{book_id}', params={'cursor': cursor, 'lim': 1000})
+        response.raise_for_status()
+        page = response.json()
+        history.extend(page['history'])
+        cursor = page['next_cursor']
+    return history
+
+
+async def run(url: str, writers: int, patches: int, if_match: bool):
+    async with AsyncClient(base_url=f'{url}/api/v1', limits=Limits(max_connections=writers), timeout=60) as client:
+        response = await client.post('/books/create', json={'title': f'stress {uuid4()}', 'publication_year': 2000,
+                                                            'genre': ['fiction'], 'price': 0})
+        response.raise_for_status()
+        book_id = response.json()['id']
+
+        stats = {}
+        start = time.perf_counter()
+        await asyncio.gather(*(writer(client, book_id, patches, if_match, stats) for _ in range(writers)))
+        elapsed = time.perf_counter() - start
+
+        book = (await client.get(f'/books/{book_id}')).json()
+        prices = [item['price'] for item in await read_history(client, book_id)]
+
+    repeated = sum(1 for previous, price in zip(prices, prices[1:]) if previous == price)
+    result = {
+        'writers': writers, 'patches': writers * patches, 'if_match': if_match,
+        'patches_per_sec': round(writers * patches / elapsed, 1),
+        'statuses': {str(status): count for status, count in sorted(stats.items())},
+        'final_price': book['price'], 'version': book['version'], 'history_rows': len(prices),
+        # инварианты: последняя цена истории равна цене книги, подряд одинаковых цен нет,
+        # каждый успешный PATCH ровно одна новая версия
+        'history_matches_price': prices[-1] == book['price'],
+        'repeated_prices_in_history': repeated,
+        'version_matches_patches': book['version'] == 1 + stats.get(200, 0),
+    }
+    print(json.dumps(result))
+    if not (result['history_matches_price'] and repeated == 0 and result['version_matches_patches']):
+        raise SystemExit('lost or phantom update')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:9999')
+    parser.add_argument('--writers', type=int, default=20)
+    parser.add_argument('--patches', type=int, default=50)
+    parser.add_argument('--if-match', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.writers, args.patches, args.if_match))
+
+
+if __name__ == '__main__':
+    main()
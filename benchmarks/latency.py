@@ -0,0 +1,73 @@
+"""
+p50/p99 latency of POST /books/create and PATCH /books/{id} on running app
+
+    python -m benchmarks.latency --url http://localhost:9999 --requests 2000 --concurrency 20
+
+run it on commit before and after change to compare
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from uuid import uuid4
+
+from httpx import AsyncClient, Limits
+
+from benchmarks.suite.common import percentile
+
+
+def summary(name: str, latencies) -> dict:
+    return {
+        'endpoint': name, 'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+async def timed(latencies: list, request):
+    start = time.perf_counter()
+    response = await request
+    latencies.append(time.perf_counter() - start)
+    response.raise_for_status()
+    return response
+
+
+async def run(url: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    created = []
+    create_latencies = []
+    patch_latencies = []
+
+    async with AsyncClient(base_url=f'{url}/api/v1/books',
+                           limits=Limits(max_connections=concurrency)) as client:
+        async def create(i: int):
+            async with semaphore:
+                body = {'title': f'latency {uuid4()}', 'publication_year': 2000,
+                        'genre': ['fiction'], 'price': i % 1000}
+                response = await timed(create_latencies, client.post('/create', json=body))
+                created.append(response.json()['id'])
+
+        async def patch(i: int, book_id: str):
+            async with semaphore:
+                await timed(patch_latencies, client.patch(f'/{book_id}', json={'price': i % 1000 + 1}))
+
+        await asyncio.gather(*(create(i) for i in range(requests)))
+        await asyncio.gather(*(patch(i, book_id) for i, book_id in enumerate(created)))
+
+    print(json.dumps(summary('POST /books/create', create_latencies)))
+    print(json.dumps(summary('PATCH /books/{book_id}', patch_latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:9999')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+local mock of third party books api for /books/loading/
+
+    python -m benchmarks.mock_books_api --books 100000 --port 8081 --fail-rate 0.1
+    LOAD_BOOKS_URL=http://localhost:8081/books IMPORT_PAGE_SIZE=1000 gunicorn app.main:app ...
+
+?page=n&limit=size returns one page, without them the whole list is streamed in small chunks.
+fail-rate is share of requests answered with 503 to check retries
+"""
+import argparse
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def make_book(i: int) -> dict:
+    # каждая 50-я книга невалидна
+    return {
+        'title': f'mock book {i}',
+        'publication_year': 1900 + i % 120 if i % 50 else None,
+        'genre': ['fiction', 'classic'][:1 + i % 2],
+        'author': f'author {i % 1000}',
+        'description': 'mock description',
+        'cover_image': 'https://example.com/cover.jpg',
+        'price': i % 5000,
+    }
+
+
+def make_handler(total: int, fail_rate: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if random.random() < fail_rate:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            start, stop = 0, total
+            if 'page' in query:
+                limit = int(query.get('limit', ['100'])[0])
+                start = (int(query['page'][0]) - 1) * limit
+                stop = min(start + limit, total)
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self._chunk(b'[')
+            for i in range(start, stop):
+                self._chunk((',' if i > start else '').encode() + json.dumps(make_book(i)).encode())
+            self._chunk(b']')
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _chunk(self, data: bytes):
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=10_000)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), make_handler(args.books, args.fail_rate))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+time of bulk repricing of N existing books through POST /books/prices/bulk
+
+    python -m benchmarks.reprice --url http://localhost:9999 --items 100000
+
+book ids are taken from the db the app uses (REAL_DATABASE_URL)
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.db.database import async_session_maker, engine
+from app.db.models import Book
+
+
+async def run(url: str, items: int, ndjson: bool):
+    async with async_session_maker() as session:
+        ids = list(await session.scalars(select(Book.id).limit(items)))
+    await engine.dispose()
+
+    batch = [{'book_id': str(book_id), 'price': random.randint(0, 5000)} for book_id in ids]
+    if ndjson:
+        content = '\n'.join(json.dumps(item) for item in batch)
+        headers = {'content-type': 'application/x-ndjson'}
+    else:
+        content = json.dumps(batch)
+        headers = {'content-type': 'application/json'}
+
+    async with AsyncClient(base_url=f'{url}/api/v1/books', timeout=None) as client:
+        start = time.perf_counter()
+        response = await client.post('/prices/bulk', content=content, headers=headers)
+        elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    print(json.dumps({'items': len(batch), 'format': 'ndjson' if ndjson else 'json',
+                      'seconds': round(elapsed, 3), 'items_per_sec': round(len(batch) / elapsed),
+                      'summary': response.json()['summary']}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:9999')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--ndjson', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.items, args.ndjson))
+
+
+if __name__ == '__main__':
+    main()
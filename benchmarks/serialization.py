@@ -0,0 +1,82 @@
+"""
+responses/sec of rendering list of books (GET /books/?lim=1000) and of one book (GET /books/{id}):
+before - ShowBook for every row, its json(), jsonable_encoder and JSONResponse as fastapi did,
+after - plain dicts of rows written by orjson. db is not used, rows are built in memory
+
+    python -m benchmarks.serialization --lim 1000 --repeat 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.db.cruds.book import _show_row
+from app.db.models import Book
+from app.dto.book import ShowBook, BookDetail
+
+
+def make_rows(lim: int):
+    return [
+        {'id': uuid4(), 'title': f'book {i}', 'publication_year': 1900 + i % 120, 'author': f'author {i % 50}',
+         'genre': ['fiction', 'classic'], 'description': 'some description ' * 5,
+         'cover_image': 'https://example.com/cover.jpg', 'price': i % 5000, 'archived': False,
+         'created_at': datetime.now()}
+        for i in range(lim)
+    ]
+
+
+def list_before(rows) -> bytes:
+    books = [ShowBook(**row).json() for row in rows]
+    return JSONResponse(jsonable_encoder(books)).body
+
+
+def list_after(rows) -> bytes:
+    return ORJSONResponse([_show_row(row) for row in rows]).body
+
+
+def book_before(book: Book) -> bytes:
+    return JSONResponse(jsonable_encoder(book)).body
+
+
+def book_after(book: Book) -> bytes:
+    return ORJSONResponse(BookDetail.model_validate(book).model_dump(mode='json')).body
+
+
+def measure(name: str, func, arg, repeat: int) -> float:
+    func(arg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'case': name, 'repeat': repeat, 'responses_per_sec': round(repeat / elapsed, 1),
+                      'ms_per_response': round(elapsed / repeat * 1000, 3)}))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lim', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.lim)
+    assert json.loads(list_before(rows)) == json.loads(list_after(rows))
+    before = measure(f'list lim={args.lim} before', list_before, rows, args.repeat)
+    after = measure(f'list lim={args.lim} after', list_after, rows, args.repeat)
+    print(json.dumps({'case': 'list', 'speedup': round(before / after, 1)}))
+
+    row = rows[0]
+    book = Book(id=row['id'], title=row['title'], publication_year=row['publication_year'], author=row['author'],
+                genre=row['genre'], description=row['description'], cover_image=row['cover_image'],
+                price=row['price'], archived=False, created_at=row['created_at'], updated_at=row['created_at'])
+    before = measure('book before', book_before, book, args.repeat * 100)
+    after = measure('book after', book_after, book, args.repeat * 100)
+    print(json.dumps({'case': 'book', 'speedup': round(before / after, 1)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+"""
+reproducible performance suite: synthetic data, micro benchmarks of app/db/cruds,
+http load of every route and comparison with stored baseline, see benchmarks/suite/__main__.py
+"""
@@ -0,0 +1,122 @@
+"""summary of measured latencies and comparison of results with baseline"""
+import json
+import os
+import resource
+import statistics
+from typing import Dict, List, Optional
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def _proc_status_mb(pid: Optional[int], field: str) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid or "self"}/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """RSS now of this process or of other process of this machine (linux /proc)"""
+    return _proc_status_mb(pid, 'VmRSS')
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """peak RSS since start of process or since reset_peak_rss"""
+    peak = _proc_status_mb(pid, 'VmHWM')
+    if peak is None and pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return peak
+
+
+def reset_peak_rss(pid: Optional[int] = None) -> bool:
+    """starts new peak RSS of process, linux >= 4.0 and process of the same user"""
+    try:
+        with open(f'/proc/{pid or "self"}/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class RssProbe:
+    """
+    memory of one case: growth of RSS during case and peak RSS of case. peak of process is
+    high-water mark of everything run before, so it is reported only when it could be reset
+    """
+
+    def __init__(self, pid: Optional[int] = None):
+        self.pid = pid
+        self.peak_reset = reset_peak_rss(pid)
+        self.start = rss_mb(pid)
+
+    def report(self) -> Dict:
+        end = rss_mb(self.pid)
+        return {'rss_delta_mb': round(end - self.start, 1) if end is not None and self.start is not None else None,
+                'peak_rss_mb': peak_rss_mb(self.pid) if self.peak_reset else None}
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0, rss: Optional[RssProbe] = None,
+              **extra) -> Dict:
+    """
+    throughput is operations/sec of the whole run, latencies are of single operations,
+    memory is reported by probe started before the run
+    """
+    count = len(latencies)
+    return {
+        'count': count, 'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if count else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if count else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if count else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if count else None,
+        **(rss.report() if rss else {}),
+        **extra,
+    }
+
+
+def load_json(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: Dict):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 0.2,
+            rss_tolerance: float = 0.3, rss_slack_mb: float = 5.0) -> List[str]:
+    """
+    regressions against baseline: throughput lower or p95 higher than tolerance allows,
+    growth of RSS or peak RSS of case higher than rss_tolerance plus rss_slack_mb allow, more errors.
+    cases missing in baseline are not compared
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if base['throughput'] and current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']} < {base['throughput']}")
+        if base.get('p95_ms') and current.get('p95_ms') and current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms > {base['p95_ms']} ms")
+        # прирост бывает нулевым и отрицательным, поэтому к допуску добавляется запас в мегабайтах
+        for key, label in (('rss_delta_mb', 'RSS growth'), ('peak_rss_mb', 'peak RSS')):
+            if base.get(key) is None or current.get(key) is None:
+                continue
+            if current[key] > max(base[key], 0) * (1 + rss_tolerance) + rss_slack_mb:
+                regressions.append(f"{name}: {label} {current[key]} MB > {base[key]} MB")
+        if current['error_rate'] > base.get('error_rate', 0.0):
+            regressions.append(f"{name}: error rate {current['error_rate']} > {base.get('error_rate', 0.0)}")
+    return regressions
@@ -0,0 +1,219 @@
+"""
+micro benchmarks of crud functions of app/db/cruds on seeded database: every operation is awaited
+one after another, so latency is of crud itself and not of waiting for pool
+
+    REAL_DATABASE_URL=... python -m benchmarks.suite.cruds --iterations 200 --out cruds.json
+
+heavy cases (bulk load, repricing, export) run iterations // 20 times. public crud functions
+without case are listed in output as uncovered
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import pkgutil
+import random
+import time
+from datetime import datetime, timedelta
+from importlib import import_module
+from typing import Awaitable, Callable, Dict, List
+from uuid import uuid4
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+
+import app.db.cruds
+from app.db.cruds import book as book_crud
+from app.db.cruds import price_history as history_crud
+from app.db.cruds import import_job as job_crud
+from app.db.cruds import import_checkpoint as checkpoint_crud
+from app.db.cruds import import_file as import_file_crud
+from app.db.cruds import export as export_crud
+from app.db.database import async_session_maker, engine
+from app.db.models import Book, ImportJob
+from app.dto.book import BookOrder, UpdateBook, ArchivedScope
+from app.dto.price_history import SeriesInterval
+from app.config import PURGE_AFTER_DAYS, PRICE_HISTORY_PARTITIONS_AHEAD
+from benchmarks.suite.common import RssProbe, summarize
+from benchmarks.suite.data import make_books
+
+# во сколько раз реже запускаются тяжелые случаи
+HEAVY = 20
+# задачи набора без обработчика: их удаляют после замеров, чтобы воркер приложения в http части их не брал
+BENCH_JOB_KIND = 'bench'
+
+
+async def _consume(rows):
+    count = 0
+    async for chunk in rows:
+        count += len(chunk)
+    return count
+
+
+def make_cases(ids: List, jobs: List, rng: random.Random) -> Dict[str, tuple]:
+    """
+    name -> (operation of iteration number, is heavy), name starts with module.function of crud.
+    jobs are claimed jobs with file (see bench_jobs)
+    """
+    created = []
+    since = datetime.now() - timedelta(days=30)
+
+    async def create_book(i: int):
+        book = await book_crud.create_book(title=f'bench {uuid4()}', publication_year=2000, genre=['fiction'],
+                                           price=i % 5000)
+        created.append(book.id)
+
+    async def delete_book(i: int):
+        await book_crud.delete_book(created.pop() if created else rng.choice(ids))
+
+    async def archive_by_filter(i: int):
+        # туда и обратно, чтобы остальные случаи видели те же книги
+        filters = {'author': f'author {i % 50}', 'price': i % 5000}
+        await book_crud.set_archived(filters, archived=True)
+        await book_crud.set_archived(filters, archived=False)
+
+    return {
+        'book.create_book': (create_book, False),
+        'book.get_book': (lambda i: book_crud.get_book(rng.choice(ids)), False),
+        'book.get_books_by_ids': (lambda i: book_crud.get_books_by_ids(rng.sample(ids, min(100, len(ids)))), False),
+        'book.update_book': (lambda i: book_crud.update_book(rng.choice(ids), UpdateBook(price=i % 5000)), False),
+        'book.delete_book': (delete_book, False),
+        'book.set_archived': (archive_by_filter, False),
+        'book.purge_archived': (lambda i: book_crud.purge_archived(timedelta(days=PURGE_AFTER_DAYS)), False),
+        'book.get_books.offset': (lambda i: book_crud.get_books(lim=100, offset=i * 100 % len(ids)), False),
+        'book.get_books.cursor': (lambda i: book_crud.get_books(lim=100, offset=0, cursor='',
+                                                                order_by=BookOrder.publication_year), False),
+        'book.get_books.author': (lambda i: book_crud.get_books(lim=100, offset=0, author=f'author {i % 50}'), False),
+        'book.get_books.q': (lambda i: book_crud.get_books(lim=20, offset=0, q='winter garden'), False),
+        'book.get_books.only_archived': (lambda i: book_crud.get_books(lim=100, offset=0,
+                                                                       archived=ArchivedScope.archived), False),
+        'book.count_books': (lambda i: book_crud.count_books({'author': f'author {i % 50}'}), False),
+        'book.count_books.all': (lambda i: book_crud.count_books({}), False),
+        'book.book_facets': (lambda i: book_crud.book_facets({'author': f'author {i % 50}'}), False),
+        'book.book_facets.q': (lambda i: book_crud.book_facets({'q': 'winter garden'}), False),
+        'book.load_data': (lambda i: book_crud.load_data(list(make_books(1000, seed=i, start=10_000_000 + i * 1000))),
+                           True),
+        'book.update_prices': (lambda i: book_crud.update_prices(
+            {book_id: rng.randint(0, 5000) for book_id in rng.sample(ids, min(1000, len(ids)))}), True),
+        'price_history.create_history': (lambda i: history_crud.create_history(rng.choice(ids), i % 5000), False),
+        'price_history.create_many_history': (lambda i: history_crud.create_many_history(
+            [(rng.choice(ids), i % 5000) for _ in range(100)]), False),
+        'price_history.get_history_book': (lambda i: history_crud.get_history_book(
+            rng.choice(ids), lim=100, offset=0), False),
+        'price_history.get_history_book.range': (lambda i: history_crud.get_history_book(
+            rng.choice(ids), lim=100, offset=0, cursor='', date_from=since), False),
+        'price_history.get_price_stats': (lambda i: history_crud.get_price_stats(rng.choice(ids)), False),
+        'price_history.get_price_stats.range': (lambda i: history_crud.get_price_stats(
+            rng.choice(ids), date_from=since), False),
+        'price_history.get_price_stats_many': (lambda i: history_crud.get_price_stats_many(
+            rng.sample(ids, min(100, len(ids)))), False),
+        'price_history.get_price_series': (lambda i: history_crud.get_price_series(
+            rng.choice(ids), interval=SeriesInterval.week), False),
+        'price_history.list_partitions': (lambda i: history_crud.list_partitions(), False),
+        'price_history.create_partitions': (lambda i: history_crud.create_partitions(
+            PRICE_HISTORY_PARTITIONS_AHEAD), False),
+        # срок хранения больше истории сида: замеряется проверка секций, свертка не удаляет данные других случаев
+        'price_history.rollup_partitions': (lambda i: history_crud.rollup_partitions(1200), False),
+        'price_history.delete_history_book': (lambda i: history_crud.delete_history_book(rng.choice(ids)), True),
+        'import_job.create_job': (lambda i: job_crud.create_job(BENCH_JOB_KIND, {'bench': i}), False),
+        'import_job.claim_job': (lambda i: job_crud.claim_job(), False),
+        'import_job.schedule_job': (lambda i: job_crud.schedule_job('purge', {'older_than_days': 36500},
+                                                                    timedelta(hours=24)), False),
+        'import_job.get_job': (lambda i: job_crud.get_job(jobs[i % len(jobs)]['id']), False),
+        'import_job.iter_payload': (lambda i: _consume(job_crud.iter_payload(jobs[i % len(jobs)]['id'])), False),
+        'import_job.update_progress': (lambda i: job_crud.update_progress(
+            jobs[i % len(jobs)]['id'], jobs[i % len(jobs)]['lease'], {'loaded_count': i}), False),
+        'import_job.finish_job': (lambda i: job_crud.finish_job(
+            jobs[i % len(jobs)]['id'], jobs[i % len(jobs)]['lease'], {'bench': i}), False),
+        'import_job.fail_job': (lambda i: job_crud.fail_job(
+            jobs[i % len(jobs)]['id'], jobs[i % len(jobs)]['lease'], 'bench'), False),
+        'import_checkpoint.save_checkpoint': (lambda i: checkpoint_crud.save_checkpoint('bench', i), False),
+        'import_checkpoint.get_checkpoint': (lambda i: checkpoint_crud.get_checkpoint('bench'), False),
+        'import_checkpoint.delete_checkpoint': (lambda i: checkpoint_crud.delete_checkpoint('bench'), False),
+        'import_file.save_import_file': (lambda i: import_file_crud.save_import_file(
+            f'{i:064x}', 'skip', 'bench.csv', {'loaded_count': i}), False),
+        'import_file.get_import_file': (lambda i: import_file_crud.get_import_file(f'{i:064x}', 'skip'), False),
+        'export.stream_rows.books': (lambda i: _consume(export_crud.stream_rows('books')), True),
+        'export.stream_rows.price_history': (lambda i: _consume(export_crud.stream_rows('price_history',
+                                                                                        since=since)), True),
+    }
+
+
+def public_cruds() -> List[str]:
+    names = []
+    for module_info in pkgutil.iter_modules(app.db.cruds.__path__):
+        module = import_module(f'app.db.cruds.{module_info.name}')
+        names.extend(f'{module_info.name}.{name}' for name, func in vars(module).items()
+                     if inspect.iscoroutinefunction(func) and not name.startswith('_')
+                     and func.__module__ == module.__name__)
+    return sorted(names)
+
+
+async def measure(operation: Callable[[int], Awaitable], iterations: int) -> Dict:
+    latencies = []
+    errors = 0
+    rss = RssProbe()
+    start = time.perf_counter()
+    for i in range(iterations):
+        began = time.perf_counter()
+        try:
+            await operation(i)
+        except HTTPException as ex:
+            # 404 пустой выборки это ответ, а не ошибка crud
+            errors += ex.status_code >= 500
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start, errors=errors, rss=rss)
+
+
+async def bench_jobs(count: int = 10) -> List[Dict]:
+    """jobs with 1 MB file in fresh database of the suite, claimed to get their lease"""
+    async def payload():
+        for _ in range(4):
+            yield os.urandom(256 * 1024)
+
+    for i in range(count):
+        await job_crud.create_job(BENCH_JOB_KIND, {'bench': i}, payload=payload())
+    return [job for job in [await job_crud.claim_job() for _ in range(count)] if job is not None]
+
+
+async def run(iterations: int, only: List[str], seed: int) -> Dict:
+    rng = random.Random(seed)
+    async with async_session_maker() as session:
+        ids = list(await session.scalars(select(Book.id).where(Book.archived.is_(False)).limit(100_000)))
+    if not ids:
+        raise SystemExit('database is empty, run python -m benchmarks.suite.data seed first')
+
+    cases = make_cases(ids, await bench_jobs(), rng)
+
+    results = {}
+    for name, (operation, heavy) in cases.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[f'crud.{name}'] = await measure(operation, max(iterations // HEAVY, 3) if heavy else iterations)
+        print(json.dumps({'case': f'crud.{name}', **results[f'crud.{name}']}))
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(delete(ImportJob).where(ImportJob.kind == BENCH_JOB_KIND))
+    await engine.dispose()
+
+    covered = {'.'.join(name.split('.')[:2]) for name in cases}
+    return {'results': results, 'uncovered': [name for name in public_cruds() if name not in covered]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--only', nargs='*', default=[], help='prefixes of cases, e.g. book.get_books')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='file for json results')
+    args = parser.parse_args()
+    output = asyncio.run(run(args.iterations, args.only, args.seed))
+    print(json.dumps({'uncovered': output['uncovered']}))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+synthetic data of benchmarks: books with realistic genres, authors and prices, price history
+of random depth over the last year, and upload files of 1k-1M rows
+
+    python -m benchmarks.suite.data files --rows 1000 100000 1000000 --dir /tmp/bench
+    REAL_DATABASE_URL=... python -m benchmarks.suite.data seed --books 100000 --history 20
+
+the same --seed gives the same data
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from openpyxl import Workbook
+
+from app.config import COLUMNS, MIN_DATA, MAX_DATA
+
+# доли жанров примерно как в каталоге книжного магазина
+GENRES = {
+    'fiction': 30, 'mystery': 12, 'fantasy': 10, 'romance': 10, 'science fiction': 8, 'classic': 7,
+    'history': 7, 'biography': 6, 'children': 6, 'poetry': 4,
+}
+WORDS = ('shadow', 'river', 'winter', 'garden', 'empire', 'silence', 'letter', 'island', 'house', 'night',
+         'stone', 'city', 'journey', 'secret', 'memory', 'fire', 'glass', 'storm', 'daughter', 'king')
+AUTHORS = 5000
+# check max_publication_year_error в базе зафиксирован миграцией 5c455d44157b, MAX_DATA же растет с годом
+MAX_YEAR = min(MAX_DATA, 2024)
+
+
+def make_book(i: int, rng: random.Random) -> Dict:
+    genres = rng.choices(list(GENRES), weights=list(GENRES.values()), k=rng.choice((1, 1, 2, 3)))
+    words = rng.sample(WORDS, 3)
+    return {
+        # номер делает название уникальным, как уникален title в таблице
+        'title': f'The {words[0]} of {words[1]} {i}',
+        # у популярных авторов много книг: индекс автора смещен к началу
+        'author': f'author {int(AUTHORS * rng.random() ** 2)}',
+        'publication_year': max(MIN_DATA, min(MAX_YEAR, int(rng.triangular(1800, MAX_YEAR, MAX_YEAR)))),
+        'genre': list(dict.fromkeys(genres)),
+        'description': ' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+        'cover_image': f'https://example.com/covers/{i}.jpg',
+        'price': int(rng.lognormvariate(6, 0.8)),
+    }
+
+
+def make_books(count: int, seed: int = 1, start: int = 0) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    return (make_book(i, rng) for i in range(start, start + count))
+
+
+def make_history(price: int, depth: int, rng: random.Random, now: datetime) -> List[tuple]:
+    """(price, created_at) of changes over the last year, the last one is current price"""
+    moments = sorted(now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)) for _ in range(depth))
+    prices = [max(0, int(price * rng.uniform(0.7, 1.3))) for _ in range(depth - 1)] + [price]
+    return list(zip(prices, moments))
+
+
+def book_row(book: Dict) -> List:
+    """cells of book in columns of upload file"""
+    return [','.join(book[column]) if column == 'genre' else book[column] for column in COLUMNS]
+
+
+def csv_bytes(books) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(list(COLUMNS))
+    writer.writerows(book_row(book) for book in books)
+    return buffer.getvalue().encode()
+
+
+def write_file(path: str, rows: int, seed: int = 1):
+    header = list(COLUMNS.keys())
+    data = (book_row(book) for book in make_books(rows, seed))
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(data)
+        return
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in data:
+        sheet.append(row)
+    workbook.save(path)
+
+
+async def seed_db(books: int, history: int, seed: int = 1, chunk_size: int = 5000) -> Dict:
+    """
+    books are loaded by book_crud.load_data as by upload, history of geometric depth with mean
+    history is inserted with its own created_at, price_stats is filled by trigger
+    """
+    from sqlalchemy import insert
+
+    from app.db.cruds import book as book_crud
+    from app.db.database import session_scope, engine
+    from app.db.models import PriceHistory
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    loaded = history_rows = 0
+    batch = []
+    for book in make_books(books, seed):
+        batch.append(book)
+        if len(batch) == chunk_size or loaded + len(batch) == books:
+            async with session_scope() as session:
+                result = await book_crud.load_data(batch, session=session)
+                rows = []
+                for row in result['valid_books']:
+                    depth = min(1 + int(rng.expovariate(1 / max(history - 1, 1))), history * 10)
+                    rows.extend({'book_id': row['id'], 'price': price, 'created_at': moment}
+                                for price, moment in make_history(row['price'], depth, rng, now))
+                for i in range(0, len(rows), chunk_size):
+                    await session.execute(insert(PriceHistory), rows[i:i + chunk_size])
+            loaded += len(batch)
+            history_rows += len(rows)
+            batch = []
+    await engine.dispose()
+    return {'books': loaded, 'history_rows': history_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    files = commands.add_parser('files', help='upload files of every size in csv and xlsx')
+    files.add_argument('--rows', type=int, nargs='+', default=[1000, 100_000, 1_000_000])
+    files.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv', 'xlsx'])
+    files.add_argument('--dir', default='.')
+    seed = commands.add_parser('seed', help='books and price history in db of REAL_DATABASE_URL')
+    seed.add_argument('--books', type=int, default=10_000)
+    seed.add_argument('--history', type=int, default=20, help='mean depth of price history')
+    for command in (files, seed):
+        command.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'files':
+        os.makedirs(args.dir, exist_ok=True)
+        for rows in args.rows:
+            for file_format in args.formats:
+                path = os.path.join(args.dir, f'books_{rows}.{file_format}')
+                write_file(path, rows, args.seed)
+                print(json.dumps({'path': path, 'rows': rows, 'bytes': os.path.getsize(path)}))
+    else:
+        print(json.dumps(asyncio.run(seed_db(args.books, args.history, args.seed))))
+
+
+if __name__ == '__main__':
+    main()
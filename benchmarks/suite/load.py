@@ -0,0 +1,203 @@
+"""
+http load of every route of app/routers on running app, each scenario is sent `requests` times
+by `concurrency` clients. routes of app without scenario are listed in output as uncovered
+
+    python -m benchmarks.suite.load --url http://localhost:9999 --requests 200 --concurrency 10 \\
+        --server-pid $(pgrep -f 'uvicorn app.main' | head -1) --out load.json
+
+/books/loading/ and /jobs/loading need LOAD_BOOKS_URL of the app, e.g. benchmarks.mock_books_api
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from httpx import AsyncClient, Limits
+
+from benchmarks.suite.common import RssProbe, summarize
+from benchmarks.suite.data import make_books, csv_bytes
+
+API = '/api/v1'
+UPLOAD_ROWS = 1000
+
+
+def upload_file(run_id: str, i: int) -> Dict:
+    # новые названия в каждом файле, иначе второй запрос отвечает по digest уже загруженного файла
+    books = [{**book, 'title': f"{book['title']} {run_id}-{i}"} for book in make_books(UPLOAD_ROWS, seed=i)]
+    return {'files': {'file': (f'bench-{run_id}-{i}.csv', csv_bytes(books), 'text/csv')}}
+
+
+def make_scenarios(ids: List[str], deletable: List[str], job_ids: List[str], rng: random.Random) -> Dict:
+    """(method, route of app) -> {name of case: request of iteration number -> (path, kwargs)}"""
+    run_id = uuid4().hex[:8]
+
+    def any_id() -> str:
+        return rng.choice(ids)
+
+    return {
+        ('POST', '/books/create'): {
+            'create': lambda i: ('/books/create', {'json': {'title': f'bench {run_id} {i}', 'publication_year': 2000,
+                                                           'genre': ['fiction'], 'price': i % 5000}})},
+        ('POST', '/books/prices/bulk'): {
+            'bulk_1000': lambda i: ('/books/prices/bulk', {'json': [
+                {'book_id': book_id, 'price': rng.randint(0, 5000)}
+                for book_id in rng.sample(ids, min(1000, len(ids)))]})},
+        ('POST', '/books/archive'): {
+            'archive': lambda i: ('/books/archive', {'json': {'author': f'author {i % 50}', 'price': i % 5000}})},
+        ('POST', '/books/unarchive'): {
+            'unarchive': lambda i: ('/books/unarchive', {'json': {'author': f'author {i % 50}', 'price': i % 5000}})},
+        ('DELETE', '/books/{book_id}'): {
+            'delete': lambda i: (f'/books/{deletable.pop() if deletable else any_id()}', {})},
+        ('GET', '/books/batch'): {
+            'batch_100': lambda i: ('/books/batch', {'params': {'ids': rng.sample(ids, min(100, len(ids)))}}),
+            'batch_100_stats': lambda i: ('/books/batch', {'params': {'ids': rng.sample(ids, min(100, len(ids))),
+                                                                      'with_price_stats': 'true'}}),
+        },
+        ('GET', '/books/{book_id}'): {
+            'get': lambda i: (f'/books/{any_id()}', {})},
+        ('PATCH', '/books/{book_id}'): {
+            'patch_price': lambda i: (f'/books/{any_id()}', {'json': {'price': rng.randint(0, 5000)}})},
+        ('GET', '/books/'): {
+            'list_lim_1000': lambda i: ('/books/', {'params': {'lim': 1000, 'offset': i * 1000 % len(ids)}}),
+            'list_cursor': lambda i: ('/books/', {'params': {'lim': 100, 'cursor': '', 'order_by': 'title'}}),
+            'list_author': lambda i: ('/books/', {'params': {'lim': 100, 'author': f'author {i % 50}'}}),
+            'list_q': lambda i: ('/books/', {'params': {'lim': 20, 'q': 'winter garden'}}),
+            'list_count_facets': lambda i: ('/books/', {'params': {'lim': 20, 'author': f'author {i % 50}',
+                                                                   'include': 'count,facets'}}),
+            'list_only_archived': lambda i: ('/books/', {'params': {'lim': 100, 'only_archived': 'true'}}),
+        },
+        ('POST', '/books/file/upload-file'): {
+            'upload_csv_1000': lambda i: ('/books/file/upload-file', upload_file(run_id, i)),
+            'upload_csv_1000_stream': lambda i: ('/books/file/upload-file', {
+                'params': {'stream': 'true'}, **upload_file(run_id, 100_000 + i)}),
+        },
+        ('GET', '/books/loading/'): {
+            'loading': lambda i: ('/books/loading/', {})},
+        ('GET', '/price-history/{book_id}'): {
+            'history': lambda i: (f'/price-history/{any_id()}', {'params': {'lim': 100}}),
+            'history_cursor': lambda i: (f'/price-history/{any_id()}', {'params': {'lim': 100, 'cursor': ''}}),
+        },
+        ('GET', '/price-history/{book_id}/stats'): {
+            'stats': lambda i: (f'/price-history/{any_id()}/stats', {})},
+        ('GET', '/price-history/{book_id}/series'): {
+            'series_week': lambda i: (f'/price-history/{any_id()}/series', {'params': {'interval': 'week'}})},
+        ('GET', '/service/cache'): {
+            'cache': lambda i: ('/service/cache', {})},
+        ('GET', '/service/coalesce'): {
+            'coalesce': lambda i: ('/service/coalesce', {})},
+        ('GET', '/service/pool'): {
+            'pool': lambda i: ('/service/pool', {})},
+        ('POST', '/jobs/upload-file'): {
+            'job_upload': lambda i: ('/jobs/upload-file', upload_file(run_id, 200_000 + i))},
+        ('POST', '/jobs/loading'): {
+            'job_loading': lambda i: ('/jobs/loading', {})},
+        ('POST', '/jobs/purge'): {
+            'job_purge': lambda i: ('/jobs/purge', {})},
+        ('POST', '/jobs/history-maintenance'): {
+            'job_history_maintenance': lambda i: ('/jobs/history-maintenance', {'params': {'retention_months': 0}})},
+        ('GET', '/jobs/{job_id}'): {
+            'job': lambda i: (f'/jobs/{rng.choice(job_ids)}', {})},
+        ('GET', '/export/{entity}'): {
+            'export_books': lambda i: ('/export/books', {}),
+            'export_books_gzip': lambda i: ('/export/books', {'params': {'gzip': 'true', 'format': 'csv'}}),
+        },
+        ('GET', '/metrics'): {
+            'metrics': lambda i: ('/metrics', {})},
+    }
+
+
+# тяжелые сценарии отправляются в HEAVY раз реже
+HEAVY = {'bulk_1000', 'upload_csv_1000', 'upload_csv_1000_stream', 'loading', 'job_upload', 'job_loading',
+         'job_purge', 'job_history_maintenance', 'export_books', 'export_books_gzip', 'list_lim_1000'}
+
+
+def app_routes() -> List[tuple]:
+    from app.main import app
+    routes = []
+    for route in app.routes:
+        if route.path.startswith(API) or route.path == '/metrics':
+            for method in sorted(getattr(route, 'methods', ()) - {'HEAD'}):
+                routes.append((method, route.path[len(API):] if route.path.startswith(API) else route.path))
+    return routes
+
+
+async def send(client: AsyncClient, method: str, request, requests: int, concurrency: int,
+               server_pid: Optional[int]) -> Dict:
+    latencies = []
+    statuses = {}
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            path, kwargs = request(i)
+            url = path if path == '/metrics' else f'{API}{path}'
+            began = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                status = response.status_code
+            except Exception:
+                status = 'exception'
+            latencies.append(time.perf_counter() - began)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            # 404/409/412 это ответы api, ошибка только 5xx и обрыв соединения
+            errors += status == 'exception' or status >= 500
+
+    rss = RssProbe(server_pid) if server_pid else None
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors=errors, rss=rss, statuses=statuses)
+
+
+async def run(url: str, requests: int, concurrency: int, only: List[str], server_pid: Optional[int],
+              seed: int, heavy_divisor: int = 20) -> Dict:
+    rng = random.Random(seed)
+    async with AsyncClient(base_url=url, limits=Limits(max_connections=concurrency), timeout=300) as client:
+        ids = [book['id'] for book in (await client.get(f'{API}/books/', params={'lim': 5000})).json()]
+        if not ids:
+            raise SystemExit('no books, seed database first: python -m benchmarks.suite.data seed')
+        deletable = [(await client.post(f'{API}/books/create', json={
+            'title': f'bench delete {uuid4()}', 'publication_year': 2000, 'genre': ['fiction']})).json()['id']
+            for _ in range(requests)]
+        job_ids = [(await client.post(f'{API}/jobs/loading')).json()['job_id'] for _ in range(3)]
+
+        scenarios = make_scenarios(ids, deletable, job_ids, rng)
+        results = {}
+        for (method, route), cases in scenarios.items():
+            for name, request in cases.items():
+                case = f'http.{name}'
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                count = max(requests // heavy_divisor, 3) if name in HEAVY else requests
+                results[case] = {'method': method, 'route': route,
+                                 **await send(client, method, request, count, concurrency, server_pid)}
+                print(json.dumps({'case': case, **results[case]}))
+
+    return {'results': results, 'uncovered': [f'{method} {route}' for method, route in app_routes()
+                                              if (method, route) not in scenarios]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:9999')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--only', nargs='*', default=[], help='prefixes of cases, e.g. list_')
+    parser.add_argument('--server-pid', type=int, help='pid of app for its RSS by case')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='file for json results')
+    args = parser.parse_args()
+    output = asyncio.run(run(args.url, args.requests, args.concurrency, args.only, args.server_pid, args.seed))
+    print(json.dumps({'uncovered': output['uncovered']}))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+benchmark of reading and validation of uploaded files: rows/sec and peak RSS
+
+    python -m benchmarks.upload --rows 10000 100000 1000000
+
+every mode is run in separate process, so peak RSS of one run does not leak into another
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook, load_workbook
+
+from app.config import COLUMNS
+
+
+def make_file(path: str, rows: int):
+    header = list(COLUMNS.keys())
+    data = (
+        (f'book {i}', 1800 + i % 200, 'fiction,classic', i % 5000, f'author {i % 1000}',
+         'some description', 'https://example.com/cover.jpg')
+        for i in range(rows)
+    )
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(data)
+        return
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in data:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def run_legacy(path: str) -> int:
+    # то как check_file работал раньше: полная загрузка книги и все строки в памяти
+    from app.handlers.upload import validate_rows
+    sheet = load_workbook(path).active
+    header = [cell.value for cell in sheet[1]]
+    valid, invalid = validate_rows(header, list(sheet.iter_rows(min_row=2, values_only=True)))
+    return len(valid) + len(invalid)
+
+
+def run_stream(path: str, chunk_size: int) -> int:
+    from starlette.datastructures import UploadFile
+    from app.handlers.upload import open_rows, read_header, read_chunk, validate_rows
+
+    with open(path, 'rb') as f:
+        rows = open_rows(UploadFile(f, filename=os.path.basename(path)))
+        header = read_header(rows)
+        total = 0
+        while chunk := read_chunk(rows, chunk_size):
+            valid, invalid = validate_rows(header, chunk)
+            total += len(valid) + len(invalid)
+    return total
+
+
+def measure(mode: str, path: str, chunk_size: int) -> dict:
+    start = time.perf_counter()
+    rows = run_legacy(path) if mode == 'legacy' else run_stream(path, chunk_size)
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode, 'file': os.path.basename(path), 'rows': rows,
+        'seconds': round(elapsed, 3), 'rows_per_sec': round(rows / elapsed),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--formats', nargs='+', default=['xlsx', 'csv'])
+    parser.add_argument('--modes', nargs='+', default=['stream', 'legacy'])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.chunk_size)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            for fmt in args.formats:
+                path = os.path.join(tmp, f'books_{rows}.{fmt}')
+                make_file(path, rows)
+                for mode in args.modes:
+                    if mode == 'legacy' and fmt != 'xlsx':
+                        continue
+                    out = subprocess.run(
+                        [sys.executable, '-m', 'benchmarks.upload', '--chunk-size', str(args.chunk_size),
+                         '--child', mode, path],
+                        check=True, capture_output=True, text=True)
+                    print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    main()
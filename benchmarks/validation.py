@@ -0,0 +1,79 @@
+"""
+rows/sec of validation of uploaded rows in event loop and in process pool by number of processes,
+and how long event loop was blocked meanwhile
+
+    python -m benchmarks.validation --rows 500000 --workers 1 2 4 8
+
+every 20th row is invalid, result of pool is checked to be the same as of serial validation
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from app.config import COLUMNS
+from app.handlers.upload import validate_rows
+from app.handlers.validation import validate_rows_async, close_validation_pool
+
+
+def make_rows(rows: int):
+    return [
+        (f'book {i}', 1800 + i % 200 if i % 20 else 'year', 'fiction,classic', i % 5000, f'author {i % 1000}',
+         'some description', 'https://example.com/cover.jpg')
+        for i in range(rows)
+    ]
+
+
+async def max_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    # насколько позже срабатывает sleep, столько event loop не мог обслуживать запросы
+    lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - start - interval)
+    return lag
+
+
+async def measure(validate) -> tuple:
+    stop = asyncio.Event()
+    lag = asyncio.create_task(max_loop_lag(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    result = await validate()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return result, elapsed, await lag
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    header = list(COLUMNS.keys())
+    rows = make_rows(args.rows)
+
+    async def serial():
+        return validate_rows(header, rows)
+
+    expected, elapsed, lag = await measure(serial)
+    print(json.dumps({'mode': 'event loop', 'rows': args.rows, 'rows_per_sec': round(args.rows / elapsed),
+                      'max_loop_lag_ms': round(lag * 1000, 1)}))
+
+    for workers in sorted(set(args.workers)):
+        close_validation_pool()
+        # запуск процессов не входит в замер
+        await validate_rows_async(header, rows[:workers * 1000], workers=workers, batch_size=1000)
+        result, elapsed, lag = await measure(lambda: validate_rows_async(header, rows, workers=workers))
+        same = (result[0] == expected[0]
+                and [book.model_dump() for book in result[1]] == [book.model_dump() for book in expected[1]])
+        print(json.dumps({'mode': 'process pool', 'workers': workers, 'cpus': os.cpu_count(), 'rows': args.rows,
+                          'rows_per_sec': round(args.rows / elapsed), 'max_loop_lag_ms': round(lag * 1000, 1),
+                          'same_result': same}))
+    close_validation_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,7 @@
+# gunicorn читает этот файл из рабочей директории сам
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # livesum gauge умершего воркера больше не учитывается в /metrics
+    multiprocess.mark_process_dead(worker.pid)
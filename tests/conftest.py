@@ -0,0 +1,64 @@
+"""
+tests marked db run against postgres of REAL_DATABASE_URL migrated to head, they write their own rows
+and delete them. when the database is not reachable they are skipped
+"""
+import asyncio
+from functools import lru_cache
+
+import asyncpg
+import pytest
+from sqlalchemy.engine import make_url
+
+from app.config import REAL_DATABASE_URL
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@lru_cache(maxsize=None)
+def database_error() -> str | None:
+    url = make_url(REAL_DATABASE_URL).set(drivername='postgresql').render_as_string(hide_password=False)
+
+    async def connect():
+        connection = await asyncpg.connect(url, timeout=3)
+        await connection.close()
+
+    try:
+        asyncio.run(connect())
+    except Exception as ex:
+        return f'{type(ex).__name__}: {ex}'
+    return None
+
+
+def pytest_runtest_setup(item):
+    if item.get_closest_marker('db') and database_error():
+        pytest.skip(f'postgres is not reachable: {database_error()}')
+
+
+@pytest.fixture
+async def database():
+    """engine of app for one test: connections of asyncpg belong to event loop of the test"""
+    from app.db.database import engine
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def new_books(database):
+    """creates books by crud for the test, deletes them with their history after it"""
+    from sqlalchemy import delete
+    from app.db.cruds import book as book_crud
+    from app.db.models import Book, PriceHistory
+    created = []
+
+    async def create(**values):
+        book = await book_crud.create_book(**{'publication_year': 2000, 'genre': ['test'], **values})
+        created.append(book.id)
+        return book
+
+    yield create
+    async with database.begin() as conn:
+        await conn.execute(delete(PriceHistory).where(PriceHistory.book_id.in_(created)))
+        await conn.execute(delete(Book).where(Book.id.in_(created)))
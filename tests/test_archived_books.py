@@ -0,0 +1,38 @@
+"""archived books are changed only by unarchive: PATCH and repricing treat them as missing"""
+from uuid import uuid4
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.db.cruds import book as book_crud
+from app.main import app
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+async def test_archived_book_is_not_patched(new_books):
+    book = await new_books(title=f'archived {uuid4()}', price=10)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test/api/v1') as client:
+        assert (await client.delete(f'/books/{book.id}')).status_code == 200
+
+        response = await client.patch(f'/books/{book.id}', json={'price': 20})
+        assert response.status_code == 404
+
+        response = await client.get(f'/books/{book.id}', params={'include_archived': True})
+        assert response.json()['price'] == 10 and response.json()['archived']
+
+
+async def test_patch_does_not_archive(new_books):
+    book = await new_books(title=f'active {uuid4()}', price=10)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test/api/v1') as client:
+        response = await client.patch(f'/books/{book.id}', json={'title': f'renamed {uuid4()}', 'archived': True})
+        assert response.status_code == 200 and not response.json()['archived']
+
+
+async def test_archived_book_is_not_repriced(new_books):
+    active = await new_books(title=f'active {uuid4()}', price=10)
+    archived = await new_books(title=f'archived {uuid4()}', price=10)
+    await book_crud.delete_book(book_id=archived.id)
+
+    statuses = await book_crud.update_prices({active.id: 20, archived.id: 20})
+    assert statuses == {active.id: 'updated', archived.id: 'not_found'}
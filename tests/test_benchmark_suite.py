@@ -0,0 +1,38 @@
+import random
+
+from benchmarks.suite import cruds, load
+from benchmarks.suite.common import RssProbe, compare, summarize
+
+
+def test_every_crud_and_route_has_case():
+    cases = cruds.make_cases([1], [1], random.Random(1))
+    covered = {'.'.join(name.split('.')[:2]) for name in cases}
+    assert [name for name in cruds.public_cruds() if name not in covered] == []
+    scenarios = load.make_scenarios(['a'], ['b'], ['j'], random.Random(1))
+    assert [route for route in load.app_routes() if route not in scenarios] == []
+
+
+def test_rss_is_measured_by_case():
+    rss = RssProbe()
+    block = bytearray(64 * 2 ** 20)
+    block[::4096] = b'x' * len(block[::4096])
+    result = summarize([0.001] * 10, 1.0, rss=rss)
+    assert result['rss_delta_mb'] >= 50
+    if rss.peak_reset:
+        assert result['peak_rss_mb'] >= 50
+    # следующий случай начинается с нового пика
+    del block
+    rss = RssProbe()
+    result = summarize([0.001], 1.0, rss=rss)
+    assert result['rss_delta_mb'] < 50
+
+
+def test_compare_reports_regressions():
+    base = {'case': {'throughput': 100.0, 'p95_ms': 10.0, 'rss_delta_mb': 1.0, 'peak_rss_mb': 100.0,
+                     'error_rate': 0.0}}
+    same = {'case': {**base['case'], 'rss_delta_mb': 4.0}}
+    assert compare(same, base) == []
+    worse = {'case': {'throughput': 50.0, 'p95_ms': 20.0, 'rss_delta_mb': 40.0, 'peak_rss_mb': 200.0,
+                      'error_rate': 0.1}}
+    assert len(compare(worse, base)) == 5
+    assert compare({'other': worse['case']}, base) == []
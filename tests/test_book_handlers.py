@@ -0,0 +1,29 @@
+import pytest
+from fastapi import HTTPException
+
+from app.handlers.book import _parse_include, etag, if_match_version
+
+
+@pytest.mark.parametrize('header, version', [(None, None), ('*', None), (' * ', None), ('"3"', 3),
+                                             ('W/"3"', 3), ('3', 3), (etag(12), 12)])
+def test_if_match_version(header, version):
+    assert if_match_version(header) == version
+
+
+@pytest.mark.parametrize('header', ['"abc"', '"3", "4"', 'W/'])
+def test_bad_if_match_is_400(header):
+    with pytest.raises(HTTPException) as error:
+        if_match_version(header)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('include, parts', [(None, set()), ('', set()), ('count', {'count'}),
+                                            (' facets , count,', {'count', 'facets'})])
+def test_parse_include(include, parts):
+    assert _parse_include(include) == parts
+
+
+def test_unknown_include_is_400():
+    with pytest.raises(HTTPException) as error:
+        _parse_include('count,history')
+    assert error.value.status_code == 400
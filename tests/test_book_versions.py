@@ -0,0 +1,87 @@
+"""version of book, If-Match and history of price under concurrent PATCH"""
+import asyncio
+import random
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select
+
+from app.db.cruds import book as book_crud
+from app.db.models import PriceHistory
+from app.dto.book import UpdateBook
+from app.main import app
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+async def price_history(database, book_id):
+    async with database.connect() as conn:
+        return list(await conn.scalars(select(PriceHistory.price).where(PriceHistory.book_id == book_id)
+                                       .order_by(PriceHistory.created_at, PriceHistory.id)))
+
+
+async def test_if_match_of_other_version_is_412(new_books):
+    book = await new_books(title=f'version {uuid4()}', price=10)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test/api/v1') as client:
+        response = await client.get(f'/books/{book.id}')
+        etag = response.headers['ETag']
+        assert etag == f'"{book.version}"'
+
+        response = await client.patch(f'/books/{book.id}', json={'price': 20}, headers={'If-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"{book.version + 1}"'
+
+        # тот же ETag уже устарел
+        response = await client.patch(f'/books/{book.id}', json={'price': 30}, headers={'If-Match': etag})
+        assert response.status_code == 412
+        assert response.json()['detail']['version'] == book.version + 1
+
+        response = await client.patch(f'/books/{book.id}', json={'author': 'x'},
+                                      headers={'If-Match': f'W/"{book.version + 1}"'})
+        assert response.status_code == 200
+        response = await client.patch(f'/books/{book.id}', json={'price': 40}, headers={'If-Match': '*'})
+        assert response.status_code == 200 and response.json()['price'] == 40
+
+        response = await client.patch(f'/books/{book.id}', json={'price': 50}, headers={'If-Match': 'abc'})
+        assert response.status_code == 400
+
+
+async def test_concurrent_price_patches_keep_history_consistent(database, new_books):
+    book = await new_books(title=f'stress {uuid4()}', price=0)
+    rng = random.Random(18)
+    written = []
+
+    async def writer():
+        for _ in range(10):
+            try:
+                result = await book_crud.update_book(book.id, UpdateBook(price=rng.randint(0, 3)))
+            except HTTPException as ex:
+                # 409 - цену одновременно меняли другие, запрос можно повторить
+                assert ex.status_code == 409
+                continue
+            written.append(result)
+
+    await asyncio.gather(*(writer() for _ in range(10)))
+
+    current = await book_crud.get_book(book.id)
+    prices = await price_history(database, book.id)
+    # каждый успешный PATCH - одна версия, каждая смена цены - одна строка истории
+    assert current.version == book.version + len(written)
+    assert len(prices) == sum(result['flag'] for result in written)
+    if prices:
+        assert prices[-1] == current.price
+    assert all(previous != price for previous, price in zip([0] + prices, prices))
+
+
+async def test_expected_version_of_crud(new_books):
+    book = await new_books(title=f'expected {uuid4()}', price=1)
+    result = await book_crud.update_book(book.id, UpdateBook(price=2), expected_version=book.version)
+    assert result['book']['version'] == book.version + 1 and result['flag']
+    with pytest.raises(HTTPException) as error:
+        await book_crud.update_book(book.id, UpdateBook(price=3), expected_version=book.version)
+    assert error.value.status_code == 412
+    with pytest.raises(HTTPException) as error:
+        await book_crud.update_book(uuid4(), UpdateBook(price=3))
+    assert error.value.status_code == 404
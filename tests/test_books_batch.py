@@ -0,0 +1,27 @@
+"""GET /books/batch over http: rows of one query go to orjson as they are"""
+from uuid import uuid4
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.db.cruds import price_history as history_crud
+from app.main import app
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+async def test_batch_in_order_of_ids(new_books):
+    first = await new_books(title=f'batch {uuid4()}', price=10)
+    second = await new_books(title=f'batch {uuid4()}', price=20)
+    await history_crud.create_history(book_id=first.id, price=10)
+    missing = uuid4()
+    ids = [str(second.id), str(missing), str(first.id), str(second.id)]
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test/api/v1') as client:
+        response = await client.get('/books/batch', params={'ids': ids, 'with_price_stats': True})
+    assert response.status_code == 200
+    items = response.json()
+    assert [item['id'] for item in items] == ids
+    assert [item['status'] for item in items] == ['found', 'not_found', 'found', 'found']
+    assert (items[0]['book']['id'], items[0]['book']['price']) == (str(second.id), 20)
+    assert items[2]['book']['title'] == first.title
+    assert (items[2]['price_stats']['book_id'], items[2]['price_stats']['current_price']) == (str(first.id), 10)
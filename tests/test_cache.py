@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import ALL, BookCache, LRUCache
+
+pytestmark = pytest.mark.anyio
+
+
+def loader(value):
+    async def load():
+        return value
+    return load
+
+
+async def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    await cache.set('a', 1)
+    await cache.set('b', 2)
+    assert await cache.get('a') == 1
+    await cache.set('c', 3)
+    assert await cache.get('b') is None
+    assert await cache.get('a') == 1 and await cache.get('c') == 3
+    assert cache.stats['evictions'] == 1
+
+
+async def test_lru_expires_by_ttl():
+    cache = LRUCache(maxsize=10, ttl=60)
+    await cache.set('a', 1, ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await cache.get('a') is None
+    assert cache.stats['expired'] == 1
+
+
+async def test_evict_drops_book_and_lists():
+    cache = BookCache(LRUCache())
+    assert await cache.book('a', loader({'id': 'a'})) == {'id': 'a'}
+    await cache.books({'page': 1}, loader(['a']))
+    await cache.evict('a')
+    assert await cache.book('a', loader({'id': 'new'})) == {'id': 'new'}
+    assert await cache.books({'page': 1}, loader(['new'])) == ['new']
+
+
+async def test_value_read_before_invalidation_is_not_cached():
+    cache = BookCache(LRUCache())
+
+    async def slow_loader():
+        await cache.evict(ALL)
+        return {'id': 'old'}
+
+    await cache.book('a', slow_loader)
+    assert await cache.book('a', loader({'id': 'new'})) == {'id': 'new'}
+
+
+async def test_evicts_again_after_commit():
+    cache = BookCache(LRUCache())
+    session = AsyncSession()
+    for _ in range(2):
+        cache._evict_after_commit(session, 'a')
+        # старую строку положил запрос, прочитавший ее до commit
+        await cache.book('a', loader({'id': 'old'}))
+        await session.commit()
+        await asyncio.gather(*cache._tasks)
+        assert await cache.book('a', loader({'id': 'new'})) == {'id': 'new'}
+        await cache.evict('a')
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import BookCache
+from app.coalesce import Coalescer
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_requests_share_one_call():
+    coalescer = Coalescer('test', ttl=0)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*[coalescer.get({'page': 1}, loader) for _ in range(10)])
+    assert results == [1] * 10 and calls == 1
+    assert coalescer.stats['miss'] == 1 and coalescer.stats['coalesced'] == 9
+    # без ttl результат не хранится
+    assert await coalescer.get({'page': 1}, loader) == 2
+
+
+async def test_ttl_and_stale_refresh_in_background():
+    coalescer = Coalescer('test', ttl=0.02, stale=10)
+    values = iter([1, 2])
+
+    async def loader():
+        return next(values)
+
+    assert await coalescer.get({}, loader) == 1
+    assert await coalescer.get({}, loader) == 1
+    await asyncio.sleep(0.03)
+    # устаревшее отдается сразу, обновление идет в фоне
+    assert await coalescer.get({}, loader) == 1
+    await asyncio.sleep(0)
+    assert await coalescer.get({}, loader) == 2
+    assert coalescer.stats == {'hit': 2, 'stale': 1, 'coalesced': 0, 'miss': 1}
+
+
+async def test_result_started_before_clear_is_not_stored():
+    coalescer = Coalescer('test', ttl=60)
+
+    async def loader():
+        coalescer.clear()
+        return 'old'
+
+    await coalescer.get({}, loader)
+    assert coalescer.info()['size'] == 0
+
+
+async def test_request_after_clear_does_not_join_older_call():
+    coalescer = Coalescer('test', ttl=0)
+    started, release = asyncio.Event(), asyncio.Event()
+    values = iter(['old', 'new'])
+
+    async def loader():
+        value = next(values)
+        if value == 'old':
+            started.set()
+            await release.wait()
+        return value
+
+    old = asyncio.create_task(coalescer.get({}, loader))
+    await started.wait()
+    coalescer.clear()
+    assert await asyncio.wait_for(coalescer.get({}, loader), 1) == 'new'
+    release.set()
+    assert await old == 'old'
+    assert coalescer.info()['inflight'] == 0
+
+
+async def test_micro_cache_is_cleared_after_commit_without_book_cache():
+    coalescer = Coalescer('test', ttl=60)
+    cache = BookCache(None)
+    session = AsyncSession()
+
+    async def loader():
+        return 'old'
+
+    await cache.invalidate(session, ['a'])
+    # до commit запрос еще читает старое и кладет его в micro cache
+    await coalescer.get({}, loader)
+    assert coalescer.info()['size'] == 1
+    await session.commit()
+    assert coalescer.info()['size'] == 0
@@ -0,0 +1,44 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.db.cruds import book as book_crud
+from app.db.models import Book
+
+# ":memo" литералом в тексте sql стал бы параметром, а "\" удваивался
+TITLE = 'c++ :memo \\d'
+
+
+def test_explain_keeps_values_as_parameters():
+    stmt = book_crud.apply_book_filters(select(Book.id), title=TITLE, q=TITLE)
+    compiled = book_crud._Explain(stmt).compile(dialect=asyncpg.dialect())
+    assert str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT')
+    assert ':memo' not in str(compiled) and '\\' not in str(compiled)
+    assert sorted(compiled.params.values()) == [TITLE, TITLE]
+
+
+@pytest.mark.db
+@pytest.mark.anyio
+async def test_count_with_colon_and_backslash(new_books):
+    title = f'{TITLE} {uuid4()}'
+    await new_books(title=title)
+    assert await book_crud.count_books({'title': title}) == {'total': 1, 'estimated': False}
+    assert (await book_crud.count_books({'q': title}))['total'] >= 0
+    estimate = await book_crud.count_books({'title': title, 'q': 'c++ :memo'}, threshold=0)
+    assert estimate['estimated'] is True
+
+
+@pytest.mark.db
+@pytest.mark.anyio
+async def test_facets_of_filtered_books(new_books):
+    author = f'facets {uuid4()}'
+    await new_books(title=f'facets {uuid4()}', author=author, genre=['poetry', 'drama'], price=120)
+    await new_books(title=f'facets {uuid4()}', author=author, genre=['poetry'], price=900, publication_year=2010)
+    facets = await book_crud.book_facets({'author': author}, price_step=500, year_step=10)
+    assert facets['genre'] == [{'value': 'poetry', 'count': 2}, {'value': 'drama', 'count': 1}]
+    assert facets['author'] == [{'value': author, 'count': 2}]
+    assert facets['price'] == [{'start': 0, 'end': 500, 'count': 1}, {'start': 500, 'end': 1000, 'count': 1}]
+    assert facets['publication_year'] == [{'start': 2000, 'end': 2010, 'count': 1},
+                                          {'start': 2010, 'end': 2020, 'count': 1}]
@@ -0,0 +1,49 @@
+"""
+regression of search plans as benchmarks.explain_search, on rows of the test in transaction
+which is rolled back: every filter of list of books has to be served by its index
+"""
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select, text
+
+from app.db.cruds.book import _Explain, apply_book_filters
+from app.db.models import Book
+from benchmarks.explain_search import used_indexes
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+ROWS = 50_000
+
+SEED = text(
+    "INSERT INTO books (id, title, author, publication_year, genre, description, price, archived, fingerprint) "
+    "SELECT gen_random_uuid(), :prefix || ' book ' || i, :prefix || ' author ' || i % 5000, 1800 + i % 200, "
+    "CASE WHEN i % 100 = 0 THEN ARRAY[:prefix || ' poetry'] ELSE ARRAY['fiction', 'classic'] END, "
+    "'some description with rare words ' || i, i % 10000 + 100000, false, "
+    "encode(sha256(convert_to(:prefix || ' book ' || i, 'UTF8')), 'hex') "
+    "FROM generate_series(1, :n) AS i")
+
+
+async def test_search_filters_use_indexes(database):
+    prefix = uuid4().hex[:8]
+    cases = [
+        ({'title': f'{prefix} book 777'}, 'books_title_key'),
+        ({'author': f'{prefix} author 13'}, 'ix_books_author_active'),
+        ({'price': 104242}, 'ix_books_price_active'),
+        ({'genres': f'{prefix} poetry'}, 'ix_books_genre'),
+        ({'description': 'rare words 4321'}, 'ix_books_description_trgm'),
+        ({'q': f'{prefix} 4321'}, 'ix_books_search_vector'),
+    ]
+    async with database.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(SEED, {'prefix': prefix, 'n': ROWS})
+            await conn.execute(text('ANALYZE books'))
+            # без LIMIT: на 50 тысячах строк с LIMIT 10 postgres честно выбирает seq scan
+            for filters, expected in cases:
+                stmt = apply_book_filters(select(Book.id), **filters)
+                plan = (await conn.execute(_Explain(stmt))).scalar()
+                indexes, seq_scan = used_indexes(plan[0]['Plan'])
+                assert expected in indexes and not seq_scan, (filters, indexes)
+        finally:
+            await transaction.rollback()
@@ -0,0 +1,21 @@
+"""incremental export: rows committed after since was taken still come with next export"""
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.config import EXPORT_SINCE_OVERLAP
+from app.db.cruds import export as export_crud
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+async def exported_ids(since):
+    return {row['id'] async for rows in export_crud.stream_rows('books', since) for row in rows}
+
+
+async def test_since_overlaps_rows_written_before_it(new_books):
+    book = await new_books(title=f'export {uuid4()}')
+    # книга с updated_at чуть раньше since: ее транзакция закоммитилась уже после прошлой выгрузки
+    assert book.id in await exported_ids(book.updated_at + timedelta(seconds=1))
+    assert book.id not in await exported_ids(book.updated_at + timedelta(seconds=EXPORT_SINCE_OVERLAP + 1))
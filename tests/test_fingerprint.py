@@ -0,0 +1,23 @@
+import io
+
+from app.db.fingerprint import book_fingerprint, file_digest, normalize_title
+
+
+def test_title_is_normalized():
+    assert normalize_title('  Война   и\tМИР ') == 'война и мир'
+    # NFKC: лигатура и полноширинные буквы как обычные
+    assert normalize_title('ﬁsh ＡＢＣ') == 'fish abc'
+
+
+def test_fingerprint_of_same_title():
+    assert book_fingerprint('Война и мир') == book_fingerprint(' война  И мир')
+    assert book_fingerprint('Война и мир') != book_fingerprint('Война и мир 2')
+    assert len(book_fingerprint('x')) == 64
+
+
+def test_file_digest_returns_to_start():
+    file = io.BytesIO(b'a' * 3_000_000)
+    file.seek(10)
+    first = file_digest(file, block_size=1000)
+    assert file.tell() == 0
+    assert first == file_digest(file)
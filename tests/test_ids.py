@@ -0,0 +1,34 @@
+import time
+from uuid import UUID
+
+from app.db.ids import uuid7, uuid7_many
+
+
+def unix_ms(value: UUID) -> int:
+    return value.int >> 80
+
+
+def test_version_and_variant():
+    for value in uuid7_many(1000) + [uuid7()]:
+        assert value.version == 7
+        assert value.variant == 'specified in RFC 4122'
+
+
+def test_time_of_id():
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    after = time.time_ns() // 1_000_000
+    # пачка больше 4096 могла занять следующие миллисекунды, здесь она одна
+    assert before <= unix_ms(value) <= after + 1
+
+
+def test_ids_increase_inside_batch_and_between_calls():
+    ids = uuid7_many(10_000) + uuid7_many(3) + [uuid7() for _ in range(100)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_uuid_order_is_order_of_bytes():
+    # postgres сравнивает uuid побайтно, поэтому порядок python должен совпадать с порядком bytes
+    ids = uuid7_many(5000)
+    assert [value.bytes for value in ids] == sorted(value.bytes for value in ids)
@@ -0,0 +1,125 @@
+"""import from third party api against benchmarks.mock_books_api, writes and checkpoints are in memory"""
+import random
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+
+from app.handlers import importer
+from benchmarks.mock_books_api import make_handler
+
+pytestmark = pytest.mark.anyio
+
+TOTAL = 1000
+# каждая 50-я книга мока невалидна
+INVALID = len(range(0, TOTAL, 50))
+
+
+class Checkpoints:
+    def __init__(self, position: int = 0):
+        self.position = position
+        self.saved = []
+        self.deleted = False
+
+    async def get_checkpoint(self, url):
+        return self.position
+
+    async def save_checkpoint(self, url, position):
+        self.saved.append(position)
+
+    async def delete_checkpoint(self, url):
+        self.deleted = True
+
+
+@pytest.fixture
+def books_api():
+    servers = []
+
+    def start(total: int = TOTAL, fail_rate: float = 0.0) -> str:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(total, fail_rate))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}/books'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+async def written(monkeypatch):
+    """titles written by flush_chunk instead of database"""
+    titles = []
+
+    async def flush_chunk(valid, invalid, report, on_conflict=None, on_progress=None):
+        titles.extend(book['title'] for book in valid)
+        report['parsed_count'] += len(valid) + len(invalid)
+        report['valid_count'] += len(valid)
+        report['invalid_count'] += len(invalid)
+
+    monkeypatch.setattr(importer, 'flush_chunk', flush_chunk)
+    monkeypatch.setattr(importer, 'IMPORT_BACKOFF', 0.001)
+    yield titles
+    # клиент привязан к event loop теста
+    await importer.close_http_client()
+
+
+@pytest.mark.parametrize('page_size', [0, 100, 128])
+async def test_import_reads_every_book_once(monkeypatch, books_api, written, page_size):
+    checkpoints = Checkpoints()
+    monkeypatch.setattr(importer, 'checkpoint_crud', checkpoints)
+    monkeypatch.setattr(importer, 'IMPORT_PAGE_SIZE', page_size)
+    monkeypatch.setattr(importer, 'UPLOAD_CHUNK_SIZE', 64)
+    report = await importer.import_books(url=books_api())
+    assert report['parsed_count'] == TOTAL and report['invalid_count'] == INVALID
+    assert sorted(written) == sorted({f'mock book {i}' for i in range(TOTAL) if i % 50})
+    assert checkpoints.saved == sorted(checkpoints.saved) and checkpoints.deleted
+
+
+async def test_failed_requests_are_retried(monkeypatch, books_api, written):
+    random.seed(8)
+    monkeypatch.setattr(importer, 'checkpoint_crud', Checkpoints())
+    monkeypatch.setattr(importer, 'IMPORT_PAGE_SIZE', 50)
+    monkeypatch.setattr(importer, 'IMPORT_RETRIES', 20)
+    report = await importer.import_books(url=books_api(fail_rate=0.3))
+    assert report['parsed_count'] == TOTAL
+    assert len(written) == len(set(written)) == TOTAL - INVALID
+
+
+async def test_import_continues_from_checkpoint(monkeypatch, books_api, written):
+    monkeypatch.setattr(importer, 'checkpoint_crud', Checkpoints(position=4))
+    monkeypatch.setattr(importer, 'IMPORT_PAGE_SIZE', 100)
+    report = await importer.import_books(url=books_api())
+    assert report['resumed_from'] == 4
+    assert report['parsed_count'] == TOTAL - 400
+    assert min(int(title.rsplit(' ', 1)[1]) for title in written) == 401
+
+
+async def test_source_which_keeps_failing_is_502(monkeypatch, books_api, written):
+    checkpoints = Checkpoints()
+    monkeypatch.setattr(importer, 'checkpoint_crud', checkpoints)
+    monkeypatch.setattr(importer, 'IMPORT_PAGE_SIZE', 100)
+    monkeypatch.setattr(importer, 'IMPORT_RETRIES', 2)
+    with pytest.raises(HTTPException) as error:
+        await importer.import_books(url=books_api(fail_rate=1.0))
+    assert error.value.status_code == 502
+    assert not checkpoints.deleted
+
+
+async def test_broken_json_is_not_retried(monkeypatch, books_api, written):
+    monkeypatch.setattr(importer, 'checkpoint_crud', Checkpoints())
+    monkeypatch.setattr(importer, 'IMPORT_PAGE_SIZE', 0)
+    monkeypatch.setattr(importer, 'IMPORT_RETRIES', 5)
+    calls = []
+
+    async def iter_json_array(chunks):
+        calls.append(1)
+        raise ValueError('JSON массив оборвался')
+        yield
+
+    monkeypatch.setattr(importer, 'iter_json_array', iter_json_array)
+    with pytest.raises(HTTPException) as error:
+        await importer.import_books(url=books_api())
+    assert error.value.status_code == 502 and len(calls) == 1
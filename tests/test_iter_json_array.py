@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from app.handlers.importer import iter_json_array
+
+pytestmark = pytest.mark.anyio
+
+ITEMS = [{'title': 'a, "b"]', 'genre': ['x', 'y']}, 1, 'строка', [1, [2]], None, {'price': 10.5}]
+
+
+async def chunked(text: str, size: int):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+async def test_items_from_any_chunks(size):
+    text = json.dumps(ITEMS, ensure_ascii=False, indent=1)
+    assert [item async for item in iter_json_array(chunked(text, size))] == ITEMS
+
+
+async def test_empty_array():
+    assert [item async for item in iter_json_array(chunked(' [ ] ', 1))] == []
+
+
+async def test_number_cut_by_chunk_is_not_yielded_early():
+    assert [item async for item in iter_json_array(chunked('[12, 345]', 2))] == [12, 345]
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1, 2', '[{"a": 1}'])
+async def test_not_array_or_cut_array(text):
+    with pytest.raises(ValueError):
+        [item async for item in iter_json_array(chunked(text, 3))]
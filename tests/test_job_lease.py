@@ -0,0 +1,89 @@
+"""file of job in database, lease of claimed job and limit of attempts"""
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.config import JOB_MAX_ATTEMPTS
+from app.db.cruds import import_job as job_crud
+from app.db.models import ImportJob
+from app.handlers import job as job_handlers
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+@pytest.fixture
+async def kind(database):
+    # свой kind: задачи воркеров этой базы не мешают проверке
+    kind = f'test-{uuid4()}'
+    yield kind
+    async with database.begin() as conn:
+        await conn.execute(delete(ImportJob).where(ImportJob.kind == kind))
+
+
+async def chunks(*values):
+    for value in values:
+        yield value
+
+
+async def take(database, job_id, **values):
+    """job as claimed by some worker, without claim_job which takes the oldest job of any kind"""
+    lease = uuid4()
+    async with database.begin() as conn:
+        await conn.execute(update(ImportJob).where(ImportJob.id == job_id)
+                           .values({'status': 'running', 'lease': lease, 'attempts': ImportJob.attempts + 1, **values}))
+    return lease
+
+
+async def job_row(database, job_id):
+    async with database.connect() as conn:
+        return (await conn.execute(select(ImportJob.status, ImportJob.progress).where(ImportJob.id == job_id))).one()
+
+
+async def test_payload_is_read_back_and_dropped_when_job_is_done(database, kind):
+    job = await job_crud.create_job(kind, {}, payload=chunks(b'title\n', b'book 1\n', b'book 2\n'))
+    assert [data async for data in job_crud.iter_payload(job.id)] == [b'title\n', b'book 1\n', b'book 2\n']
+    lease = await take(database, job.id)
+    assert await job_crud.finish_job(job.id, lease, {})
+    assert [data async for data in job_crud.iter_payload(job.id)] == []
+
+
+async def test_worker_with_old_lease_does_not_change_job(database, kind):
+    job = await job_crud.create_job(kind, {})
+    old = await take(database, job.id)
+    new = await take(database, job.id)
+    assert not await job_crud.update_progress(job.id, old, {'parsed_count': 1})
+    assert not await job_crud.finish_job(job.id, old, {})
+    assert not await job_crud.fail_job(job.id, old, 'error')
+    assert await job_crud.update_progress(job.id, new, {'parsed_count': 2})
+    assert tuple(await job_row(database, job.id)) == ('running', {'parsed_count': 2})
+
+
+async def test_job_of_lost_lease_is_stopped(database, kind, monkeypatch):
+    job = await job_crud.create_job(kind, {})
+    old = await take(database, job.id)
+    calls = []
+
+    async def runner(params, on_progress):
+        calls.append(1)
+        # пока воркер работал, задачу забрал другой
+        await take(database, job.id)
+        await on_progress({'parsed_count': 1})
+        calls.append(2)
+        return {}
+
+    monkeypatch.setitem(job_handlers.RUNNERS, kind, runner)
+    await job_handlers.run_job({'id': job.id, 'kind': kind, 'params': {}, 'attempts': 1, 'lease': old})
+    assert calls == [1]
+    assert tuple(await job_row(database, job.id)) == ('running', {})
+
+
+async def test_job_out_of_attempts_is_failed_on_claim(database, kind):
+    job = await job_crud.create_job(kind, {}, payload=chunks(b'data'))
+    lease = await take(database, job.id, attempts=JOB_MAX_ATTEMPTS)
+    # воркер остановили на последней попытке, задача вернулась в очередь
+    assert await job_crud.fail_job(job.id, lease, 'Воркер остановлен', retry=True)
+    claimed = await job_crud.claim_job()
+    assert claimed is None or claimed['id'] != job.id
+    assert (await job_row(database, job.id)).status == 'failed'
+    assert [data async for data in job_crud.iter_payload(job.id)] == []
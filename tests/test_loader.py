@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.db.loader import DataLoader
+
+pytestmark = pytest.mark.anyio
+
+
+class Source:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, keys):
+        self.batches.append(list(keys))
+        if self.fail:
+            raise RuntimeError('db is down')
+        return {key: key * 10 for key in keys if key != 0}
+
+
+async def test_keys_of_one_tick_go_in_one_batch():
+    source = Source()
+    loader = DataLoader(source)
+    assert await loader.load_many([1, 2, 1, 0, 3]) == [10, 20, 10, None, 30]
+    assert source.batches == [[1, 2, 0, 3]]
+    # загруженное значение берется из загрузчика без запроса
+    assert await loader.load(2) == 20
+    assert len(source.batches) == 1
+
+
+async def test_concurrent_callers_share_batch():
+    source = Source()
+    loader = DataLoader(source)
+
+    async def caller(keys):
+        return await loader.load_many(keys)
+
+    results = await asyncio.gather(caller([1]), caller([2, 3]), caller([1]))
+    assert results == [[10], [20, 30], [10]]
+    assert source.batches == [[1, 2, 3]]
+
+
+async def test_max_batch_size():
+    source = Source()
+    loader = DataLoader(source, max_batch_size=2)
+    assert await loader.load_many([1, 2, 3, 4, 5]) == [10, 20, 30, 40, 50]
+    assert source.batches == [[1, 2], [3, 4], [5]]
+
+
+async def test_error_goes_to_every_caller_and_next_load_retries():
+    source = Source(fail=True)
+    loader = DataLoader(source)
+    results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    source.fail = False
+    assert await loader.load(1) == 10
+    assert source.batches == [[1, 2], [1]]
@@ -0,0 +1,32 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from app.db.models import Book
+from app.db.pagination import decode_cursor, encode_cursor, split_page
+
+COLUMNS = [Book.created_at, Book.id]
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 10, 18, 12, 30, 1, 123456), uuid4()]
+    token = encode_cursor('created_at', values)
+    assert decode_cursor(token, 'created_at', COLUMNS) == values
+
+
+@pytest.mark.parametrize('token', ['', 'not base64 at all', encode_cursor('title', ['a', str(uuid4())]),
+                                   encode_cursor('created_at', ['2026-10-18T12:30:01'])])
+def test_bad_cursor_is_400(token):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(token, 'created_at', COLUMNS)
+    assert error.value.status_code == 400
+
+
+def test_split_page():
+    rows = [{'id': i} for i in range(3)]
+    assert split_page(rows, 3, 'id', ['id']) == (rows, None)
+    page, cursor = split_page(rows, 2, 'id', ['id'])
+    assert page == rows[:2]
+    assert cursor == encode_cursor('id', [1])
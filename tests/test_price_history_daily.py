@@ -0,0 +1,76 @@
+"""reads of price history over days of compacted partitions (price_history_daily) and raw rows"""
+from datetime import date, datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, text
+
+from app.db.cruds import price_history as history_crud
+from app.db.models import PriceHistoryDaily
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+OLD_DAYS = [date(2020, 1, 10), date(2020, 1, 11)]
+
+
+@pytest.fixture
+async def compacted_book(database, new_books):
+    """book with two compacted days and two raw changes of price"""
+    book = await new_books(title=f'compacted {uuid4()}', price=50)
+    async with database.begin() as conn:
+        await conn.execute(insert(PriceHistoryDaily), [
+            {'book_id': book.id, 'day': OLD_DAYS[0], 'open': 10, 'high': 30, 'low': 10, 'close': 20,
+             'changes': 3, 'price_sum': 60},
+            {'book_id': book.id, 'day': OLD_DAYS[1], 'open': 25, 'high': 25, 'low': 5, 'close': 5,
+             'changes': 2, 'price_sum': 30},
+        ])
+    for price in (50, 70):
+        await history_crud.create_history(book_id=book.id, price=price)
+    return book
+
+
+async def test_stats_of_range_count_compacted_days(compacted_book):
+    stats = await history_crud.get_price_stats(compacted_book.id, date_from=datetime(2019, 1, 1),
+                                               date_to=datetime.now() + timedelta(days=1))
+    # 3 + 2 изменения свернутых дней и две сырые строки
+    assert stats['change_count'] == 7
+    assert stats['avg_price'] == (60 + 30 + 50 + 70) / 7
+    assert (stats['min_price'], stats['max_price'], stats['current_price']) == (5, 70, 70)
+    assert stats['first_change_at'] == datetime(2020, 1, 10)
+
+    old = await history_crud.get_price_stats(compacted_book.id, date_from=datetime(2020, 1, 11),
+                                             date_to=datetime(2020, 2, 1))
+    assert (old['change_count'], old['current_price'], old['avg_price']) == (2, 5, 15)
+
+
+async def test_history_pages_go_from_compacted_days_to_raw_rows(compacted_book):
+    rows, cursor = [], ''
+    while cursor is not None:
+        page = await history_crud.get_history_book(compacted_book.id, lim=1, offset=0, cursor=cursor)
+        rows.extend(page['history'])
+        cursor = page['next_cursor']
+    assert [row['price'] for row in rows] == [20, 5, 50, 70]
+    assert [row['id'] for row in rows[:2]] == [history_crud.COMPACTED_DAY_ID] * 2
+    assert rows[0]['created_at'] == datetime(2020, 1, 10)
+
+    old = await history_crud.get_history_book(compacted_book.id, lim=10, offset=0,
+                                              date_from=datetime(2020, 1, 11), date_to=datetime(2020, 2, 1))
+    assert [row['price'] for row in old] == [5]
+
+
+async def test_rollup_of_same_rows_again_keeps_days(database, compacted_book):
+    name = f'price_history_test_{uuid4().hex[:8]}'
+    partition = history_crud._partition_table(name)
+    async with database.begin() as conn:
+        await conn.execute(text(f'CREATE TEMP TABLE {name} (id uuid, book_id uuid, price int, created_at timestamp)'))
+        await conn.execute(partition.insert(), [
+            {'id': uuid4(), 'book_id': compacted_book.id, 'price': price, 'created_at': created_at}
+            for price, created_at in [(10, datetime(2020, 1, 10, 9)), (30, datetime(2020, 1, 10, 12)),
+                                      (20, datetime(2020, 1, 10, 18))]])
+        first = (await conn.execute(history_crud._rollup_stmt(partition))).one()
+        second = (await conn.execute(history_crud._rollup_stmt(partition))).one()
+        day = (await conn.execute(text('SELECT open, high, low, close, changes, price_sum FROM price_history_daily '
+                                       'WHERE book_id = :book_id AND day = :day'),
+                                  {'book_id': compacted_book.id, 'day': OLD_DAYS[0]})).one()
+    assert tuple(first) == tuple(second) == (1, 3)
+    assert tuple(day) == (10, 30, 10, 20, 3, 60)
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from app.db.cruds.price_history import _merge_bars
+
+WEEK = datetime(2026, 10, 12)
+NEXT_WEEK = datetime(2026, 10, 19)
+
+
+def bar(bucket, open_, high, low, close, changes):
+    return {'bucket': bucket, 'open': open_, 'high': high, 'low': low, 'close': close, 'changes': changes}
+
+
+def test_week_from_daily_and_raw_rows_is_one_bar():
+    bars = [bar(WEEK, 100, 150, 90, 120, 4), bar(WEEK, 130, 140, 80, 110, 2), bar(NEXT_WEEK, 110, 110, 100, 100, 1)]
+    assert _merge_bars(bars) == [bar(WEEK, 100, 150, 80, 110, 6), bar(NEXT_WEEK, 110, 110, 100, 100, 1)]
+    # входные словари не меняются
+    assert bars[0]['changes'] == 4
+
+
+def test_bars_without_common_bucket_are_kept():
+    bars = [bar(WEEK, 1, 2, 1, 2, 1), bar(NEXT_WEEK, 2, 3, 2, 3, 1)]
+    assert _merge_bars(bars) == bars
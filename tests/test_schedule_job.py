@@ -0,0 +1,26 @@
+import asyncio
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete
+
+from app.db.cruds import import_job as job_crud
+from app.db.models import ImportJob
+
+pytestmark = [pytest.mark.db, pytest.mark.anyio]
+
+
+@pytest.fixture
+async def kind(database):
+    # свой kind: задачи воркеров этой базы не мешают проверке
+    kind = f'test-{uuid4()}'
+    yield kind
+    async with database.begin() as conn:
+        await conn.execute(delete(ImportJob).where(ImportJob.kind == kind))
+
+
+async def test_schedulers_of_all_workers_queue_one_job(kind):
+    jobs = await asyncio.gather(*[job_crud.schedule_job(kind, {}, timedelta(hours=1)) for _ in range(8)])
+    assert len([job for job in jobs if job is not None]) == 1
+    assert await job_crud.schedule_job(kind, {}, timedelta(hours=1)) is None
@@ -0,0 +1,119 @@
+import csv
+import io
+import os
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.config import COLUMNS, MAX_DATA
+from app.dto.book import ConflictMode, UploadEngine
+from app.handlers import book as book_handlers
+from app.handlers.book import check_file
+from app.handlers.columnar import EXCEL_ENGINE, read_frame, validate_frame
+from app.handlers.upload import open_rows, read_header, validate_rows
+
+HEADER = list(COLUMNS)
+
+
+def row(title='Book', year=2000, genre='fiction,poetry', author='Author', description=None, cover=None, price=100):
+    values = {'title': title, 'publication_year': year, 'genre': genre, 'author': author,
+              'description': description, 'cover_image': cover, 'price': price}
+    return [values[column] for column in HEADER]
+
+
+ROWS = [
+    row(),
+    row(year='2000'),
+    row(year='2000.0'),
+    row(year=' 2000'),
+    row(year=2000.0),
+    row(year=MAX_DATA + 1),
+    row(year=299),
+    row(year='abc'),
+    row(price=None),
+    row(price='15'),
+    row(price=-1),
+    row(price=10 ** 16),
+    row(title=None),
+    row(title=123),
+    row(genre=None),
+    row(author=5),
+    [None] * len(HEADER),
+    row(title='Последняя', description='описание', cover='https://example.com/c.jpg'),
+]
+
+
+def split_repeats(books):
+    """books of row by row path without repeated titles and the repeats, as columnar path returns them"""
+    titles = set()
+    unique, repeated = [], []
+    for book in books:
+        (repeated if book['title'] in titles else unique).append(book)
+        titles.add(book['title'])
+    return unique, repeated
+
+
+def test_columnar_and_row_validation_agree():
+    valid, invalid = validate_rows(HEADER, ROWS)
+    frame_valid, frame_invalid, frame_repeated = validate_frame(HEADER, pd.DataFrame(ROWS, dtype=object))
+    assert (frame_valid, frame_repeated) == split_repeats(valid)
+    assert [book.model_dump() for book in frame_invalid] == [book.model_dump() for book in invalid]
+    assert len(valid) + len(invalid) == len(ROWS) - 1
+
+
+def test_csv_strings_agree():
+    rows = [[None if value is None else str(value) for value in values] for values in ROWS]
+    valid, invalid = validate_rows(HEADER, rows)
+    frame_valid, frame_invalid, frame_repeated = validate_frame(HEADER, pd.DataFrame(rows, dtype=object))
+    assert (frame_valid, frame_repeated) == split_repeats(valid)
+    assert [book.model_dump() for book in frame_invalid] == [book.model_dump() for book in invalid]
+
+
+def test_csv_file_read_by_arrow_agrees():
+    rows = [row(title=f'Book {i}', year=year, price=price) for i, (year, price) in enumerate(
+        [(2000, 1), ('02000', 1), ('-5', 1), ('2000.0', 1), (2000, ''), (2000, '+3'), (2000, '0'), (2000, 10 ** 15)])]
+    rows += [row(title='Book 0', price=7), row(title='Book 3', year=2001), row(title='Книга', genre='a,,b')]
+    content = io.StringIO()
+    csv.writer(content).writerows([HEADER, *rows])
+    data = content.getvalue().encode('utf-8-sig')
+
+    lines = open_rows(UploadFile(file=io.BytesIO(data), filename='books.csv'))
+    valid, invalid = validate_rows(read_header(lines), list(lines))
+    frame_header, frame = read_frame(UploadFile(file=io.BytesIO(data), filename='books.csv'))
+    frame_valid, frame_invalid, frame_repeated = validate_frame(frame_header, frame)
+    assert (frame_valid, frame_repeated) == split_repeats(valid)
+    assert [book.model_dump() for book in frame_invalid] == [book.model_dump() for book in invalid]
+    assert [book['title'] for book in frame_repeated] == ['Book 0', 'Book 3']
+
+
+def test_xlsx_by_calamine_as_by_openpyxl():
+    path = os.path.join(os.path.dirname(__file__), os.pardir, 'test_and_example.xlsx')
+    with open(path, 'rb') as file:
+        rows = open_rows(UploadFile(file=file, filename='books.xlsx'))
+        header = read_header(rows)
+        valid, invalid = validate_rows(header, list(rows))
+    with open(path, 'rb') as file:
+        frame_header, frame = read_frame(UploadFile(file=file, filename='books.xlsx'))
+        frame_valid, frame_invalid, frame_repeated = validate_frame(frame_header, frame)
+    assert EXCEL_ENGINE == 'calamine'
+    assert frame_header == header
+    assert (frame_valid, frame_repeated) == split_repeats(valid) and len(frame_invalid) == len(invalid)
+
+
+@pytest.mark.anyio
+async def test_columnar_engine_is_off_by_default():
+    with pytest.raises(HTTPException) as error:
+        await check_file(UploadFile(file=io.BytesIO(b''), filename='books.csv'), engine=UploadEngine.pandas)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('engine', list(UploadEngine))
+async def test_repeated_column_is_rejected_by_both_engines(engine, monkeypatch):
+    monkeypatch.setattr(book_handlers, 'UPLOAD_COLUMNAR_ENABLED', True)
+    content = io.StringIO()
+    csv.writer(content).writerows([HEADER + ['title'], row() + ['Other']])
+    response = await check_file(UploadFile(file=io.BytesIO(content.getvalue().encode()), filename='books.csv'),
+                                on_conflict=ConflictMode.report, engine=engine)
+    assert response.status_code == 400